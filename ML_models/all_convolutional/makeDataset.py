@@ -5,29 +5,136 @@
 
 import os
 import sys
+import json
 import random
 import tensorflow as tf
 import numpy as np
 import random
 
+from utilities.packing import parse_tensor, parse_mask
+from utilities.chunks import read_chunked
+from utilities.pyramid import (
+    grid_shape,
+    grid_factor,
+    level_name,
+    downsample,
+    region_indices,
+    region_shape,
+    crop_region,
+)
+from normalize.ERA5.normalize_tf import fitted_parameters, normalize_tensor, file_month
 
-# Load a pre-standardised tensor from a list of files
-def load_tensor(file_names):
-    sict = tf.io.read_file(file_names[0])
-    imt = tf.io.parse_tensor(sict, np.float32)
-    ima = tf.reshape(imt, [721, 1440, 1])
-    for fni in range(1, len(file_names)):
-        sict = tf.io.read_file(file_names[fni])
-        imt = tf.io.parse_tensor(sict, np.float32)
-        imt = tf.reshape(imt, [721, 1440, 1])
-        ima = tf.concat([ima, imt], 2)
-    return ima
+
+# Shape (lat, lon) of the fields for a specification - the whole grid at the
+#  model resolution, or just the region, if there is one.
+def getFieldShape(specification):
+    if specification["region"] is None:
+        return grid_shape(specification["resolution"])
+    return region_shape(specification["region"], specification["resolution"])
+
+
+# Cut the specified region (if any) out of a field [lat, lon, ...]
+def cropField(field, specification):
+    if specification["region"] is None:
+        return field
+    return crop_region(field, specification["region"], specification["resolution"])
+
+
+# Cut a random patch (patchSize) out of each field in a dataset element
+#  (metadata, input, target, weights, ...) - the same patch from each.
+# For global fields, longitude wraps round, so patches can cross the date-line.
+def samplePatch(specification, x):
+    nRows, nCols = specification["patchSize"]
+    fRows, fCols = getFieldShape(specification)
+    row = tf.random.uniform([], 0, fRows - nRows + 1, dtype=tf.int32)
+    if specification["region"] is None:
+        col = tf.random.uniform([], 0, fCols, dtype=tf.int32)
+    else:
+        col = tf.random.uniform([], 0, fCols - nCols + 1, dtype=tf.int32)
+    columns = (col + tf.range(nCols)) % fCols
+    return (x[0],) + tuple(
+        tf.gather(field[row : row + nRows], columns, axis=1) for field in x[1:]
+    )
+
+
+# Read the packed validity masks for a list of files
+# (kept packed, so they are small in the cache - unpacked by unpack_masks)
+def read_masks(mask_names):
+    return tf.stack(
+        [tf.io.read_file(mask_names[fni]) for fni in range(len(mask_names))]
+    )
+
+
+# Unpack a set of validity masks to float32 weights (1=valid, 0=missing)
+def unpack_masks(packed, shape=(721, 1440)):
+    return tf.stack(
+        [parse_mask(packed[fni], shape) for fni in range(len(packed))],
+        axis=2,
+    )
+
+
+# Find the validity mask file for each data file
+# Masks are in a parallel directory ('<source>_mask') - one file for each month
+#  with its own mask, and 'static.tfd' for all the others. Its index
+#  (months.json) says which each month uses.
+# Returns None if any of the files has no mask store. A month missing from
+#  an index is an error - the store is out of date (run make_validity_masks.py).
+def getMaskFileNames(fileNames):
+    indices = {}
+    result = []
+    for fNames in fileNames:
+        mNames = []
+        for fN in fNames:
+            mdir = "%s_mask" % os.path.dirname(fN)
+            if mdir not in indices:
+                if not os.path.isdir(mdir):
+                    return None
+                try:
+                    with open("%s/months.json" % mdir, "r") as f:
+                        indices[mdir] = json.load(f)["months"]
+                except FileNotFoundError:
+                    raise ValueError(
+                        "Mask store %s has no index - remake it with make_validity_masks.py"
+                        % mdir
+                    )
+            entry = indices[mdir].get(os.path.basename(fN))
+            if entry is None:
+                raise ValueError(
+                    "No validity mask for %s in %s - update it with make_validity_masks.py"
+                    % (os.path.basename(fN), mdir)
+                )
+            mNames.append("%s/%s" % (mdir, entry["file"]))
+        result.append(mNames)
+    return result
+
+
+# Directory containing the tensors for a source
+# Sources are named by their normalized dataset (e.g. 'ERA5_tf_MM/2m_temperature');
+#  if raw is True, use the raw tensors for the same variable instead.
+# Lower resolutions are in their own datasets (see utilities/pyramid.py) - but
+#  there is only one raw dataset (at full resolution).
+# Chunked stores (see utilities/chunks.py) are also in their own datasets.
+def getDataDir(source, raw=False, resolution=0.25, chunked=False):
+    if raw:
+        return "%s/MLP/raw_datasets/%s/%s" % (
+            os.getenv("SCRATCH"),
+            "ERA5_chunked" if chunked else "ERA5",
+            os.path.basename(source),
+        )
+    dataset = level_name(os.path.dirname(source), resolution)
+    if chunked:
+        dataset += "_chunked"
+    return "%s/MLP/normalized_datasets/%s/%s" % (
+        os.getenv("SCRATCH"),
+        dataset,
+        os.path.basename(source),
+    )
 
 
 # Find out how many tensors available for each month from a source
-def getDataAvailability(source):
-    dir = "%s/MLP/normalized_datasets/%s" % (os.getenv("SCRATCH"), source)
-    aFiles = os.listdir(dir)
+def getDataAvailability(source, raw=False, resolution=0.25, chunked=False):
+    dir = getDataDir(source, raw, resolution, chunked)
+    aFiles = [fN for fN in os.listdir(dir) if not fN.endswith(".tmp")]
     firstYr = 3000
     lastYr = 0
     maxCount = 0
@@ -48,8 +155,13 @@ def getDataAvailability(source):
     return (firstYr, lastYr, maxCount, filesYM)
 
 
-# Make a set of input filenames
-def getFileNames(
+# Catalogue of the months available from a set of sources
+# Returns a dictionary, with a key for each month ('YYYYMM', in time order),
+#  and, for each month, a list (one entry per source) of the available files
+#  (more than one if the source has multiple ensemble members).
+# Months are split into test and training sets here - before any ensemble
+#  combinations are drawn, so a month is never in both.
+def getFileCatalog(
     sources,
     purpose,
     firstYr,
@@ -57,49 +169,31 @@ def getFileNames(
     testSplit,
     maxTrainingMonths,
     maxTestMonths,
-    correlatedEnsembles,
-    maxEnsembleCombinations,
+    raw=False,
+    resolution=0.25,
+    chunked=False,
 ):
     avail = {}
-    maxCount = 1
     for source in sources:
-        avail[source] = getDataAvailability(source)
+        if source in avail:
+            continue
+        avail[source] = getDataAvailability(source, raw, resolution, chunked)
         if firstYr is None or avail[source][0] > firstYr:
             firstYr = avail[source][0]
         if lastYr is None or avail[source][1] < lastYr:
             lastYr = avail[source][1]
-        if correlatedEnsembles:
-            maxCount = avail[source][2]  # always the same
-        else:
-            maxCount *= avail[source][2]
 
-    # Make file name lists for available months - repeating if there are multiple ensemble members
+    # Months available from all the sources
     aMonths = []
-    fNames = {}
-    for rep in range(min(maxCount, maxEnsembleCombinations)):
-        for year in range(firstYr, lastYr + 1):
-            for month in range(1, 13):
-                mnth = "%04d%02d" % (year, month)
-                smnth = []
-                bad = False
-                for source in sources:
-                    if mnth in avail[source][3]:
-                        if correlatedEnsembles:
-                            smnth.append(avail[source][3][mnth][rep])
-                        else:
-                            smnth.append(random.sample(avail[source][3][mnth], 1)[0])
-                    else:
-                        bad = True
-                        break
-                if bad:
-                    continue
-                mnth += "%05d" % rep
+    for year in range(firstYr, lastYr + 1):
+        for month in range(1, 13):
+            mnth = "%04d%02d" % (year, month)
+            if all(mnth in avail[source][3] for source in sources):
                 aMonths.append(mnth)
-                fNames[mnth] = smnth
 
     # Test/Train split
     if purpose is not None:
-        test_ns = list(range(0, len(aMonths), testSplit))
+        test_ns = set(range(0, len(aMonths), testSplit))
         if purpose == "Train":
             aMonths = [aMonths[x] for x in range(len(aMonths)) if x not in test_ns]
         elif purpose == "Test":
@@ -107,8 +201,6 @@ def getFileNames(
         else:
             raise Exception("Unsupported purpose " + purpose)
 
-    aMonths.sort()  # Months in time order (validation plots)
-
     # Limit maximum data size
     if purpose == "Train" and maxTrainingMonths is not None:
         if len(aMonths) >= maxTrainingMonths:
@@ -126,66 +218,381 @@ def getFileNames(
                 "Only %d months available, can't provide %d"
                 % (len(aMonths), maxTestMonths)
             )
-    # Return a list of lists of filenames
-    result = []
-    for key in aMonths:
-        result.append(fNames[key])
-    return result
 
+    catalog = {}
+    for mnth in aMonths:
+        catalog[mnth] = [sorted(avail[source][3][mnth]) for source in sources]
+    return catalog
 
-# Get a dataset
-def getDataset(specification, purpose):
-    # Get a list of filename sets
-    inFiles = getFileNames(
-        specification["inputTensors"],
+
+# How many ensemble combinations to use for a month, from its catalogue entry
+# With correlated ensembles, member n of each source goes with member n of
+#  all the others, otherwise any member can go with any other.
+def getCombinationCount(files, correlatedEnsembles, maxEnsembleCombinations):
+    if correlatedEnsembles:
+        count = min(len(members) for members in files)
+    else:
+        count = 1
+        for members in files:
+            count *= len(members)
+    return min(count, maxEnsembleCombinations)
+
+
+# Make a set of input filenames - one list (one file per source) for each
+#  ensemble combination of each month in a catalogue (from getFileCatalog).
+# A generator - combinations are drawn as they are needed, and a new set each
+#  time it is run, so used with tf.data.Dataset.from_generator, each epoch
+#  gets fresh combinations.
+def getFileNames(catalog, correlatedEnsembles, maxEnsembleCombinations):
+    for files in catalog.values():
+        count = getCombinationCount(files, correlatedEnsembles, maxEnsembleCombinations)
+        if correlatedEnsembles:
+            nMembers = min(len(members) for members in files)
+            for member in sorted(random.sample(range(nMembers), count)):
+                yield [members[member] for members in files]
+        else:
+            for rep in range(count):
+                yield [random.choice(members) for members in files]
+
+
+# All the files of the first input source in a catalogue, in order
+def getCatalogPaths(catalog):
+    return sorted(set(fN for files in catalog.values() for fN in files[0]))
+
+
+# Integer metadata for a set of input filenames (from getFileNames or
+#  sampleFileNames): (year, month, ensemble member, source id) - where the
+#  member is the position of the first input file among the files for its
+#  month, and the source id is its position in the path table
+#  (pathIndex maps file names to positions in getCatalogPaths).
+def getMetadata(catalog, pathIndex, names):
+    base = os.path.basename(names[0])
+    year = int(base[:4])
+    month = int(base[5:7])
+    member = catalog["%04d%02d" % (year, month)][0].index(names[0])
+    return [year, month, member, pathIndex[names[0]]]
+
+
+# Ensemble member (or other source label) of a file - the part of the file
+#  name after the date ('' if there is only one file for each month)
+#  e.g. '.../2000-01_03.tfd' -> '_03'
+def getSourceTag(fileName):
+    return os.path.splitext(os.path.basename(fileName))[0][7:]
+
+
+# Sampling weight for a month ('YYYYMM') - the product of its season (calendar
+#  month) and decade weights (1 if not given)
+def getMonthWeight(weights, mnth):
+    year = int(mnth[:4])
+    month = int(mnth[4:6])
+    return (weights.get("season") or {}).get(month, 1.0) * (
+        weights.get("decade") or {}
+    ).get(year - year % 10, 1.0)
+
+
+# Sampling weight for a file, from its source tag
+def getSourceWeight(weights, fileName):
+    return (weights.get("source") or {}).get(getSourceTag(fileName), 1.0)
+
+
+# Make a random sample of input filenames - nSamples months, drawn from a
+#  catalogue (with replacement) in proportion to their weights (see
+#  getMonthWeight), and an ensemble combination for each, drawn in proportion
+#  to the source weights.
+# A generator, like getFileNames - a new sample each epoch.
+def sampleFileNames(catalog, correlatedEnsembles, nSamples, weights=None):
+    weights = weights or {}
+    months = list(catalog.keys())
+    monthWeights = [getMonthWeight(weights, mnth) for mnth in months]
+    for mnth in random.choices(months, weights=monthWeights, k=nSamples):
+        files = catalog[mnth]
+        if correlatedEnsembles:
+            nMembers = min(len(members) for members in files)
+            member = random.choices(
+                range(nMembers),
+                weights=[getSourceWeight(weights, fN) for fN in files[0][:nMembers]],
+            )[0]
+            yield [members[member] for members in files]
+        else:
+            yield [
+                random.choices(
+                    members, weights=[getSourceWeight(weights, fN) for fN in members]
+                )[0]
+                for members in files
+            ]
+
+
+# Catalogue of the months for a specification - for both inputs and outputs,
+#  so each input comes with the output for the same month (and ensemble
+#  member, if correlated).
+def getSpecificationCatalog(specification, purpose):
+    sources = list(specification["inputTensors"]) + list(
+        specification["outputTensors"] or ()
+    )
+    return getFileCatalog(
+        sources,
         purpose,
         specification["startYear"],
         specification["endYear"],
         specification["testSplit"],
         specification["maxTrainingMonths"],
         specification["maxTestMonths"],
-        specification["correlatedEnsembles"],
-        specification["maxEnsembleCombinations"],
+        specification["normalizeOnTheFly"],
+        specification["resolution"],
+        specification["chunked"],
     )
 
-    # Create TensorFlow Dataset object from the source file names
-    tnIData = tf.data.Dataset.from_tensor_slices(tf.constant(inFiles))
-
-    # Create Dataset from the source file contents
-    tsIData = tnIData.map(load_tensor, num_parallel_calls=tf.data.experimental.AUTOTUNE)
-
-    if (
-        specification["outputTensors"] is not None
-    ):  # I.e. input and output are not the same
-        outFiles = getFileNames(
-            specification["outputTensors"],
-            purpose,
-            specification["startYear"],
-            specification["endyear"],
-            specification["testSplit"],
-            specification["maxTrainingMonths"],
-            specification["maxTestMonths"],
+
+# Path lookup table for a dataset - the input file for each source id in the
+#  dataset metadata is getPathTable(specification, purpose)[id]
+def getPathTable(specification, purpose):
+    return getCatalogPaths(getSpecificationCatalog(specification, purpose))
+
+
+# Get a dataset
+# If the specification has a patchSize, each month is cut into random patches
+#  (see samplePatch), unless patches is False (validation of whole fields).
+# If sampled is True, and the specification has an nMonthsInEpoch, each pass
+#  through the dataset is a weighted random sample of that many months (see
+#  sampleFileNames) - otherwise it is all the months.
+# With an inputContext (tf.distribute.InputContext - multi-worker training),
+#  the dataset is this worker's share of the months: all workers get the
+#  same number, so up to one month per worker may be left out of each pass.
+def getDataset(specification, purpose, patches=True, sampled=False, inputContext=None):
+    inputTensors = list(specification["inputTensors"])
+    outputTensors = list(specification["outputTensors"] or ())
+    sources = inputTensors + outputTensors
+    nIn = len(inputTensors)
+    catalog = getSpecificationCatalog(specification, purpose)
+
+    # With a region, full resolution fields are cut down as they are read - and
+    #  chunked stores only read the latitude bands needed. Lower resolutions
+    #  are read in full, and cropped afterwards.
+    raw = specification["normalizeOnTheFly"]
+    resolution = specification["resolution"]
+    chunked = specification["chunked"]
+    if chunked and (
+        grid_factor(resolution) != 1
+        or (not raw and specification["tensorFormat"] != "float32")
+    ):
+        raise ValueError("Chunked stores are only float32, at full resolution")
+    windowed = specification["region"] is not None and grid_factor(resolution) == 1
+    if windowed:
+        first_row, last_row, columns = region_indices(specification["region"])
+    else:
+        first_row, last_row, columns = (0, 721, None)
+
+    # Read one field [lat, lon] (full resolution, or the window)
+    def readField(file_name):
+        if chunked:
+            field = read_chunked(file_name, first_row, last_row)[:, :, 0]
+        elif raw:
+            field = tf.io.parse_tensor(tf.io.read_file(file_name), tf.float32)
+            field = tf.reshape(field, [721, 1440])[first_row:last_row]
+        else:
+            field = parse_tensor(
+                tf.io.read_file(file_name), specification["tensorFormat"]
+            )
+            field = tf.reshape(field, grid_shape(resolution))[first_row:last_row]
+        if windowed:
+            field = tf.gather(field, columns, axis=1)
+        return field
+
+    # Normalization parameters, for normalizing raw tensors as they are read
+    #  (loaded once, here, and kept in memory - cut down to the window).
+    parameters = {}
+    if raw:
+        for source in set(specification["inputTensors"]) | set(
+            specification["outputTensors"] or ()
+        ):
+            pmt = fitted_parameters(os.path.basename(source))[:, first_row:last_row]
+            if windowed:
+                pmt = tf.gather(pmt, columns, axis=2)
+            parameters[source] = pmt
+
+    # Either read normalized tensors, or read raw tensors and normalize them.
+    # Raw tensors are full resolution, so reduce them to the model resolution.
+    def loader(file_names, sources):
+        fields = []
+        for fni, source in enumerate(sources):
+            field = readField(file_names[fni])
+            if raw:
+                field = normalize_tensor(
+                    field,
+                    tf.gather(parameters[source], file_month(file_names[fni]) - 1),
+                )
+            fields.append(field)
+        ima = tf.stack(fields, axis=2)
+        if raw and grid_factor(resolution) != 1:
+            ima = downsample(ima, tf.where(ima != 0.0, 1.0, 0.0), resolution)[0]
+        if not windowed:
+            ima = cropField(ima, specification)
+        return ima
+
+    # Validity masks for the outputs - from the mask store if there is one
+    # Looked up from the output file names, so they work with any combination.
+    outIndices = range(nIn, len(sources)) if outputTensors else range(nIn)
+    outFiles = sorted(
+        set(f for files in catalog.values() for si in outIndices for f in files[si])
+    )
+    maskFiles = getMaskFileNames([outFiles])
+    if maskFiles is not None:
+        maskTable = tf.lookup.StaticHashTable(
+            tf.lookup.KeyValueTensorInitializer(
+                tf.constant(outFiles), tf.constant(maskFiles[0])
+            ),
+            default_value="",
+        )
+
+    # Create TensorFlow Dataset object from the source file names - drawing
+    #  the ensemble combinations afresh each epoch.
+    sampled = sampled and specification["nMonthsInEpoch"] is not None
+    if sampled:
+        fileNames = lambda: sampleFileNames(
+            catalog,
+            specification["correlatedEnsembles"],
+            specification["nMonthsInEpoch"],
+            specification["epochWeights"],
+        )
+    else:
+        fileNames = lambda: getFileNames(
+            catalog,
             specification["correlatedEnsembles"],
             specification["maxEnsembleCombinations"],
         )
-        tnOData = tf.data.Dataset.from_tensor_slices(tf.constant(outFiles))
-        tsOData = tnOData.map(
-            load_tensor, num_parallel_calls=tf.data.experimental.AUTOTUNE
+    # Each set of file names comes with its integer metadata (see getMetadata)
+    pathIndex = {fN: i for i, fN in enumerate(getCatalogPaths(catalog))}
+    tnData = tf.data.Dataset.from_generator(
+        lambda: (
+            (names, getMetadata(catalog, pathIndex, names)) for names in fileNames()
+        ),
+        output_signature=(
+            tf.TensorSpec(shape=[len(sources)], dtype=tf.string),
+            tf.TensorSpec(shape=[4], dtype=tf.int32),
+        ),
+    )
+
+    # Multi-worker - keep every n'th month, before any files are read. The
+    #  month order is the same on every worker (for sampled epochs, each
+    #  worker draws its own sample, and keeps its share of it).
+    if inputContext is not None and inputContext.num_input_pipelines > 1:
+        nShares = inputContext.num_input_pipelines
+        if sampled:
+            nMonths = specification["nMonthsInEpoch"]
+        else:
+            nMonths = sum(
+                getCombinationCount(
+                    files,
+                    specification["correlatedEnsembles"],
+                    specification["maxEnsembleCombinations"],
+                )
+                for files in catalog.values()
+            )
+        tnData = tnData.take(nMonths // nShares * nShares).shard(
+            nShares, inputContext.input_pipeline_id
         )
 
-    # Zip the data together with the filenames (so we can find the date and source of each
-    #   data tensor if we need it).
-    if specification["outputTensors"] is not None:
-        tz_data = tf.data.Dataset.zip((tnIData, tsIData, tsOData))
-    else:
-        tz_data = tf.data.Dataset.zip((tnIData, tsIData))
+    # Create Dataset from the source file contents, and zip the data together
+    #  with the metadata (so we can find the date and source of each data
+    #  tensor if we need it). The file names themselves stay in the pipeline.
+    def loadFiles(names, metadata):
+        x = (metadata, loader(names[:nIn], inputTensors))
+        if outputTensors:  # I.e. input and output are not the same
+            x += (loader(names[nIn:], outputTensors),)
+        if maskFiles is not None:
+            x = (x, read_masks(maskTable.lookup(tf.gather(names, list(outIndices)))))
+        return x
+
+    tz_data = tnData.map(
+        loadFiles,
+        num_parallel_calls=tf.data.experimental.AUTOTUNE,
+    )
 
     # Optimisation
-    if (purpose == "Train" and specification["trainCache"]) or (
-        purpose == "Test" and specification["testCache"]
+    # Not if any month has more than one ensemble combination, or if sampling
+    #  - the cache would keep the first epoch's data for all the others.
+    ensembles = any(
+        getCombinationCount(
+            files,
+            specification["correlatedEnsembles"],
+            specification["maxEnsembleCombinations"],
+        )
+        > 1
+        for files in catalog.values()
+    )
+    if not (ensembles or sampled) and (
+        (purpose == "Train" and specification["trainCache"])
+        or (purpose == "Test" and specification["testCache"])
     ):
         tz_data = tz_data.cache()  # Great, iff you have enough RAM for it
 
+    # Standard output structure: (metadata, input, target, weights)
+    #  where weights are 1 for valid target data and 0 for missing data.
+    # If there is a training mask, it goes with each element as a fifth
+    #  component - so the training step can apply it (see maskBatch) without
+    #  any separate operations on the batch.
+    # Done after the cache, in parallel, so the masks are small in the cache,
+    #  and not recalculated in the training loop.
+    trainingMask = specification.get("trainingMask")
+    if trainingMask is not None:
+        trainingMask = tf.cast(trainingMask, tf.float32)
+
+    def standardize(x, weights):
+        if trainingMask is not None:
+            return (x[0], x[1], x[-1], weights, trainingMask)
+        return (x[0], x[1], x[-1], weights)
+
+    if maskFiles is not None:
+        tz_data = tz_data.map(
+            lambda x, m: standardize(
+                x,
+                cropField(
+                    unpack_masks(m, grid_shape(specification["resolution"])),
+                    specification,
+                ),
+            ),
+            num_parallel_calls=tf.data.experimental.AUTOTUNE,
+        )
+    else:  # No mask store - missing data is marked by 0.0
+        tz_data = tz_data.map(
+            lambda *x: standardize(x, tf.where(x[-1] != 0.0, 1.0, 0.0)),
+            num_parallel_calls=tf.data.experimental.AUTOTUNE,
+        )
+
+    # Patch training - patchesPerMonth random patches from each month.
+    # Done after the cache, so each epoch gets a fresh set of patches.
+    # The training mask is cut up with the data.
+    if patches and specification["patchSize"] is not None:
+        fieldShape = getFieldShape(specification)
+        if (
+            specification["patchSize"][0] > fieldShape[0]
+            or specification["patchSize"][1] > fieldShape[1]
+        ):
+            raise ValueError(
+                "Patch size %s is larger than the field %s"
+                % (specification["patchSize"], fieldShape)
+            )
+        tz_data = tz_data.flat_map(
+            lambda *x: tf.data.Dataset.from_tensors(x).repeat(
+                specification["patchesPerMonth"]
+            )
+        )
+        tz_data = tz_data.map(
+            lambda *x: samplePatch(specification, x),
+            num_parallel_calls=tf.data.experimental.AUTOTUNE,
+        )
+
     tz_data = tz_data.prefetch(tf.data.experimental.AUTOTUNE)
 
     return tz_data
+
+
+# Restrict a batch to the region where mask is non-zero
+# The target outside the region is given zero weight, and, if the input is the
+#  same field as the target, the input is zeroed outside the region too.
+def maskBatch(specification, batch, mask):
+    mask = tf.cast(mask, tf.float32)
+    input = batch[1]
+    if specification["outputTensors"] is None:
+        input = tf.where(mask != 0, input, 0.0)
+    return (batch[0], input, batch[2], batch[3] * mask)
@@ -11,6 +11,7 @@
 import os
 import sys
 import time
+import shutil
 import tensorflow as tf
 
 import argparse
@@ -25,25 +26,33 @@ args = parser.parse_args()
 from specify import specification
 from ML_models.train_to_distribution.makeDataset import getDataset
 from ML_models.train_to_distribution.autoencoderModel import DCVAE, getModel
+from utilities.distribute import is_chief, worker_dir
+
+
+# Make a distributed dataset - each worker makes its own share of the months
+#  (see getDataset), in batches of its share of batchSize.
+def distributeDataset(purpose, sampled=False, shuffle=True):
+    def datasetFn(inputContext):
+        data = getDataset(
+            specification, purpose=purpose, sampled=sampled, inputContext=inputContext
+        )
+        if shuffle:
+            data = data.shuffle(specification["shuffleBufferSize"])
+        return data.batch(
+            inputContext.get_per_replica_batch_size(specification["batchSize"])
+        )
+
+    return specification["strategy"].distribute_datasets_from_function(datasetFn)
 
 
 # Get Datasets
 def getDatasets():
     # Set up the training data
-    trainingData = getDataset(specification, purpose="Train").repeat(5)
-    trainingData = trainingData.shuffle(specification["shuffleBufferSize"]).batch(
-        specification["batchSize"]
-    )
-    trainingData = specification["strategy"].experimental_distribute_dataset(
-        trainingData
-    )
+    # (each epoch is nMonthsInEpoch months, or all the data once)
+    trainingData = distributeDataset("Train", sampled=True)
 
     # Set up the test data
-    testData = getDataset(specification, purpose="Test")
-    testData = testData.shuffle(specification["shuffleBufferSize"]).batch(
-        specification["batchSize"]
-    )
-    testData = specification["strategy"].experimental_distribute_dataset(testData)
+    testData = distributeDataset("Test")
 
     return (trainingData, testData)
 
@@ -60,15 +69,17 @@ with specification["strategy"].scope():
         os.getenv("SCRATCH"),
         specification["modelName"],
     )
-    if not os.path.isdir(os.path.dirname(log_FN)):
-        os.makedirs(os.path.dirname(log_FN))
-    logfile_writer = tf.summary.create_file_writer(log_FN)
-    with logfile_writer.as_default():
-        tf.summary.write(
-            "OutputNames",
-            specification["outputNames"],
-            step=0,
-        )
+    # Only the chief writes the log, and reports progress
+    chief = is_chief()
+    if chief:
+        os.makedirs(os.path.dirname(log_FN), exist_ok=True)
+        logfile_writer = tf.summary.create_file_writer(log_FN)
+        with logfile_writer.as_default():
+            tf.summary.write(
+                "OutputNames",
+                specification["outputNames"],
+                step=0,
+            )
 
     # For each Epoch: train, save state, and report progress
     for epoch in range(args.epoch, specification["nEpochs"] + 1):
@@ -95,9 +106,14 @@ with specification["strategy"].scope():
             specification["modelName"],
             epoch,
         )
+        # (all workers must save - the others to a scratch directory)
+        save_dir = worker_dir(save_dir)
         if not os.path.isdir(save_dir):
             os.makedirs(save_dir)
         autoencoder.save_weights("%s/ckpt" % save_dir)
+        if not chief:
+            shutil.rmtree(save_dir)
+            continue
 
         # Update the log file with current metrics
         autoencoder.updateLogfile(logfile_writer, epoch)
@@ -6,18 +6,80 @@
 import os
 import tensorflow as tf
 
+from ML_models.base_model.makeDataset import getFieldShape
+
+
+# Canvas for a field shape (lat, lon) - rounded up to a multiple of
+#  2**nLayers, so each stride-2 layer exactly halves it, and each transpose
+#  layer exactly doubles it (no output padding needed).
+def canvasShape(shape, nLayers):
+    step = 2**nLayers
+    return tuple(-(-size // step) * step for size in shape)
+
+
+# Pad a batch of fields [batch, lat, lon, channels] out to a canvas
+# Latitude is padded with zeros (missing data), split between the two edges.
+#  Longitude is split the same way - padded circularly (with the columns from
+#  the other side) if wrap is True (global fields), otherwise with zeros.
+def padToCanvas(field, canvas, wrap=False):
+    nLat, nLon = field.shape[1:3]
+    top = (canvas[0] - nLat) // 2
+    left = (canvas[1] - nLon) // 2
+    right = canvas[1] - nLon - left
+    if wrap:
+        field = tf.concat(
+            [field[:, :, nLon - left :], field, field[:, :, :right]], axis=2
+        )
+        left = right = 0
+    return tf.pad(field, [[0, 0], [top, canvas[0] - nLat - top], [left, right], [0, 0]])
+
+
+# Cut a batch of fields back out of the canvas (undoes padToCanvas)
+def cropFromCanvas(field, shape):
+    top = (field.shape[1] - shape[0]) // 2
+    left = (field.shape[2] - shape[1]) // 2
+    return field[:, top : top + shape[0], left : left + shape[1]]
+
+
+# Run a batch through a sequence of layers
+# If recompute is True, the activations inside the sequence are not kept for
+#  the gradient calculation, but recalculated when needed (tf.recompute_grad)
+#  - less memory, more time.
+def runLayers(layers, x, training=False, recompute=False):
+    def run(x):
+        for layer in layers:
+            x = layer(x, training=training)
+        return x
+
+    if recompute:
+        return tf.recompute_grad(run)(x)
+    return run(x)
+
 
 class DCVAE(tf.keras.Model):
     # Initialiser - set up instance and define the models
     def __init__(self, specification):
         super(DCVAE, self).__init__()
         self.specification = specification
+        # Mixed precision - layers compute in bfloat16 (or float16) but keep
+        #  float32 weights. Given to each layer, rather than set globally, so
+        #  models with different settings can be made in the same process.
+        policy = tf.keras.mixed_precision.Policy(
+            self.specification["mixedPrecision"] or "float32"
+        )
+        # The field shape depends on the resolution and region. Fields are
+        #  padded out to a canvas that halves exactly at each of the 5
+        #  stride-2 layers, and cropped again at the end.
+        self.fieldShape = getFieldShape(self.specification)
+        self.canvas = canvasShape(self.fieldShape, 5)
+        self.wrap = self.specification["region"] is None
+        latentShape = tuple(size // 2**5 for size in self.canvas)
 
         # Model to encode input to latent space distribution
         self.encoder = tf.keras.Sequential(
             [
                 tf.keras.layers.InputLayer(
-                    input_shape=(721, 1440, self.specification["nInputChannels"])
+                    input_shape=self.canvas + (self.specification["nInputChannels"],)
                 ),
                 tf.keras.layers.Conv2D(
                     filters=5 * 2,
@@ -25,6 +87,7 @@ class DCVAE(tf.keras.Model):
                     strides=(2, 2),
                     padding="same",
                     activation="elu",
+                    dtype=policy,
                 ),
                 tf.keras.layers.Conv2D(
                     filters=10 * 2,
@@ -32,6 +95,7 @@ class DCVAE(tf.keras.Model):
                     strides=(2, 2),
                     padding="same",
                     activation="elu",
+                    dtype=policy,
                 ),
                 tf.keras.layers.Conv2D(
                     filters=10 * 2,
@@ -39,6 +103,7 @@ class DCVAE(tf.keras.Model):
                     strides=(2, 2),
                     padding="same",
                     activation="elu",
+                    dtype=policy,
                 ),
                 tf.keras.layers.Conv2D(
                     filters=20 * 2,
@@ -46,6 +111,7 @@ class DCVAE(tf.keras.Model):
                     strides=(2, 2),
                     padding="same",
                     activation="elu",
+                    dtype=policy,
                 ),
                 tf.keras.layers.Conv2D(
                     filters=40 * 2,
@@ -53,8 +119,9 @@ class DCVAE(tf.keras.Model):
                     strides=(2, 2),
                     padding="same",
                     activation="elu",
+                    dtype=policy,
                 ),
-                tf.keras.layers.Flatten(),
+                tf.keras.layers.Flatten(dtype=policy),
                 # No activation
                 tf.keras.layers.Dense(
                     self.specification["latentDimension"] * 2,
@@ -64,6 +131,7 @@ class DCVAE(tf.keras.Model):
                     activity_regularizer=tf.keras.regularizers.L2(
                         self.specification["regularization"]["encoder_activity"]
                     ),
+                    dtype=policy,
                 ),
             ]
         )
@@ -75,7 +143,7 @@ class DCVAE(tf.keras.Model):
                     input_shape=(self.specification["latentDimension"],)
                 ),
                 tf.keras.layers.Dense(
-                    units=23 * 45 * 40 * 2,
+                    units=latentShape[0] * latentShape[1] * 40 * 2,
                     activation="elu",
                     kernel_regularizer=tf.keras.regularizers.L2(
                         self.specification["regularization"]["generator_kernel"]
@@ -83,50 +151,63 @@ class DCVAE(tf.keras.Model):
                     activity_regularizer=tf.keras.regularizers.L2(
                         self.specification["regularization"]["generator_activity"]
                     ),
+                    dtype=policy,
+                ),
+                tf.keras.layers.Reshape(
+                    target_shape=latentShape + (40 * 2,), dtype=policy
                 ),
-                tf.keras.layers.Reshape(target_shape=(23, 45, 40 * 2)),
                 tf.keras.layers.Conv2DTranspose(
                     filters=20 * 2,
                     kernel_size=3,
                     strides=2,
                     padding="same",
-                    output_padding=(1, 1),
                     activation="elu",
+                    dtype=policy,
                 ),
                 tf.keras.layers.Conv2DTranspose(
                     filters=10 * 2,
                     kernel_size=3,
                     strides=2,
                     padding="same",
-                    output_padding=(0, 1),
                     activation="elu",
+                    dtype=policy,
                 ),
                 tf.keras.layers.Conv2DTranspose(
                     filters=10 * 2,
                     kernel_size=3,
                     strides=2,
                     padding="same",
-                    output_padding=(0, 1),
                     activation="elu",
+                    dtype=policy,
                 ),
                 tf.keras.layers.Conv2DTranspose(
                     filters=5 * 2,
                     kernel_size=3,
                     strides=2,
                     padding="same",
-                    output_padding=(0, 1),
                     activation="elu",
+                    dtype=policy,
                 ),
                 tf.keras.layers.Conv2DTranspose(
                     filters=self.specification["nOutputChannels"],
                     kernel_size=3,
                     strides=2,
                     padding="same",
-                    output_padding=(0, 1),
+                    dtype=policy,
                 ),
             ]
         )
 
+        # The loss and gradient calculations are compiled - with XLA, if
+        #  jitCompile. (The weight update is not, so it works with any
+        #  distribution strategy.)
+        self.compute_loss = tf.function(
+            self.compute_loss, jit_compile=self.specification["jitCompile"]
+        )
+        self.compute_gradients = tf.function(
+            self.compute_gradients, jit_compile=self.specification["jitCompile"]
+        )
+
         # Metrics for training and test loss
         self.train_rmse = tf.Variable(
             tf.zeros([self.specification["nOutputChannels"]]), trainable=False
@@ -150,21 +231,40 @@ class DCVAE(tf.keras.Model):
     # Call the encoder model with a batch of input examples and return a batch of
     #  means and a batch of variances of the encoded latent space PDFs.
     def encode(self, x, training=False):
-        mean, logvar = tf.split(
-            self.encoder(x, training=training), num_or_size_splits=2, axis=1
-        )
-        return mean, logvar
+        x = padToCanvas(x, self.canvas, self.wrap)
+        # The first (full resolution) layers can be recomputed in the backward
+        #  pass, instead of storing their activations
+        nRecompute = self.specification["recomputeLayers"]
+        if nRecompute > 0:
+            x = runLayers(self.encoder.layers[:nRecompute], x, training, True)
+            x = runLayers(self.encoder.layers[nRecompute:], x, training)
+        else:
+            x = self.encoder(x, training=training)
+        mean, logvar = tf.split(x, num_or_size_splits=2, axis=1)
+        # Latent space (and everything after it in the loss) is float32
+        return tf.cast(mean, tf.float32), tf.cast(logvar, tf.float32)
 
     # Sample a batch of points in latent space from the encoded means and variances
-    def reparameterize(self, mean, logvar, training=False):
-        eps = tf.random.normal(shape=mean.shape)
+    # With a seed, the same seed gives the same sample (see compute_gradients)
+    def reparameterize(self, mean, logvar, training=False, seed=None):
+        if seed is None:
+            eps = tf.random.normal(shape=mean.shape)
+        else:
+            eps = tf.random.stateless_normal(shape=tf.shape(mean), seed=seed)
         return eps * tf.exp(logvar * 0.5) + mean
 
     # Call the generator model with a batch of points in latent space and return a
     #  batch of outputs
     def generate(self, z, training=False):
-        generated = self.generator(z, training=training)
-        return generated
+        # The last (full resolution) layers can be recomputed, as in encode
+        nRecompute = self.specification["recomputeLayers"]
+        if nRecompute > 0:
+            z = runLayers(self.generator.layers[:-nRecompute], z, training)
+            z = runLayers(self.generator.layers[-nRecompute:], z, training, True)
+            generated = tf.cast(z, tf.float32)
+        else:
+            generated = tf.cast(self.generator(z, training=training), tf.float32)
+        return cropFromCanvas(generated, self.fieldShape)
 
     # Run the full VAE - convert a batch of inputs to one of outputs
     def call(self, x, training=True):
@@ -183,10 +283,21 @@ class DCVAE(tf.keras.Model):
         )
 
     @tf.function
-    def fit_loss(self, generated, target, climatology):
+    def fit_loss(self, generated, target, climatology, weights, guess=None):
         # Metric is fractional variance reduction compared to climatology
-        weights = tf.where(target != 0.0, 1.0, 0.0)  # Missing data zero weighted
+        # Missing data is zero weighted (weights come from the dataset)
         # Keep the last dimension (different variables)
+        # For a micro-batch, guess is the (weighted) climatology error summed
+        #  over the whole batch - so the micro-batch losses add up to the
+        #  whole batch's.
+        if guess is not None:
+            return (
+                tf.reduce_sum(
+                    tf.math.squared_difference(generated, target) * weights,
+                    axis=[0, 1, 2],
+                )
+                / guess
+            )
         skill = tf.reduce_sum(
             tf.math.squared_difference(generated, target) * weights, axis=[0, 1, 2]
         ) / tf.reduce_sum(weights, axis=[0, 1, 2])
@@ -195,21 +306,35 @@ class DCVAE(tf.keras.Model):
         ) / tf.reduce_sum(weights, axis=[0, 1, 2])
         return skill / guess
 
+    # Fit of the generated fields to a normal distribution with their own
+    #  mean and spread
+    def spread_loss(self, generated, gMean, gStd):
+        return (
+            tf.reduce_mean(self.log_normal_pdf(generated, gMean, tf.math.log(gStd)))
+            * self.specification["gamma"]
+        )
+
     # Calculate the losses from autoencoding a batch of inputs
     # We are calculating a seperate loss for each variable, and for for the
     #  two components of the latent space KLD regularizer. This is useful
     #  for monitoring and debugging, but the weight update only depends
     #  on a single value (their sum).
-    @tf.function
-    def compute_loss(self, x, training):
+    # whole - for a micro-batch (see compute_gradients): its noise seed and
+    #  share of the batch, and the statistics of the whole batch the loss
+    #  depends on. The losses are then the micro-batch's share of the batch's.
+    def compute_loss(self, x, training, whole=None):
+        if whole is None:
+            whole = {"seed": None, "guess": None, "fraction": 1.0}
         mean, logvar = self.encode(x[1], training=training)
-        latent = self.reparameterize(mean, logvar, training=training)
+        latent = self.reparameterize(
+            mean, logvar, training=training, seed=whole["seed"]
+        )
         generated = self.generate(latent, training=training)
 
         gV = generated
         cV = gV * 0.0 + 0.5  # Climatology
-        tV = x[-1]
-        fit_metric = self.fit_loss(gV, tV, cV)
+        tV = x[2]
+        fit_metric = self.fit_loss(gV, tV, cV, x[3], whole["guess"])
 
         logpz = (
             tf.reduce_mean(self.log_normal_pdf(latent, 0.0, 0.0) * -1)
@@ -224,18 +349,34 @@ class DCVAE(tf.keras.Model):
             tf.reduce_mean(self.log_normal_pdf(generated, 0.5, -1.61) * -1)
             * self.specification["gamma"]
         )
-        logqz_g = (
-            tf.reduce_mean(
-                self.log_normal_pdf(
-                    generated,
-                    tf.reduce_mean(generated),
-                    tf.math.log(tf.math.reduce_std(generated)),
-                )
+        if "gMean" in whole:
+            logqz_g = self.spread_loss(generated, whole["gMean"], whole["gStd"])
+        else:
+            logqz_g = self.spread_loss(
+                generated, tf.reduce_mean(generated), tf.math.reduce_std(generated)
             )
-            * self.specification["gamma"]
-        )
 
-        regularization = tf.add_n(self.losses)
+        regularization = tf.add_n(
+            [tf.cast(loss, tf.float32) for loss in self.losses]
+        )  # (float32 even with mixed precision)
+
+        if whole["fraction"] != 1.0:
+            logpz_g, logqz_g, logpz, logqz_x, regularization = (
+                loss * whole["fraction"]
+                for loss in (logpz_g, logqz_g, logpz, logqz_x, regularization)
+            )
+        if "gMean" in whole:
+            # This micro-batch's part of the gradient through the batch mean
+            #  and spread (see compute_gradients) - adds nothing to the value
+            n = whole["count"]
+            total = tf.reduce_sum(generated)
+            squares = tf.reduce_sum((generated - whole["gMean"]) ** 2)
+            logqz_g += whole["dMean"] * (total - tf.stop_gradient(total)) / n
+            logqz_g += (
+                whole["dStd"]
+                * (squares - tf.stop_gradient(squares))
+                / (2 * n * whole["gStd"])
+            )
 
         return (
             fit_metric,
@@ -246,12 +387,13 @@ class DCVAE(tf.keras.Model):
             regularization,
         )
 
-    # Run the autoencoder for one batch, calculate the errors, calculate the
-    #  gradients and update the layer weights.
-    @tf.function
-    def train_on_batch(self, x, optimizer):
+    # Gradients of the losses for one (micro-)batch
+    # With a loss scaling optimizer (float16 - see getModel), the loss is
+    #  scaled up for the gradient calculation, and the gradients scaled back
+    #  down, so small gradients don't underflow.
+    def batch_gradients(self, x, optimizer, whole=None):
         with tf.GradientTape() as tape:
-            loss_values = self.compute_loss(x, training=True)
+            loss_values = self.compute_loss(x, training=True, whole=whole)
             overall_loss = (
                 tf.math.reduce_mean(loss_values[0], axis=0)  # RMSE
                 + loss_values[1]  # logpz_g
@@ -260,87 +402,144 @@ class DCVAE(tf.keras.Model):
                 + loss_values[4]  # logqz_x
                 + loss_values[5]  # Regularization
             )
+            if isinstance(optimizer, tf.keras.mixed_precision.LossScaleOptimizer):
+                overall_loss = optimizer.get_scaled_loss(overall_loss)
         gradients = tape.gradient(overall_loss, self.trainable_variables)
+        if isinstance(optimizer, tf.keras.mixed_precision.LossScaleOptimizer):
+            gradients = optimizer.get_unscaled_gradients(gradients)
+        return gradients
+
+    # Calculate the gradients of the losses for one batch
+    # With accumulationSteps > 1, the batch is split into that many
+    #  micro-batches, done one after the other (so only one micro-batch's
+    #  activations are in memory at a time), and their gradients added - the
+    #  batch still makes one weight update.
+    # Parts of the loss depend on the whole batch: the climatology error (in
+    #  fit_loss), and the mean and spread of the generated fields (in
+    #  logqz_g). So there are two passes: first the micro-batches are run
+    #  forward only (no gradients - but the generated fields are kept) to get
+    #  those, and the gradient of logqz_g with respect to the mean and
+    #  spread. Then each micro-batch's gradients are calculated with those
+    #  held fixed (see compute_loss), and add up to the whole batch's. Each
+    #  micro-batch has a noise seed, so both passes sample the same latent
+    #  vectors. This costs an extra forward pass for each batch.
+    def compute_gradients(self, x, optimizer):
+        nSteps = self.specification["accumulationSteps"]
+        if nSteps == 1:
+            gradients = self.batch_gradients(x, optimizer)
+        else:
+            size = x[1].shape[0]
+            nSteps = min(nSteps, size)
+            bounds = [
+                (s * size // nSteps, (s + 1) * size // nSteps) for s in range(nSteps)
+            ]
+            seeds = tf.random.uniform([nSteps, 2], maxval=2**31 - 1, dtype=tf.int32)
+            generated = []
+            for step, (start, end) in enumerate(bounds):
+                with tf.control_dependencies(generated):
+                    mean, logvar = self.encode(x[1][start:end], training=True)
+                    latent = self.reparameterize(
+                        mean, logvar, training=True, seed=seeds[step]
+                    )
+                    generated.append(self.generate(latent, training=True))
+            generated = tf.concat(generated, axis=0)
+            gMean = tf.reduce_mean(generated)
+            gStd = tf.math.reduce_std(generated)
+            with tf.GradientTape() as tape:
+                tape.watch([gMean, gStd])
+                fit = self.spread_loss(generated, gMean, gStd)
+            dMean, dStd = tape.gradient(fit, [gMean, gStd])
+            whole = {
+                # Climatology error (climatology is 0.5, as in compute_loss)
+                "guess": tf.reduce_sum(
+                    tf.math.squared_difference(0.5, x[2]) * x[3], axis=[0, 1, 2]
+                ),
+                "gMean": gMean,
+                "gStd": gStd,
+                "dMean": dMean,
+                "dStd": dStd,
+                "count": tf.cast(tf.size(generated), tf.float32),
+            }
+            gradients = []
+            for step, (start, end) in enumerate(bounds):
+                whole.update(seed=seeds[step], fraction=(end - start) / size)
+                # Wait for the previous micro-batch - so they run one at a time
+                with tf.control_dependencies(gradients):
+                    micro = self.batch_gradients(
+                        tuple(t[start:end] for t in x), optimizer, whole=dict(whole)
+                    )
+                if step == 0:
+                    gradients = micro
+                else:
+                    gradients = [g + m for g, m in zip(gradients, micro)]
         # Clip the gradients - helps against sudden numerical problems
         if self.specification["maxGradient"] is not None:
             gradients = [
                 tf.clip_by_norm(g, self.specification["maxGradient"]) for g in gradients
             ]
+        return gradients
+
+    # Run the autoencoder for one batch, calculate the errors, calculate the
+    #  gradients and update the layer weights.
+    @tf.function
+    def train_on_batch(self, x, optimizer):
+        gradients = self.compute_gradients(x, optimizer)
+        # apply_gradients sums the gradients over the replicas (workers) -
+        #  make that the mean, so the update is the same for any number.
+        nReplicas = tf.distribute.get_strategy().num_replicas_in_sync
+        if nReplicas > 1:
+            gradients = [g / nReplicas for g in gradients]
         optimizer.apply_gradients(zip(gradients, self.trainable_variables))
 
+    # Metrics are accumulated over a set of batches ("train" or "test"): zero
+    #  them, add each batch, then divide by the number of batches.
+    def zero_metrics(self, prefix):
+        getattr(self, "%s_rmse" % prefix).assign(
+            tf.zeros([self.specification["nOutputChannels"]])
+        )
+        for name in ("logpz_g", "logqz_g", "logpz", "logqz_x", "loss"):
+            getattr(self, "%s_%s" % (prefix, name)).assign(0.0)
+
+    def accumulate_metrics(self, batch, prefix):
+        # Metrics over unmasked area
+        per_replica_losses = self.specification["strategy"].run(
+            self.compute_loss, args=(batch, False)
+        )
+        batch_losses = [
+            self.specification["strategy"].reduce(
+                tf.distribute.ReduceOp.MEAN, loss, axis=None
+            )
+            for loss in per_replica_losses
+        ]
+        getattr(self, "%s_rmse" % prefix).assign_add(batch_losses[0])
+        getattr(self, "%s_logpz_g" % prefix).assign_add(batch_losses[1])
+        getattr(self, "%s_logqz_g" % prefix).assign_add(batch_losses[2])
+        getattr(self, "%s_logpz" % prefix).assign_add(batch_losses[3])
+        getattr(self, "%s_logqz_x" % prefix).assign_add(batch_losses[4])
+        self.regularization_loss.assign(batch_losses[5])
+        getattr(self, "%s_loss" % prefix).assign_add(
+            tf.math.reduce_mean(batch_losses[0], axis=0)
+            + batch_losses[1]
+            + batch_losses[2]
+            + batch_losses[3]
+            + batch_losses[4]
+            + batch_losses[5]
+        )
+
+    def average_metrics(self, prefix, nBatches):
+        for name in ("rmse", "logpz_g", "logqz_g", "logpz", "logqz_x", "loss"):
+            metric = getattr(self, "%s_%s" % (prefix, name))
+            metric.assign(metric / nBatches)
+
     # Update the metrics
     def update_metrics(self, trainDS, testDS):
-        self.train_rmse.assign(tf.zeros([self.specification["nOutputChannels"]]))
-        self.train_logpz_g.assign(0.0)
-        self.train_logqz_g.assign(0.0)
-        self.train_logpz.assign(0.0)
-        self.train_logqz_x.assign(0.0)
-        self.train_loss.assign(0.0)
-        validation_batch_count = 0
-        for batch in trainDS:
-            per_replica_losses = self.specification["strategy"].run(
-                self.compute_loss, args=(batch, False)
-            )
-            batch_losses = self.specification["strategy"].reduce(
-                tf.distribute.ReduceOp.MEAN, per_replica_losses, axis=None
-            )
-            self.train_rmse.assign_add(batch_losses[0])
-            self.train_logpz_g.assign_add(batch_losses[1])
-            self.train_logqz_g.assign_add(batch_losses[2])
-            self.train_logpz.assign_add(batch_losses[3])
-            self.train_logqz_x.assign_add(batch_losses[4])
-            self.train_loss.assign_add(
-                tf.math.reduce_mean(batch_losses[0], axis=0)
-                + batch_losses[1]
-                + batch_losses[2]
-                + batch_losses[3]
-                + batch_losses[4]
-                + batch_losses[5]
-            )
-            validation_batch_count += 1
-        self.train_rmse.assign(self.train_rmse / validation_batch_count)
-        self.train_logpz.assign(self.train_logpz / validation_batch_count)
-        self.train_logqz_x.assign(self.train_logqz_x / validation_batch_count)
-        self.train_logpz_g.assign(self.train_logpz_g / validation_batch_count)
-        self.train_logqz_g.assign(self.train_logqz_g / validation_batch_count)
-        self.train_loss.assign(self.train_loss / validation_batch_count)
-
-        # Same, but for the test data
-        self.test_rmse.assign(tf.zeros([self.specification["nOutputChannels"]]))
-        self.test_logpz_g.assign(0.0)
-        self.test_logqz_g.assign(0.0)
-        self.test_logpz.assign(0.0)
-        self.test_logqz_x.assign(0.0)
-        self.test_loss.assign(0.0)
-        test_batch_count = 0
-        for batch in testDS:
-            per_replica_losses = self.specification["strategy"].run(
-                self.compute_loss, args=(batch, False)
-            )
-            batch_losses = self.specification["strategy"].reduce(
-                tf.distribute.ReduceOp.MEAN, per_replica_losses, axis=None
-            )
-            self.test_rmse.assign_add(batch_losses[0])
-            self.test_logpz_g.assign_add(batch_losses[1])
-            self.test_logqz_g.assign_add(batch_losses[2])
-            self.test_logpz.assign_add(batch_losses[3])
-            self.test_logqz_x.assign_add(batch_losses[4])
-            self.regularization_loss.assign(batch_losses[5])
-            self.test_loss.assign_add(
-                tf.math.reduce_mean(batch_losses[0], axis=0)
-                + batch_losses[1]
-                + batch_losses[2]
-                + batch_losses[3]
-                + batch_losses[4]
-                + batch_losses[5]
-            )
-            test_batch_count += 1
-        self.test_rmse.assign(self.test_rmse / test_batch_count)
-        self.test_logpz_g.assign(self.test_logpz_g / test_batch_count)
-        self.test_logqz_g.assign(self.test_logqz_g / test_batch_count)
-        self.test_logpz.assign(self.test_logpz / test_batch_count)
-        self.test_logqz_x.assign(self.test_logqz_x / test_batch_count)
-        self.test_loss.assign(self.test_loss / test_batch_count)
+        for prefix, dataset in (("train", trainDS), ("test", testDS)):
+            self.zero_metrics(prefix)
+            batch_count = 0
+            for batch in dataset:
+                self.accumulate_metrics(batch, prefix)
+                batch_count += 1
+            self.average_metrics(prefix, batch_count)
 
     # Save metrics to a log file
     def updateLogfile(self, logfile_writer, epoch):
@@ -421,6 +620,14 @@ def getModel(specification, epoch=1):
     # Instantiate the model
     autoencoder = DCVAE(specification)
 
+    # float16 needs loss scaling (bfloat16 has the same range as float32)
+    if specification["mixedPrecision"] == "mixed_float16" and not isinstance(
+        specification["optimizer"], tf.keras.mixed_precision.LossScaleOptimizer
+    ):
+        specification["optimizer"] = tf.keras.mixed_precision.LossScaleOptimizer(
+            specification["optimizer"]
+        )
+
     # If we are doing a restart, load the weights
     if epoch > 1:
         weights_dir = ("%s/MLES/%s/weights/Epoch_%04d") % (
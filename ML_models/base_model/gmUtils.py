@@ -141,9 +141,12 @@ def plotValidationField(specification, input, output, year, month, fileName):
     for varI in range(nFields):
         ax_var = subfigs[varI].subplots(nrows=1, ncols=3, width_ratios=wRatios)
         # Left - map of target
-        varx = grids.E5sCube.copy()
-        varx.data = np.squeeze(input[-1][:, :, :, varI].numpy())
-        varx.data = np.ma.masked_where(varx.data == 0.0, varx.data, copy=False)
+        varx = grids.grid_cube(
+            specification["resolution"], specification["region"]
+        ).copy()
+        valid = np.squeeze(input[3][:, :, :, varI].numpy())
+        varx.data = np.squeeze(input[2][:, :, :, varI].numpy())
+        varx.data = np.ma.masked_where(valid == 0, varx.data, copy=False)
         if varI == 0:
             ax_var[0].set_title("%04d-%02d" % (year, month))
         ax_var[0].set_axis_off()
@@ -155,9 +158,11 @@ def plotValidationField(specification, input, output, year, month, fileName):
             cMap=get_cmap(specification["outputNames"][varI]),
         )
         # Centre - map of model output
-        vary = grids.E5sCube.copy()
+        vary = grids.grid_cube(
+            specification["resolution"], specification["region"]
+        ).copy()
         vary.data = np.squeeze(output[:, :, :, varI].numpy())
-        vary.data = np.ma.masked_where(varx.data == 0.0, vary.data, copy=False)
+        vary.data = np.ma.masked_where(valid == 0, vary.data, copy=False)
         ax_var[1].set_axis_off()
         ax_var[1].set_title(specification["outputNames"][varI])
         x_img = plots.plotFieldAxes(
@@ -366,18 +371,20 @@ def computeScalarStats(
 ):
     nFields = specification["nOutputChannels"]
 
-    # get the date from the filename tensor
-    dateStr = tf.strings.split(x[0][0][0], sep="/")[-1].numpy()
-    year = int(dateStr[:4])
-    month = int(dateStr[5:7])
+    # get the date from the metadata (year, month, member, source)
+    year = int(x[0][0][0])
+    month = int(x[0][0][1])
     dtp = datetime.date(year, month, 15)
     # Pass the test field through the autoencoder
     generated = model.call(x, training=False)
 
-    def tensor_to_cube(t):
-        result = grids.E5sCube.copy()
+    # Missing data is masked in the cube
+    def tensor_to_cube(t, valid):
+        result = grids.grid_cube(
+            specification["resolution"], specification["region"]
+        ).copy()
         result.data = np.squeeze(t.numpy())
-        result.data = np.ma.masked_where(result.data == 0.0, result.data, copy=False)
+        result.data = np.ma.masked_where(valid == 0, result.data, copy=False)
         return result
 
     def field_to_scalar(field):
@@ -396,11 +403,12 @@ def computeScalarStats(
     stats["target"] = {}
     stats["generated"] = {}
     for varI in range(nFields):
+        valid = np.squeeze(x[3][:, :, :, varI].numpy())
         stats["target"][specification["outputNames"][varI]] = field_to_scalar(
-            tensor_to_cube(tf.squeeze(x[-1][:, :, :, varI])),
+            tensor_to_cube(tf.squeeze(x[2][:, :, :, varI]), valid),
         )
         stats["generated"][specification["outputNames"][varI]] = field_to_scalar(
-            tensor_to_cube(tf.squeeze(generated[:, :, :, varI])),
+            tensor_to_cube(tf.squeeze(generated[:, :, :, varI]), valid),
         )
     return stats
 
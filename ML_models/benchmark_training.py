@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+# Benchmark the training step of a model - steps/second on random data
+#  (so it measures the model, not the input pipeline).
+# With mixed precision, also compares the output with the float32 model (same
+#  weights, latent space means, so no sampling noise).
+
+# Run from the repository root, e.g.
+#  ./ML_models/benchmark_training.py --model=all_convolutional --resolution=1
+#  ./ML_models/benchmark_training.py --model=all_convolutional --resolution=1 --jit
+# Peak memory is the maximum resident set size of the process, so compare
+#  options (e.g. --recompute) in separate runs.
+
+import os
+import sys
+import time
+import resource
+import importlib
+import tensorflow as tf
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--model",
+    help="Model architecture",
+    type=str,
+    required=False,
+    default="all_convolutional",
+    choices=("all_convolutional", "base_model"),
+)
+parser.add_argument(
+    "--resolution", help="Grid resolution", type=float, required=False, default=0.25
+)
+parser.add_argument("--batch", help="Batch size", type=int, required=False, default=4)
+parser.add_argument(
+    "--steps", help="No. of steps to time", type=int, required=False, default=10
+)
+parser.add_argument(
+    "--jit", help="Compile with XLA", default=False, action="store_true"
+)
+parser.add_argument(
+    "--precision",
+    help="Mixed precision policy",
+    type=str,
+    required=False,
+    default=None,
+    choices=("mixed_bfloat16", "mixed_float16"),
+)
+parser.add_argument(
+    "--recompute",
+    help="No. of layers to recompute at each end",
+    type=int,
+    required=False,
+    default=0,
+)
+parser.add_argument(
+    "--accumulate",
+    help="No. of micro-batches for each step",
+    type=int,
+    required=False,
+    default=1,
+)
+args = parser.parse_args()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+specification = importlib.import_module(
+    "ML_models.%s.specify" % args.model
+).specification
+specification["resolution"] = args.resolution
+specification["jitCompile"] = args.jit
+specification["trainingMask"] = None
+specification["recomputeLayers"] = args.recompute
+specification["accumulationSteps"] = args.accumulate
+autoencoderModel = importlib.import_module("ML_models.%s.autoencoderModel" % args.model)
+getFieldShape = importlib.import_module(
+    "ML_models.%s.makeDataset" % args.model
+).getFieldShape
+
+# A batch of random fields, in the dataset structure
+shape = (args.batch,) + tuple(getFieldShape(specification))
+batch = (
+    tf.zeros([args.batch, 4], tf.int32),
+    tf.random.uniform(shape + (specification["nInputChannels"],)),
+    tf.random.uniform(shape + (specification["nOutputChannels"],)),
+    tf.ones(shape + (specification["nOutputChannels"],)),
+)
+
+
+# Output from the latent space means - no sampling noise
+def meanOutput(model):
+    return model.generate(model.encode(batch[1])[0])
+
+
+if args.precision is not None:
+    specification["mixedPrecision"] = None
+    reference = autoencoderModel.DCVAE(specification)
+    refOutput = meanOutput(reference)
+specification["mixedPrecision"] = args.precision
+autoencoder = autoencoderModel.getModel(specification)
+optimizer = specification["optimizer"]
+if args.precision is not None:
+    meanOutput(autoencoder)  # Make the weights
+    autoencoder.set_weights(reference.get_weights())
+    output = meanOutput(autoencoder)
+    print(
+        "%s output vs. float32: RMS difference %.2e (RMS output %.2e)"
+        % (
+            args.precision,
+            tf.sqrt(tf.reduce_mean(tf.square(output - refOutput))),
+            tf.sqrt(tf.reduce_mean(tf.square(refOutput))),
+        )
+    )
+    print(
+        "Fit loss: %s %.6f, float32 %.6f"
+        % (
+            args.precision,
+            autoencoder.fit_loss(output, batch[2], output * 0.0 + 0.5, batch[3])[0],
+            reference.fit_loss(refOutput, batch[2], refOutput * 0.0 + 0.5, batch[3])[0],
+        )
+    )
+
+# First step includes tracing and compilation - time it separately
+start = time.time()
+autoencoder.train_on_batch(batch, optimizer)
+first = time.time() - start
+
+start = time.time()
+for step in range(args.steps):
+    autoencoder.train_on_batch(batch, optimizer)
+elapsed = time.time() - start
+
+print(
+    "%s %gdeg batch %d jit %s %s recompute %d accumulate %d: first step %.1fs, "
+    "%.3f steps/s (%.1f fields/s), peak memory %.2f GB"
+    % (
+        args.model,
+        args.resolution,
+        args.batch,
+        args.jit,
+        args.precision or "float32",
+        args.recompute,
+        args.accumulate,
+        first,
+        args.steps / elapsed,
+        args.steps * args.batch / elapsed,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024**2,
+    )
+)
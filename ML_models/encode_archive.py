@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+# Encode every month and ensemble member of the archive with a trained model,
+#  and save the latent space means and log variances in a latent store
+#  (see utilities/latents.py) - for analyses that only need the latent space.
+
+# Run from the model directory (it uses the specify.py there), e.g.
+#  ../encode_archive.py --model=all_convolutional --epoch=250
+# To add new months to an existing store, restrict the years, e.g.
+#  ../encode_archive.py --model=all_convolutional --epoch=250 --startyear=2024
+#  (months already in the store are re-encoded and replaced)
+
+# Both training and test months are encoded. Ensemble members are encoded
+#  one at a time (member n of each input source together).
+
+import os
+import sys
+import importlib
+import numpy as np
+import tensorflow as tf
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--model",
+    help="Model architecture",
+    type=str,
+    required=False,
+    default="all_convolutional",
+    choices=("all_convolutional", "base_model"),
+)
+parser.add_argument("--epoch", help="Epoch", type=int, required=False, default=250)
+parser.add_argument(
+    "--startyear", help="First year to encode", type=int, required=False, default=None
+)
+parser.add_argument(
+    "--endyear", help="Last year to encode", type=int, required=False, default=None
+)
+parser.add_argument("--batch", help="Batch size", type=int, required=False, default=8)
+parser.add_argument(
+    "--opdir",
+    help="Store directory",
+    type=str,
+    required=False,
+    default=None,
+)
+args = parser.parse_args()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+from specify import specification
+from utilities.latents import append_entries
+
+makeDataset = importlib.import_module("ML_models.%s.makeDataset" % args.model)
+getModel = importlib.import_module(
+    "ML_models.%s.autoencoderModel" % args.model
+).getModel
+
+if specification["patchSize"] is not None:
+    raise ValueError("Can't encode whole fields with a patch-trained model")
+
+specification["strategy"] = tf.distribute.get_strategy()  # No distribution
+if args.opdir is None:
+    args.opdir = "%s/MLES/%s/latents/Epoch_%04d" % (
+        os.getenv("SCRATCH"),
+        specification["modelName"],
+        args.epoch,
+    )
+
+# Only the inputs are needed, and every member of each month
+# Each month is read once, so don't cache the dataset (it would hold the
+#  whole archive in memory)
+encodeSpecification = dict(specification)
+encodeSpecification.update(
+    {
+        "outputTensors": None,
+        "trainingMask": None,
+        "correlatedEnsembles": True,
+        "maxEnsembleCombinations": sys.maxsize,
+        "maxTrainingMonths": None,
+        "maxTestMonths": None,
+        "trainCache": False,
+        "testCache": False,
+    }
+)
+if args.startyear is not None:
+    encodeSpecification["startYear"] = args.startyear
+if args.endyear is not None:
+    encodeSpecification["endYear"] = args.endyear
+
+autoencoder = getModel(specification, epoch=args.epoch)
+
+
+# Encode in batches - and turn the metadata into dates and file names
+@tf.function
+def encodeBatch(x):
+    return autoencoder.encode(x, training=False)
+
+
+means = []
+logvars = []
+dates = []
+members = []
+files = []
+for purpose in ("Train", "Test"):
+    paths = makeDataset.getPathTable(encodeSpecification, purpose)
+    dataset = makeDataset.getDataset(
+        encodeSpecification, purpose=purpose, patches=False
+    ).batch(args.batch)
+    for batch in dataset:
+        mean, logvar = encodeBatch(batch[1])
+        means.append(mean.numpy())
+        logvars.append(logvar.numpy())
+        for metadata in batch[0].numpy():
+            dates.append("%04d-%02d" % (metadata[0], metadata[1]))
+            members.append(metadata[2])
+            files.append(paths[metadata[3]])
+
+# Store in date order
+order = sorted(range(len(dates)), key=lambda i: (dates[i], members[i]))
+append_entries(
+    args.opdir,
+    np.concatenate(means)[order],
+    np.concatenate(logvars)[order],
+    [dates[i] for i in order],
+    [members[i] for i in order],
+    [files[i] for i in order],
+    attributes={"modelName": specification["modelName"], "epoch": args.epoch},
+)
+print("Encoded %d fields into %s" % (len(dates), args.opdir))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+# Export a trained model for inference - a SavedModel with encode, generate,
+#  and call signatures, which loads without the model code or specify.py
+#  (see utilities/inference.py).
+
+# Run from the model directory (it uses the specify.py there), e.g.
+#  ../export_model.py --model=all_convolutional --epoch=250
+
+import os
+import sys
+import importlib
+import tensorflow as tf
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--model",
+    help="Model architecture",
+    type=str,
+    required=False,
+    default="all_convolutional",
+    choices=("all_convolutional", "base_model"),
+)
+parser.add_argument("--epoch", help="Epoch", type=int, required=False, default=250)
+parser.add_argument(
+    "--opdir", help="Output directory", type=str, required=False, default=None
+)
+args = parser.parse_args()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+from specify import specification
+from utilities.inference import export_model
+
+getModel = importlib.import_module(
+    "ML_models.%s.autoencoderModel" % args.model
+).getModel
+
+specification["strategy"] = tf.distribute.get_strategy()  # No distribution
+if args.opdir is None:
+    args.opdir = "%s/MLES/%s/exported/Epoch_%04d" % (
+        os.getenv("SCRATCH"),
+        specification["modelName"],
+        args.epoch,
+    )
+
+autoencoder = getModel(specification, epoch=args.epoch)
+export_model(
+    autoencoder,
+    args.opdir,
+    attributes={"model": args.model, "epoch": args.epoch},
+)
+print("Exported to %s" % args.opdir)
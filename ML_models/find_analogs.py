@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# Find the months most like a given month - nearest neighbours in the latent
+#  space, from a latent store (made by encode_archive.py).
+
+# Run from the model directory (it uses the specify.py there), e.g.
+#  ../find_analogs.py --epoch=250 --year=2010 --month=3
+
+import os
+import sys
+import time
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--epoch", help="Epoch", type=int, required=False, default=250)
+parser.add_argument("--year", help="Year", type=int, required=True)
+parser.add_argument("--month", help="Month", type=int, required=True)
+parser.add_argument(
+    "--member", help="Ensemble member", type=int, required=False, default=0
+)
+parser.add_argument(
+    "--k", help="No. of analogs to find", type=int, required=False, default=10
+)
+parser.add_argument(
+    "--approximate",
+    help="Use the approximate index",
+    default=False,
+    action="store_true",
+)
+parser.add_argument(
+    "--store", help="Latent store directory", type=str, required=False, default=None
+)
+args = parser.parse_args()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+from utilities.latents import read_latents, find_entries
+from utilities.analogs import AnalogSearch
+
+if args.store is None:
+    from specify import specification
+
+    args.store = "%s/MLES/%s/latents/Epoch_%04d" % (
+        os.getenv("SCRATCH"),
+        specification["modelName"],
+        args.epoch,
+    )
+
+start = time.time()
+search = AnalogSearch(args.store, approximate=args.approximate)
+built = time.time() - start
+
+date = "%04d-%02d" % (args.year, args.month)
+entries = find_entries(search.store_index, date, args.member)
+if len(entries) == 0:
+    raise ValueError(
+        "No entry for %s member %d in %s" % (date, args.member, args.store)
+    )
+mean = read_latents(args.store)[0]
+
+start = time.time()
+analogs = search.search(mean[entries], k=args.k, exclude=(date,))[0]
+searched = time.time() - start
+
+print("Analogs of %s member %d:" % (date, args.member))
+for analog_date, member, distance in analogs:
+    print("%s  member %2d  distance %8.3f" % (analog_date, member, distance))
+print("(index built in %.2fs, search took %.1fms)" % (built, searched * 1000))
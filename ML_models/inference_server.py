@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+# Keep an exported model (from export_model.py) loaded, and answer inference
+#  requests from other scripts on this machine (see utilities/inference.py).
+# Runs until killed.
+
+# Run from the model directory (it uses the specify.py there to find the
+#  exported model), e.g.
+#  ../inference_server.py --epoch=250 &
+#  ./validate.py --epoch=250 --server=localhost:6789
+# or give the exported model directory, with --exported.
+
+import os
+import sys
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--epoch", help="Epoch", type=int, required=False, default=250)
+parser.add_argument(
+    "--exported",
+    help="Exported model directory",
+    type=str,
+    required=False,
+    default=None,
+)
+parser.add_argument("--port", help="Port", type=int, required=False, default=6789)
+parser.add_argument(
+    "--batch", help="Most fields run at once", type=int, required=False, default=32
+)
+args = parser.parse_args()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+from utilities.inference import serve
+
+if args.exported is None:
+    from specify import specification
+
+    args.exported = "%s/MLES/%s/exported/Epoch_%04d" % (
+        os.getenv("SCRATCH"),
+        specification["modelName"],
+        args.epoch,
+    )
+
+serve(args.exported, address=("localhost", args.port), batch_size=args.batch)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+# Fill in the held-out region (where the training mask is 0) of a set of
+#  months from the observed region only - by fitting the latent vector of a
+#  trained model (see utilities/infill.py) - and report how well it did.
+
+# Run from the model directory (it uses the specify.py there), e.g.
+#  ../infill_months.py --model=all_convolutional --epoch=250 --startyear=2000 --endyear=2009
+
+# Reports the convergence of the fits, and the RMS error in the held-out
+#  region of the infilled fields, compared with climatology (0.5, as in the
+#  model loss) and with the autoencoder output for the whole field (which
+#  sees the held-out region - so a lower bound).
+# With --opfile, saves the filled fields, with their dates and the report
+#  (numpy .npz).
+
+import os
+import sys
+import time
+import importlib
+import numpy as np
+import tensorflow as tf
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--model",
+    help="Model architecture",
+    type=str,
+    required=False,
+    default="all_convolutional",
+    choices=("all_convolutional", "base_model"),
+)
+parser.add_argument("--epoch", help="Epoch", type=int, required=False, default=250)
+parser.add_argument(
+    "--startyear", help="First year", type=int, required=False, default=None
+)
+parser.add_argument(
+    "--endyear", help="Last year", type=int, required=False, default=None
+)
+parser.add_argument(
+    "--starts", help="Starting points for each month", type=int, default=8
+)
+parser.add_argument("--steps", help="Optimization steps", type=int, default=200)
+parser.add_argument("--rate", help="Learning rate", type=float, default=0.05)
+parser.add_argument(
+    "--batch", help="Most months x starts fitted at once", type=int, default=64
+)
+parser.add_argument(
+    "--training",
+    help="Use training months (not test)",
+    default=False,
+    action="store_true",
+)
+parser.add_argument(
+    "--opfile", help="File for the filled fields", type=str, required=False
+)
+args = parser.parse_args()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+from specify import specification
+from utilities.infill import infill
+
+makeDataset = importlib.import_module("ML_models.%s.makeDataset" % args.model)
+getModel = importlib.import_module(
+    "ML_models.%s.autoencoderModel" % args.model
+).getModel
+
+# Check everything before loading any data
+if args.steps < 2:
+    raise ValueError("Need at least 2 optimization steps")
+if specification.get("trainingMask") is None:
+    raise ValueError("No training mask - nothing is held out")
+# The input must be the same field as the target (observed where valid)
+if specification["outputTensors"] is not None:
+    raise ValueError("Infilling needs the same input and output fields")
+if args.opfile is not None:
+    opdir = os.path.dirname(os.path.abspath(args.opfile))
+    if not os.path.isdir(opdir) or not os.access(opdir, os.W_OK):
+        raise ValueError("Can't write %s" % args.opfile)
+specification["strategy"] = tf.distribute.get_strategy()  # No distribution
+if args.startyear is not None:
+    specification["startYear"] = args.startyear
+if args.endyear is not None:
+    specification["endYear"] = args.endyear
+
+purpose = "Train" if args.training else "Test"
+if len(makeDataset.getSpecificationCatalog(specification, purpose)) == 0:
+    sys.exit(
+        "No %s months in %s-%s"
+        % (purpose.lower(), args.startyear or "start", args.endyear or "end")
+    )
+
+autoencoder = getModel(specification, epoch=args.epoch)
+
+# All the months, at once - the training mask comes with each
+dates = []
+inputs = []
+targets = []
+weights = []
+for batch in makeDataset.getDataset(
+    specification, purpose=purpose, patches=False
+).batch(32):
+    dates.extend("%04d-%02d" % (m[0], m[1]) for m in batch[0].numpy())
+    inputs.append(batch[1])
+    targets.append(batch[2])
+    weights.append(batch[3])
+    mask = batch[4][0]
+inputs = tf.concat(inputs, axis=0)
+targets = tf.concat(targets, axis=0)
+weights = tf.concat(weights, axis=0)
+
+# Observed - valid data in the training region
+valid = weights * mask
+heldout = weights * (1.0 - mask)
+
+start = time.time()
+filled, report = infill(
+    autoencoder,
+    targets,
+    valid,
+    n_starts=args.starts,
+    steps=args.steps,
+    learning_rate=args.rate,
+    batch_size=args.batch,
+)
+elapsed = time.time() - start
+
+
+# RMS error in the held-out region, over all the months
+def heldoutRMS(fields):
+    return float(
+        tf.sqrt(
+            tf.reduce_sum(tf.math.squared_difference(fields, targets) * heldout)
+            / tf.reduce_sum(heldout)
+        )
+    )
+
+
+autoencoded = tf.concat(
+    [
+        autoencoder.generate(autoencoder.encode(inputs[i : i + 32])[0])
+        for i in range(0, inputs.shape[0], 32)
+    ],
+    axis=0,
+)
+print(
+    "%d months, %d starts, %d steps: %.1fs"
+    % (len(dates), args.starts, args.steps, elapsed)
+)
+print(
+    "Converged: %d of %d. Best start was the encoding for %d."
+    % (np.sum(report["converged"]), len(dates), np.sum(report["start"] == 0))
+)
+print("Observed-region misfit (mean square): %.4f" % np.mean(report["misfit"]))
+print("Held-out RMS error:")
+print("  infilled     %.4f" % heldoutRMS(filled))
+print("  climatology  %.4f" % heldoutRMS(tf.zeros_like(targets) + 0.5))
+print("  autoencoder  %.4f (sees the held-out region)" % heldoutRMS(autoencoded))
+
+if args.opfile is not None:
+    np.savez(args.opfile, dates=np.array(dates), filled=filled, **report)
@@ -8,7 +8,9 @@
 import tensorflow as tf
 import numpy as np
 from utilities.plots import get_land_mask
-from utilities.grids import E5sCube
+from utilities.grids import grid_cube
+from utilities.pyramid import grid_shape, crop_region
+from utilities.distribute import get_strategy
 
 specification = {}
 
@@ -19,6 +21,34 @@ specification["outputTensors"] = None  # If None, same as input
 
 specification["outputNames"] = ("T2m",)  # For printout
 
+# Storage format of the tensors (float32, float16, or uint16)
+#  must match the format the input and output tensors were made with
+specification["tensorFormat"] = "float32"
+
+# If True, read the raw tensors and normalize them as they are read
+#  (using the current normalization fits), instead of the normalized tensors
+specification["normalizeOnTheFly"] = False
+
+# Grid resolution (degrees) - 0.25 is the full resolution, 0.5, 1, and 2 use
+#  lower resolution copies of the data (see utilities/pyramid.py)
+specification["resolution"] = 0.25
+
+# Region to train on (min_lat, max_lat, min_lon, max_lon) - None for global
+#  (if min_lon > max_lon, the region crosses the date-line)
+specification["region"] = None
+
+# If True, read from chunked stores (see utilities/chunks.py) - so only the
+#  latitude bands needed for the region are read (full resolution only)
+specification["chunked"] = False
+
+# Patch training - if patchSize is set (rows, columns), train on patchesPerMonth
+#  random patches from each month (wrapping round in longitude), instead of
+#  whole fields. Whole fields are then made from overlapping patches
+#  (overlap patchOverlap grid-points), blended together.
+specification["patchSize"] = None  # e.g. (128, 256)
+specification["patchesPerMonth"] = 4
+specification["patchOverlap"] = 32
+
 specification["nInputChannels"] = len(specification["inputTensors"])
 if specification["outputTensors"] is not None:
     specification["nOutputChannels"] = len(specification["outputTensors"])
@@ -43,15 +73,28 @@ specification["correlatedEnsembles"] = (
 )
 
 # Fit parameters
-specification["nMonthsInEpoch"] = (
-    None  # Length of an epoch - if None, use all the data once
-)
+# Length of an epoch - if None, use all the data once. Otherwise each epoch
+#  is a random sample of nMonthsInEpoch months (with replacement), weighted by
+#  epochWeights: by season (calendar month), decade (e.g. 1990), and source
+#  (ensemble member label - the part of the file name after the date).
+#  Missing entries have weight 1, e.g. {"season": {12: 2, 1: 2, 2: 2}}
+#  doubles the chance of winter months.
+specification["nMonthsInEpoch"] = None
+specification["epochWeights"] = {"season": None, "decade": None, "source": None}
 specification["nEpochs"] = 250  # How many epochs to train for
 specification["shuffleBufferSize"] = 1000  # Buffer size for shuffling
 specification["batchSize"] = 32  # Arbitrary
 specification["beta"] = 0.001  # Weighting factor for KL divergence of latent space
 specification["gamma"] = 0.000  # Weighting factor for KL divergence of output
 specification["maxGradient"] = 5  # Numerical instability protection
+# Split each batch into this many micro-batches, and accumulate their
+#  gradients for one weight update - the same gradients, with less memory,
+#  but more time (an extra forward pass - see compute_gradients)
+specification["accumulationSteps"] = 1
+# Recompute the activations of this many layers at each full-resolution end
+#  of the model (start of the encoder, end of the generator) in the backward
+#  pass, instead of storing them - less memory, more time (0 for none)
+specification["recomputeLayers"] = 0
 
 # Output control
 specification["printInterval"] = (
@@ -59,10 +102,19 @@ specification["printInterval"] = (
 )
 
 # Optimization
-specification["strategy"] = tf.distribute.MirroredStrategy()
+# Distribution - multi-worker if TF_CONFIG describes a cluster
+#  (see utilities/distribute.py), otherwise MirroredStrategy.
+specification["strategy"] = get_strategy()
 specification["optimizer"] = tf.keras.optimizers.Adam(1e-3)
 specification["trainCache"] = True
 specification["testCache"] = True
+# Compile the loss and gradient calculations with XLA - on the CPU nodes
+#  tested this was much slower than the default, so check with
+#  ML_models/benchmark_training.py before using it.
+specification["jitCompile"] = False
+# Mixed precision - None (float32 throughout), "mixed_bfloat16", or
+#  "mixed_float16" (weights and losses are always float32)
+specification["mixedPrecision"] = None
 
 # Regularization
 specification["regularization"] = {
@@ -73,7 +125,18 @@ specification["regularization"] = {
 }
 
 # Mask to specify a subset of data to train on
-lm = get_land_mask(grid_cube=E5sCube)
+# At lower resolutions the regridded land mask is a land fraction - points
+#  that are at least half land count as land
+lm = get_land_mask(grid_cube=grid_cube(specification["resolution"]))
 specification["trainingMask"] = tf.constant(
-    np.reshape(lm.data, [721, 1440, 1]), dtype=tf.int32
+    np.reshape(
+        np.asarray(lm.data) >= 0.5, grid_shape(specification["resolution"]) + (1,)
+    ),
+    dtype=tf.int32,
 )
+if specification["region"] is not None:
+    specification["trainingMask"] = crop_region(
+        specification["trainingMask"],
+        specification["region"],
+        specification["resolution"],
+    )
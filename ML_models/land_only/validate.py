@@ -40,6 +40,20 @@ parser.add_argument(
     default=False,
     action="store_true",
 )
+parser.add_argument(
+    "--exported",
+    help="Use this exported model (see export_model.py)",
+    type=str,
+    required=False,
+    default=None,
+)
+parser.add_argument(
+    "--server",
+    help="Use the model from this inference server (host:port)",
+    type=str,
+    required=False,
+    default=None,
+)
 args = parser.parse_args()
 
 purpose = "Test"
@@ -47,7 +61,7 @@ if args.training:
     purpose = "Train"
 # Go through data and get the desired month
 dataset = (
-    getDataset(specification, purpose=purpose)
+    getDataset(specification, purpose=purpose, patches=False)
     .shuffle(specification["shuffleBufferSize"])
     .batch(1)
 )
@@ -55,9 +69,8 @@ input = None
 year = None
 month = None
 for batch in dataset:
-    dateStr = tf.strings.split(batch[0][0][0], sep="/")[-1].numpy()
-    year = int(dateStr[:4])
-    month = int(dateStr[5:7])
+    year = int(batch[0][0][0])  # Metadata is (year, month, member, source)
+    month = int(batch[0][0][1])
     if (args.month is None or month == args.month) and (
         args.year is None or year == args.year
     ):
@@ -67,7 +80,12 @@ for batch in dataset:
 if input is None:
     raise Exception("Month %04d-%02d not in %s dataset" % (year, month, purpose))
 
-autoencoder = getModel(specification, args.epoch)
+if args.server is not None or args.exported is not None:
+    from utilities.inference import inference_model
+
+    autoencoder = inference_model(server=args.server, directory=args.exported)
+else:
+    autoencoder = getModel(specification, args.epoch)
 
 # Get autoencoded tensors
 output = autoencoder.call(input, training=False)
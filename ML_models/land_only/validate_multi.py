@@ -55,6 +55,20 @@ parser.add_argument(
     default=False,
     action="store_true",
 )
+parser.add_argument(
+    "--exported",
+    help="Use this exported model (see export_model.py)",
+    type=str,
+    required=False,
+    default=None,
+)
+parser.add_argument(
+    "--server",
+    help="Use the model from this inference server (host:port)",
+    type=str,
+    required=False,
+    default=None,
+)
 args = parser.parse_args()
 
 from utilities import grids
@@ -70,11 +84,16 @@ from ML_models.all_convolutional.gmUtils import (
 purpose = "Test"
 if args.training:
     purpose = "Train"
-dataset = getDataset(specification, purpose=purpose)
+dataset = getDataset(specification, purpose=purpose, patches=False)
 dataset = dataset.batch(1)
 
 # Load the trained model
-autoencoder = getModel(specification, args.epoch)
+if args.server is not None or args.exported is not None:
+    from utilities.inference import inference_model
+
+    autoencoder = inference_model(server=args.server, directory=args.exported)
+else:
+    autoencoder = getModel(specification, args.epoch)
 
 # Go through the data and get the scalar stat for each test month
 all_stats = {}
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+# Run a training script as several worker processes on this machine - to
+#  test multi-worker training (see utilities/distribute.py) without a cluster.
+# Each worker gets its own TF_CONFIG, and its output is prefixed with the
+#  worker number.
+
+# Run from the model directory, e.g.
+#  ../launch_workers.py --workers=2 ./autoencoder.py --epoch=1
+
+# On a cluster, run the script once on each node instead, with TF_CONFIG
+#  listing all the nodes, and this node's index.
+
+import os
+import sys
+import threading
+import subprocess
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--workers", help="No. of worker processes", type=int, required=False, default=2
+)
+parser.add_argument("script", help="Training script", type=str)
+parser.add_argument("script_args", nargs=argparse.REMAINDER)
+args = parser.parse_args()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utilities.distribute import local_cluster
+
+
+# Copy a worker's output, with its number at the start of each line
+def relay(worker, stream):
+    for line in stream:
+        sys.stdout.write("[%d] %s" % (worker, line))
+        sys.stdout.flush()
+
+
+processes = []
+threads = []
+for worker, config in enumerate(local_cluster(args.workers)):
+    env = dict(os.environ, TF_CONFIG=config)
+    process = subprocess.Popen(
+        [sys.executable, args.script] + args.script_args,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    thread = threading.Thread(target=relay, args=(worker, process.stdout))
+    thread.start()
+    processes.append(process)
+    threads.append(thread)
+
+status = [process.wait() for process in processes]
+for thread in threads:
+    thread.join()
+sys.exit(1 if any(status) else 0)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+# Make an int8 quantized version of a trained model's generator, for bulk
+#  decoding on CPU (see utilities/quantize.py), and report what it costs in
+#  skill and gains in speed.
+
+# Run from the model directory (it uses the specify.py there), e.g.
+#  ../quantize_generator.py --model=all_convolutional --epoch=250
+
+# The activation ranges are calibrated on samples from the latent
+#  distributions of training fields. The report compares the quantized
+#  generator with the original on the test months - RMS error of the
+#  reconstructions (from the encoded means), and the time to decode them in
+#  batches. It is printed, and saved (JSON) with the quantized model.
+
+import os
+import sys
+import json
+import time
+import importlib
+import numpy as np
+import tensorflow as tf
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--model",
+    help="Model architecture",
+    type=str,
+    required=False,
+    default="all_convolutional",
+    choices=("all_convolutional", "base_model"),
+)
+parser.add_argument("--epoch", help="Epoch", type=int, required=False, default=250)
+parser.add_argument(
+    "--calibration",
+    help="No. of training fields to calibrate with",
+    type=int,
+    required=False,
+    default=100,
+)
+parser.add_argument(
+    "--samples",
+    help="No. of latent samples to decode, for the timing",
+    type=int,
+    required=False,
+    default=1024,
+)
+parser.add_argument(
+    "--batch", help="Batch size for decoding", type=int, required=False, default=32
+)
+parser.add_argument(
+    "--opdir", help="Output directory", type=str, required=False, default=None
+)
+args = parser.parse_args()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+from specify import specification
+from utilities.quantize import quantize_generator, QuantizedModel
+
+getDataset = importlib.import_module("ML_models.%s.makeDataset" % args.model).getDataset
+getModel = importlib.import_module(
+    "ML_models.%s.autoencoderModel" % args.model
+).getModel
+
+if specification["patchSize"] is not None:
+    raise ValueError("Can't generate whole fields with a patch-trained model")
+specification["strategy"] = tf.distribute.get_strategy()  # No distribution
+if args.opdir is None:
+    args.opdir = "%s/MLES/%s/quantized/Epoch_%04d" % (
+        os.getenv("SCRATCH"),
+        specification["modelName"],
+        args.epoch,
+    )
+if not os.path.isdir(args.opdir):
+    os.makedirs(args.opdir)
+
+autoencoder = getModel(specification, epoch=args.epoch)
+
+
+@tf.function
+def encodeBatch(x):
+    return autoencoder.encode(x, training=False)
+
+
+@tf.function
+def generateBatch(z):
+    return autoencoder.generate(z, training=False)
+
+
+# Calibration - samples from the latent distributions of training fields
+calibration = []
+for batch in (
+    getDataset(specification, purpose="Train", patches=False)
+    .shuffle(specification["shuffleBufferSize"])
+    .take(args.calibration)
+    .batch(args.batch)
+):
+    mean, logvar = encodeBatch(batch[1])
+    calibration.append(autoencoder.reparameterize(mean, logvar).numpy())
+calibration = np.concatenate(calibration)
+
+start = time.time()
+quantize_generator(
+    autoencoder,
+    calibration,
+    batch_size=args.batch,
+    file_name="%s/generator.tflite" % args.opdir,
+)
+converted = time.time() - start
+quantized = QuantizedModel("%s/generator.tflite" % args.opdir, model=autoencoder)
+
+# Test months - encoded means, and samples, targets, and weights
+latents = []
+samples = []
+targets = []
+weights = []
+for batch in getDataset(specification, purpose="Test", patches=False).batch(args.batch):
+    mean, logvar = encodeBatch(batch[1])
+    latents.append(mean.numpy())
+    samples.append((mean, logvar))
+    targets.append(batch[2].numpy())
+    weights.append(batch[3].numpy())
+targets = np.concatenate(targets)
+weights = np.concatenate(weights)
+original = np.concatenate([generateBatch(z).numpy() for z in latents])
+int8 = np.concatenate([quantized.generate(z).numpy() for z in latents])
+
+# Bulk decoding - samples from the test latent distributions, in batches
+mean = tf.concat([s[0] for s in samples], axis=0)
+logvar = tf.concat([s[1] for s in samples], axis=0)
+choice = np.random.randint(0, mean.shape[0], args.samples)
+bulk = autoencoder.reparameterize(
+    tf.gather(mean, choice), tf.gather(logvar, choice)
+).numpy()
+
+
+# Fastest time (of 3) to decode all the bulk samples
+def decodingTime(generate):
+    generate(bulk[: args.batch])  # Compile, or allocate, before timing
+    times = []
+    for repeat in range(3):
+        start = time.time()
+        for first in range(0, args.samples, args.batch):
+            generate(bulk[first : first + args.batch]).numpy()
+        times.append(time.time() - start)
+    return min(times)
+
+
+originalTime = decodingTime(generateBatch)
+int8Time = decodingTime(quantized.generate)
+
+
+def weightedRMS(difference):
+    return float(np.sqrt(np.sum(difference**2 * weights) / np.sum(weights)))
+
+
+report = {
+    "epoch": args.epoch,
+    "calibrationFields": int(calibration.shape[0]),
+    "testFields": int(targets.shape[0]),
+    "decodedSamples": args.samples,
+    "rmseOriginal": weightedRMS(original - targets),
+    "rmseQuantized": weightedRMS(int8 - targets),
+    "rmsDifference": weightedRMS(int8 - original),
+    "secondsOriginal": originalTime,
+    "secondsQuantized": int8Time,
+    "speedup": originalTime / int8Time,
+    "sizeOriginal": int(
+        sum(np.prod(w.shape) * 4 for w in autoencoder.generator.weights)
+    ),
+    "sizeQuantized": os.path.getsize("%s/generator.tflite" % args.opdir),
+}
+with open("%s/report.json" % args.opdir, "w") as f:
+    json.dump(report, f, indent=1)
+
+print(
+    "Quantized generator in %s (calibrated on %d fields, %.1fs)"
+    % (args.opdir, report["calibrationFields"], converted)
+)
+print("Test months (%d fields):" % report["testFields"])
+print(
+    "  RMS error: original %.4f, quantized %.4f (difference %.4f)"
+    % (report["rmseOriginal"], report["rmseQuantized"], report["rmsDifference"])
+)
+print("Decoding %d samples, %d at a time:" % (args.samples, args.batch))
+print(
+    "  time: original %.2fs, quantized %.2fs (speed-up x%.2f)"
+    % (originalTime, int8Time, report["speedup"])
+)
+print(
+    "  generator size: original %.2fMb, quantized %.2fMb"
+    % (report["sizeOriginal"] / 1e6, report["sizeQuantized"] / 1e6)
+)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+# Make large ensembles of generated fields for a set of months - many draws
+#  from the latent distribution of each month (from a latent store, made by
+#  encode_archive.py), decoded in batches - and save their statistics (mean,
+#  spread, quantiles), and, optionally, the fields themselves.
+# See utilities/sampling.py
+
+# Run from the model directory (it uses the specify.py there), e.g.
+#  ../sample_ensemble.py --model=all_convolutional --epoch=250 --startyear=2010 --endyear=2010 --samples=1000
+
+# Output, for each month and member, in opdir:
+#  YYYY-MM_NN_stats.npz - mean, spread, and quantiles [lat, lon, channels]
+#  YYYY-MM_NN_samples.npy - all the fields [sample, lat, lon, channels]
+#   (only with --fields)
+
+import os
+import sys
+import time
+import importlib
+import numpy as np
+import tensorflow as tf
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--model",
+    help="Model architecture",
+    type=str,
+    required=False,
+    default="all_convolutional",
+    choices=("all_convolutional", "base_model"),
+)
+parser.add_argument("--epoch", help="Epoch", type=int, required=False, default=250)
+parser.add_argument(
+    "--startyear", help="First year", type=int, required=False, default=None
+)
+parser.add_argument(
+    "--endyear", help="Last year", type=int, required=False, default=None
+)
+parser.add_argument(
+    "--samples", help="Ensemble size", type=int, required=False, default=100
+)
+parser.add_argument(
+    "--batch", help="Fields generated at once", type=int, required=False, default=32
+)
+parser.add_argument(
+    "--quantiles",
+    help="Quantiles to save",
+    type=float,
+    nargs="+",
+    required=False,
+    default=(0.05, 0.5, 0.95),
+)
+parser.add_argument(
+    "--fields",
+    help="Save the fields, as well as the statistics",
+    default=False,
+    action="store_true",
+)
+parser.add_argument(
+    "--quantized",
+    help="Use the int8 generator (from quantize_generator.py)",
+    default=False,
+    action="store_true",
+)
+parser.add_argument(
+    "--store", help="Latent store directory", type=str, required=False, default=None
+)
+parser.add_argument(
+    "--opdir", help="Output directory", type=str, required=False, default=None
+)
+args = parser.parse_args()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+from specify import specification
+from utilities.latents import read_latents
+from utilities.sampling import sample_ensemble
+
+getModel = importlib.import_module(
+    "ML_models.%s.autoencoderModel" % args.model
+).getModel
+
+specification["strategy"] = tf.distribute.get_strategy()  # No distribution
+baseDir = "%s/MLES/%s" % (os.getenv("SCRATCH"), specification["modelName"])
+if args.store is None:
+    args.store = "%s/latents/Epoch_%04d" % (baseDir, args.epoch)
+if args.opdir is None:
+    args.opdir = "%s/ensembles/Epoch_%04d" % (baseDir, args.epoch)
+if not os.path.isdir(args.opdir):
+    os.makedirs(args.opdir)
+
+autoencoder = getModel(specification, epoch=args.epoch)
+if args.quantized:
+    from utilities.quantize import QuantizedModel
+
+    autoencoder = QuantizedModel(
+        "%s/quantized/Epoch_%04d/generator.tflite" % (baseDir, args.epoch),
+        model=autoencoder,
+    )
+mean, logvar, index = read_latents(args.store)
+
+for entry, (date, member) in enumerate(zip(index["dates"], index["members"])):
+    year = int(date[:4])
+    if (args.startyear is not None and year < args.startyear) or (
+        args.endyear is not None and year > args.endyear
+    ):
+        continue
+    start = time.time()
+    opfile = "%s/%s_%02d" % (args.opdir, date, member)
+    statistics = sample_ensemble(
+        autoencoder,
+        mean[entry],
+        logvar[entry],
+        args.samples,
+        file_name="%s_samples.npy" % opfile if args.fields else None,
+        quantiles=args.quantiles,
+        batch_size=args.batch,
+    )
+    np.savez("%s_stats.npz" % opfile, **statistics)
+    print("%s member %d: %.1fs" % (date, member, time.time() - start))
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+# Train several variants of a model at once, on the same data - for tuning
+#  parameters like beta, gamma, latentDimension, and maxGradient.
+# The data are read once: each batch is used to train all the variants, and
+#  each metrics batch to evaluate them all. So the reading and decoding cost
+#  is paid once for the whole sweep, not once for each variant.
+
+# The variants are a JSON list of specification overrides, e.g.
+#  [{"beta": 0.001}, {"beta": 0.01}, {"beta": 0.01, "maxGradient": 2}]
+# Run from the model directory (it uses the specify.py there), e.g.
+#  ../sweep.py --model=all_convolutional --variants=sweep.json
+
+# Poor variants are stopped early: after 'warmup' epochs, any variant whose
+#  test loss is worse than the best variant's by more than ('cull' - 1) times
+#  the size of the best loss (so 'cull' times the best, for a positive best),
+#  or (if 'patience' is set) which has not improved its own best test loss
+#  for that many metric updates.
+# Each variant saves weights and logs as modelName_sweep_NN (so the usual
+#  plotting and validation scripts work on it).
+
+import os
+import sys
+import json
+import time
+import shutil
+import importlib
+import tensorflow as tf
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--model",
+    help="Model architecture",
+    type=str,
+    required=False,
+    default="all_convolutional",
+    choices=("all_convolutional", "base_model"),
+)
+parser.add_argument(
+    "--variants", help="JSON file of specification overrides", type=str, required=True
+)
+parser.add_argument(
+    "--cull",
+    help="Stop variants with test loss more than this times the best (if positive)",
+    type=float,
+    required=False,
+    default=1.5,
+)
+parser.add_argument(
+    "--warmup",
+    help="No. of epochs before stopping any variants",
+    type=int,
+    required=False,
+    default=10,
+)
+parser.add_argument(
+    "--patience",
+    help="Stop variants not improving for this many metric updates",
+    type=int,
+    required=False,
+    default=None,
+)
+args = parser.parse_args()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+from specify import specification
+from utilities.distribute import is_chief, worker_dir
+
+getDataset = importlib.import_module("ML_models.%s.makeDataset" % args.model).getDataset
+getModel = importlib.import_module(
+    "ML_models.%s.autoencoderModel" % args.model
+).getModel
+
+# Specification keys used by the input pipeline - these are shared by all the
+#  variants, so can't be overridden.
+dataKeys = (
+    "inputTensors",
+    "outputTensors",
+    "tensorFormat",
+    "normalizeOnTheFly",
+    "resolution",
+    "region",
+    "chunked",
+    "patchSize",
+    "patchesPerMonth",
+    "startYear",
+    "endYear",
+    "testSplit",
+    "maxTrainingMonths",
+    "maxTestMonths",
+    "maxEnsembleCombinations",
+    "correlatedEnsembles",
+    "nMonthsInEpoch",
+    "epochWeights",
+    "nEpochs",
+    "shuffleBufferSize",
+    "batchSize",
+    "printInterval",
+    "strategy",
+    "trainCache",
+    "testCache",
+    "trainingMask",
+)
+
+with open(args.variants, "r") as f:
+    overrides = json.load(f)
+
+# A specification for each variant - with its own name and optimizer
+variants = []
+for vi, override in enumerate(overrides):
+    for key in override:
+        if key not in specification:
+            raise ValueError("Variant %d: unknown specification key %s" % (vi, key))
+        if key in dataKeys:
+            raise ValueError("Variant %d: %s is shared by all variants" % (vi, key))
+    variant = dict(specification)
+    variant.update(override)
+    variant["modelName"] = "%s_sweep_%02d" % (specification["modelName"], vi)
+    variant["optimizer"] = specification["optimizer"].__class__.from_config(
+        specification["optimizer"].get_config()
+    )
+    variants.append(variant)
+
+
+# Make a distributed dataset - as in autoencoder.py
+def distributeDataset(purpose, sampled=False, shuffle=True):
+    def datasetFn(inputContext):
+        data = getDataset(
+            specification, purpose=purpose, sampled=sampled, inputContext=inputContext
+        )
+        if shuffle:
+            data = data.shuffle(specification["shuffleBufferSize"])
+        return data.batch(
+            inputContext.get_per_replica_batch_size(specification["batchSize"])
+        )
+
+    return specification["strategy"].distribute_datasets_from_function(datasetFn)
+
+
+# Log directory for a variant
+def logDir(variant):
+    return "%s/MLES/%s/logs/Training" % (os.getenv("SCRATCH"), variant["modelName"])
+
+
+# Variants whose test loss is too far above the best
+# The margin is relative to the size of the best loss - which can be zero or
+#  negative (with the KL and regularization terms), so no simple ratio. With a
+#  best loss of exactly zero there is no scale, so none are culled.
+def toCull(losses, cull):
+    best = min(losses.values())
+    if best == 0:
+        return []
+    return [vi for vi in losses if losses[vi] > best + (cull - 1) * abs(best)]
+
+
+with specification["strategy"].scope():
+    trainingData = distributeDataset("Train", sampled=True)
+    validationData = distributeDataset("Train", shuffle=False)
+    testData = distributeDataset("Test")
+
+    models = [getModel(variant) for variant in variants]
+
+    chief = is_chief()
+    if chief:
+        logfile_writers = []
+        for variant in variants:
+            os.makedirs(logDir(variant), exist_ok=True)
+            logfile_writers.append(tf.summary.create_file_writer(logDir(variant)))
+            with logfile_writers[-1].as_default():
+                tf.summary.write("OutputNames", variant["outputNames"], step=0)
+
+    active = list(range(len(variants)))  # Variants still training
+    bestLoss = [float("inf")] * len(variants)  # Best test loss of each variant
+    sinceBest = [0] * len(variants)  # Metric updates since the best
+    stopped = {}  # Epoch each stopped variant stopped at
+
+    for epoch in range(1, specification["nEpochs"] + 1):
+        start_time = time.time()
+
+        # Train all the active variants on each batch
+        for batch in trainingData:
+            for vi in active:
+                specification["strategy"].run(
+                    models[vi].train_on_batch,
+                    args=(batch, variants[vi]["optimizer"]),
+                )
+
+        end_training_time = time.time()
+
+        if epoch % specification["printInterval"] != 0:
+            continue
+
+        # Metrics - each batch is used for all the active variants
+        for prefix, dataset in (("train", validationData), ("test", testData)):
+            for vi in active:
+                models[vi].zero_metrics(prefix)
+            batch_count = 0
+            for batch in dataset:
+                for vi in active:
+                    models[vi].accumulate_metrics(batch, prefix)
+                batch_count += 1
+            for vi in active:
+                models[vi].average_metrics(prefix, batch_count)
+
+        # Save the state of each variant
+        for vi in active:
+            save_dir = worker_dir(
+                "%s/MLES/%s/weights/Epoch_%04d"
+                % (os.getenv("SCRATCH"), variants[vi]["modelName"], epoch)
+            )
+            if not os.path.isdir(save_dir):
+                os.makedirs(save_dir)
+            models[vi].save_weights("%s/ckpt" % save_dir)
+            if not chief:
+                shutil.rmtree(save_dir)
+            else:
+                models[vi].updateLogfile(logfile_writers[vi], epoch)
+
+        # Early stopping
+        losses = {vi: float(models[vi].test_loss.numpy()) for vi in active}
+        for vi in active:
+            if losses[vi] < bestLoss[vi]:
+                bestLoss[vi] = losses[vi]
+                sinceBest[vi] = 0
+            else:
+                sinceBest[vi] += 1
+        if epoch >= args.warmup:
+            culled = toCull(losses, args.cull)
+            for vi in active:
+                if vi in culled or (
+                    args.patience is not None and sinceBest[vi] >= args.patience
+                ):
+                    stopped[vi] = epoch
+            active = [vi for vi in active if vi not in stopped]
+
+        # Report progress
+        if chief:
+            print(
+                "Epoch: %d  time: %d (+%d)"
+                % (
+                    epoch,
+                    int(end_training_time - start_time),
+                    int(time.time() - end_training_time),
+                )
+            )
+            for vi, override in enumerate(overrides):
+                if vi in losses:
+                    status = "stopped" if stopped.get(vi) == epoch else ""
+                    print(
+                        "%2d  test loss %10.3f  best %10.3f  %s %s"
+                        % (vi, losses[vi], bestLoss[vi], json.dumps(override), status)
+                    )
+        if len(active) == 0:
+            break
+
+# Final ranking, by best test loss
+if chief:
+    print("Variants by best test loss:")
+    for vi in sorted(range(len(variants)), key=lambda vi: bestLoss[vi]):
+        print(
+            "%2d  %10.3f  %s%s"
+            % (
+                vi,
+                bestLoss[vi],
+                json.dumps(overrides[vi]),
+                "  (stopped at epoch %d)" % stopped[vi] if vi in stopped else "",
+            )
+        )
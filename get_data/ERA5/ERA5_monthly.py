@@ -20,6 +20,26 @@ def add_coord_system(cbe):
     cbe.coord("longitude").coord_system = cs_ERA5
 
 
+# Name of the file containing a year of monthly data for a variable
+def file_name(variable="total_precipitation", year=None):
+    return "%s/ERA5/monthly/reanalysis/%04d/%s.nc" % (
+        os.getenv("SCRATCH"),
+        year,
+        variable,
+    )
+
+
+# Months (1-12) in a year's file for a variable - the current year's file has
+#  only the months available when it was downloaded. (Reads only the time
+#  coordinate.)
+def months_in_file(variable="total_precipitation", year=None):
+    fname = file_name(variable, year)
+    if not os.path.isfile(fname):
+        return set()
+    time = iris.load_cube(fname).coord("time")
+    return set(cell.point.month for cell in time.cells())
+
+
 def load(
     variable="total_precipitation", year=None, month=None, constraint=None, grid=None
 ):
@@ -30,11 +50,7 @@ def load(
         return varC
     if year is None or month is None:
         raise Exception("Year and month must be specified")
-    fname = "%s/ERA5/monthly/reanalysis/%04d/%s.nc" % (
-        os.getenv("SCRATCH"),
-        year,
-        variable,
-    )
+    fname = file_name(variable, year)
     if not os.path.isfile(fname):
         raise Exception("No data file %s" % fname)
     ftt = iris.Constraint(time=lambda cell: cell.point.month == month)
@@ -49,5 +65,3 @@ def load(
     if constraint is not None:
         varC = varC.extract(constraint)
     return varC
-
-
@@ -8,6 +8,12 @@ import argparse
 parser = argparse.ArgumentParser()
 parser.add_argument("--startyear", type=int, required=False, default=1940)
 parser.add_argument("--endyear", type=int, required=False, default=2023)
+parser.add_argument(
+    "--refresh",
+    help="Get the last year again, even if already present (to add new months)",
+    default=False,
+    action="store_true",
+)
 args = parser.parse_args()
 
 for year in range(args.startyear, args.endyear + 1):
@@ -22,7 +28,7 @@ for year in range(args.startyear, args.endyear + 1):
             year,
             var,
         )
-        if not os.path.isfile(opfile):
+        if not os.path.isfile(opfile) or (args.refresh and year == args.endyear):
             print(
                 ("./get_year_of_monthlies_from_ERA5.py --year=%d --variable=%s")
                 % (
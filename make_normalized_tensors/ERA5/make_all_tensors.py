@@ -1,10 +1,15 @@
 #!/usr/bin/env python
 
 # Make normalized tensors
+# Only tensors that are missing, or whose data or normalization fit have
+#  changed since they were made, are remade (see utilities/manifest.py).
 
 import os
 import argparse
 
+from tensor_utils import normalized_file_name, normalized_inputs, normalized_version
+from utilities import manifest
+
 sDir = os.path.dirname(os.path.realpath(__file__))
 
 parser = argparse.ArgumentParser()
@@ -14,29 +19,59 @@ parser.add_argument(
     type=str,
     required=True,
 )
+parser.add_argument(
+    "--format",
+    help="Storage format (float32, float16, or uint16)",
+    type=str,
+    required=False,
+    default="float32",
+)
+parser.add_argument(
+    "--chunked",
+    help="Make compressed, chunked stores (float32 only)",
+    default=False,
+    action="store_true",
+)
+parser.add_argument(
+    "--startyear", help="First year", type=int, required=False, default=1950
+)
+parser.add_argument(
+    "--endyear", help="Last year", type=int, required=False, default=2023
+)
+parser.add_argument(
+    "--adopt",
+    help="Record existing tensors as up to date (don't remake them)",
+    default=False,
+    action="store_true",
+)
 args = parser.parse_args()
 
 
-def is_done(year, month, variable):
-    fn = "%s/MLP/normalized_datasets/ERA5_tf_MM/%s/%04d-%02d.tfd" % (
-        os.getenv("SCRATCH"),
-        variable,
-        year,
-        month,
-    )
-    if os.path.exists(fn):
-        return True
-    return False
+def is_done(year, month, variable, format, chunked=False):
+    fn = normalized_file_name(year, month, variable, format, chunked)
+    inputs = normalized_inputs(year, month, variable)
+    if not os.path.exists(inputs[0]):
+        return True  # No source data - nothing to do
+    version = "%s:%s" % (normalized_version, format)
+    if args.adopt and os.path.exists(fn):
+        manifest.record(fn, inputs, version)
+    return manifest.is_current(fn, inputs, version)
 
 
-for year in range(1950, 2024):
+for year in range(args.startyear, args.endyear + 1):
     for month in range(1, 13):
-        if is_done(year, month, args.variable):
+        if is_done(year, month, args.variable, args.format, args.chunked):
             continue
-        cmd = "%s/make_training_tensor.py --year=%04d --month=%02d --variable=%s" % (
-            sDir,
-            year,
-            month,
-            args.variable,
+        cmd = (
+            "%s/make_training_tensor.py --year=%04d --month=%02d --variable=%s --format=%s"
+            % (
+                sDir,
+                year,
+                month,
+                args.variable,
+                args.format,
+            )
         )
+        if args.chunked:
+            cmd += " --chunked"
         print(cmd)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+# Make lower resolution (0.5, 1, and 2 degree) copies of the normalized
+#  tensors for a variable - for fast prototyping of models.
+# Uses mask-aware averaging (see utilities/pyramid.py).
+# Only months that are missing, or whose full resolution tensor has changed,
+#  are remade (see utilities/manifest.py).
+
+import os
+import tensorflow as tf
+
+from tensor_utils import load_tensor, dataset_name
+from utilities.packing import serialize_tensor, formats
+from utilities.pyramid import resolutions, level_name, downsample
+from utilities import manifest
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--variable", help="Variable name", type=str, required=True)
+parser.add_argument(
+    "--format",
+    help="Storage format (float32, float16, or uint16)",
+    type=str,
+    required=False,
+    default="float32",
+    choices=formats,
+)
+args = parser.parse_args()
+
+# Version of the downsampling method - change this to force a rebuild
+pyramid_version = "1"
+
+ipdir = "%s/MLP/normalized_datasets/%s/%s" % (
+    os.getenv("SCRATCH"),
+    dataset_name(args.format),
+    args.variable,
+)
+opdirs = {}
+for resolution in resolutions[1:]:
+    opdirs[resolution] = "%s/MLP/normalized_datasets/%s/%s" % (
+        os.getenv("SCRATCH"),
+        level_name(dataset_name(args.format), resolution),
+        args.variable,
+    )
+    if not os.path.isdir(opdirs[resolution]):
+        os.makedirs(opdirs[resolution])
+
+for fn in sorted(os.listdir(ipdir)):
+    ifn = "%s/%s" % (ipdir, fn)
+    todo = [
+        resolution
+        for resolution in opdirs
+        if not manifest.is_current(
+            "%s/%s" % (opdirs[resolution], fn), [ifn], pyramid_version
+        )
+    ]
+    if len(todo) == 0:
+        continue
+    field = tf.reshape(load_tensor(ifn, args.format), [721, 1440, 1])
+    valid = tf.where(field != 0.0, 1.0, 0.0)
+    for resolution in todo:
+        ofn = "%s/%s" % (opdirs[resolution], fn)
+        coarse = downsample(field, valid, resolution)[0]
+        tf.io.write_file(ofn, serialize_tensor(tf.squeeze(coarse, -1), args.format))
+        manifest.record(ofn, [ifn], pyramid_version)
@@ -13,7 +13,16 @@ import dask
 tf.config.threading.set_inter_op_parallelism_threads(1)
 dask.config.set(scheduler="single-threaded")
 
-from tensor_utils import load_raw, raw_to_tensor
+from tensor_utils import (
+    load_raw,
+    raw_to_tensor,
+    normalized_file_name,
+    normalized_inputs,
+    normalized_version,
+)
+from utilities.packing import serialize_tensor, formats
+from utilities.chunks import write_chunked
+from utilities import manifest
 
 import argparse
 
@@ -21,16 +30,29 @@ parser = argparse.ArgumentParser()
 parser.add_argument("--year", help="Year", type=int, required=True)
 parser.add_argument("--month", help="Integer month", type=int, required=True)
 parser.add_argument("--variable", help="Variable name", type=str, required=True)
+parser.add_argument(
+    "--format",
+    help="Storage format (float32, float16, or uint16)",
+    type=str,
+    required=False,
+    default="float32",
+    choices=formats,
+)
+parser.add_argument(
+    "--chunked",
+    help="Write a compressed, chunked store (float32 only)",
+    default=False,
+    action="store_true",
+)
 parser.add_argument(
     "--opfile", help="tf data file name", default=None, type=str, required=False
 )
 args = parser.parse_args()
+if args.chunked and args.format != "float32":
+    raise ValueError("Chunked stores are float32 only")
 if args.opfile is None:
-    args.opfile = ("%s/MLP/normalized_datasets/ERA5_tf_MM/%s/%04d-%02d.tfd") % (
-        os.getenv("SCRATCH"),
-        args.variable,
-        args.year,
-        args.month,
+    args.opfile = normalized_file_name(
+        args.year, args.month, args.variable, args.format, args.chunked
     )
 
 if not os.path.isdir(os.path.dirname(args.opfile)):
@@ -41,6 +63,16 @@ qd = load_raw(args.year, args.month, args.variable)
 ict = raw_to_tensor(qd, args.variable, args.month)
 tf.debugging.check_numerics(ict, "Bad data %04d-%02d" % (args.year, args.month))
 
-# Write to file
-sict = tf.io.serialize_tensor(ict)
-tf.io.write_file(args.opfile, sict)
+# Write to file (or directory of chunks)
+if args.chunked:
+    write_chunked(ict.numpy(), args.opfile)
+else:
+    sict = serialize_tensor(ict, args.format)
+    tf.io.write_file(args.opfile, sict)
+
+# Record what it was made from
+manifest.record(
+    args.opfile,
+    normalized_inputs(args.year, args.month, args.variable),
+    "%s:%s" % (normalized_version, args.format),
+)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+# Make bit-packed validity masks for a set of normalized tensors.
+# Missing data is stored in the tensors as exactly 0.0 - this script
+#  extracts that into a separate mask store, so models can use the mask
+#  directly instead of rebuilding it from the data for every batch.
+# Masks are time-invariant where possible: the most common mask is stored
+#  once (static.tfd), and only months with a different mask get their own file.
+# An index (months.json) lists every month covered, and which mask it uses -
+#  the model loaders fail on a month that isn't in it. The index is recorded
+#  in the manifest (see utilities/manifest.py), and a re-run only makes masks
+#  for months that are new, or whose tensor has changed. The static mask is
+#  chosen when the store is first made, and kept after that.
+
+import os
+import sys
+import json
+import hashlib
+import tensorflow as tf
+
+from tensor_utils import load_tensor, dataset_name
+from utilities.packing import serialize_mask, formats
+from utilities.pyramid import resolutions, level_name
+from utilities import manifest
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--variable", help="Variable name", type=str, required=True)
+parser.add_argument(
+    "--format",
+    help="Storage format (float32, float16, or uint16)",
+    type=str,
+    required=False,
+    default="float32",
+    choices=formats,
+)
+parser.add_argument(
+    "--resolution",
+    help="Grid resolution (degrees) - for lower resolution copies",
+    type=float,
+    required=False,
+    default=0.25,
+    choices=resolutions,
+)
+args = parser.parse_args()
+
+ipdir = "%s/MLP/normalized_datasets/%s/%s" % (
+    os.getenv("SCRATCH"),
+    level_name(dataset_name(args.format), args.resolution),
+    args.variable,
+)
+opdir = "%s_mask" % ipdir
+if not os.path.isdir(opdir):
+    os.makedirs(opdir)
+
+# Version of the mask method - change this to force a rebuild
+mask_version = "1"
+
+index_file = "%s/months.json" % opdir
+months = sorted(fn for fn in os.listdir(ipdir) if not fn.endswith(".tmp"))
+inputs = ["%s/%s" % (ipdir, fn) for fn in months]
+if len(months) == 0:
+    sys.exit("No tensors in %s" % ipdir)
+if manifest.is_current(index_file, inputs, mask_version):
+    print("%s: %d months, up to date" % (args.variable, len(months)))
+    sys.exit(0)
+
+# The previous index, and the tensors it was made from (if any)
+old_index = {"static": None, "months": {}}
+old_inputs = {}
+record = manifest.load_record(index_file)
+if (
+    os.path.exists(index_file)
+    and record is not None
+    and record["version"] == mask_version
+):
+    with open(index_file, "r") as f:
+        old_index = json.load(f)
+    old_inputs = record["inputs"]
+
+
+# Is a month's mask in the previous index, and its tensor unchanged?
+def unchanged(fn):
+    ifn = os.path.abspath("%s/%s" % (ipdir, fn))
+    if fn not in old_index["months"] or ifn not in old_inputs:
+        return False
+    size, mtime = manifest.file_stat(ifn)
+    old = old_inputs[ifn]
+    if size != old["size"]:
+        return False
+    return mtime == old["mtime"] or manifest.file_hash(ifn) == old["sha256"]
+
+
+# Get the mask for each new or changed month, and count how often each
+#  mask occurs
+masks = {}
+counts = {}
+for fn in months:
+    if unchanged(fn):
+        masks[fn] = (old_index["months"][fn]["key"], None)
+        continue
+    valid = load_tensor("%s/%s" % (ipdir, fn), args.format).numpy() != 0.0
+    smask = serialize_mask(valid)
+    key = hashlib.sha1(smask.numpy()).hexdigest()
+    masks[fn] = (key, smask)
+    counts[key] = counts.get(key, 0) + 1
+
+# Most common mask is the static one (when the store is first made)
+static = old_index["static"]
+if static is None:
+    static = max(counts, key=counts.get)
+    for fn in masks:
+        if masks[fn][0] == static:
+            tf.io.write_file("%s/static.tfd" % opdir, masks[fn][1])
+            break
+
+# Other months get their own mask (remove any out-of-date ones)
+made = 0
+for fn in masks:
+    if masks[fn][1] is None:
+        continue  # Unchanged
+    made += 1
+    mfn = "%s/%s" % (opdir, fn)
+    if masks[fn][0] == static:
+        if os.path.exists(mfn):
+            os.remove(mfn)
+    else:
+        tf.io.write_file(mfn, masks[fn][1])
+for fn in old_index["months"]:
+    if fn not in masks and os.path.exists("%s/%s" % (opdir, fn)):
+        os.remove("%s/%s" % (opdir, fn))  # Tensor has gone
+
+# Index, and its record
+index = {
+    "static": static,
+    "months": {
+        fn: {"key": key, "file": "static.tfd" if key == static else fn}
+        for fn, (key, smask) in masks.items()
+    },
+}
+with open("%s.tmp" % index_file, "w") as f:
+    json.dump(index, f, indent=1)
+os.replace("%s.tmp" % index_file, index_file)
+manifest.record(index_file, inputs, mask_version)
+
+print(
+    "%s: %d months (%d made), %d with their own mask"
+    % (
+        args.variable,
+        len(masks),
+        made,
+        sum(1 for fn in masks if masks[fn][0] != static),
+    )
+)
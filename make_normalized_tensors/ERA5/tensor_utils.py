@@ -1,15 +1,60 @@
 # Utility functions for creating and manipulating normalized tensors
 
+import os
 import tensorflow as tf
 import numpy as np
 
 from get_data.ERA5 import ERA5_monthly
 from utilities import grids
+from utilities.packing import parse_tensor
 from normalize.ERA5.normalize import (
     normalize_cube,
     unnormalize_cube,
     load_fitted,
+    fitted_file_names,
 )
+from make_raw_tensors.ERA5.tensor_utils import raw_file_name
+
+# Version of the normalized tensor method - change this to force a rebuild
+#  (see utilities/manifest.py)
+normalized_version = "1"
+
+
+# Name of the dataset directory for each storage format
+#  (compact formats go in their own directory)
+def dataset_name(format="float32"):
+    if format == "float32":
+        return "ERA5_tf_MM"
+    return "ERA5_tf_MM_%s" % format
+
+
+# File name for a normalized tensor (directory name for a chunked store)
+def normalized_file_name(year, month, variable, format="float32", chunked=False):
+    if chunked:
+        return "%s/MLP/normalized_datasets/%s_chunked/%s/%04d-%02d" % (
+            os.getenv("SCRATCH"),
+            dataset_name(format),
+            variable,
+            year,
+            month,
+        )
+    return "%s/MLP/normalized_datasets/%s/%s/%04d-%02d.tfd" % (
+        os.getenv("SCRATCH"),
+        dataset_name(format),
+        variable,
+        year,
+        month,
+    )
+
+
+# Files a normalized tensor depends on: the month's data, and the fit.
+# The raw tensor stands in for the month's data (it is remade only if that
+#  month changes); the source file is used if there is no raw tensor.
+def normalized_inputs(year, month, variable):
+    data = raw_file_name(year, month, variable)
+    if not os.path.exists(data):
+        data = ERA5_monthly.file_name(variable, year)
+    return [data] + fitted_file_names(month, variable)
 
 
 # Load the data for 1 month
@@ -48,3 +93,9 @@ def tensor_to_raw(tensor, variable, month):
     raw = unnormalize_cube(cube, shape, location, scale)
     raw.data.data[raw.data.mask == True] = 0.0
     return raw
+
+
+# Load a stored normalized tensor (any format) as float32
+def load_tensor(file_name, format="float32"):
+    sict = tf.io.read_file(file_name)
+    return parse_tensor(sict, format)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+# Compare the chunked, compressed store with the original serialised tensors.
+# For synthetic fields (and, optionally, a real raw tensor) reports:
+#  size on disc, full-field decode throughput, and the time to read a
+#  regional window (a band of latitudes).
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+import tensorflow as tf
+
+from utilities.chunks import write_chunked, read_chunked
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--variable",
+    help="Also benchmark this variable's raw tensor",
+    type=str,
+    required=False,
+    default=None,
+)
+parser.add_argument("--year", help="Year", type=int, required=False, default=2020)
+parser.add_argument("--month", help="Month", type=int, required=False, default=3)
+parser.add_argument(
+    "--repeats", help="Decodes to time", type=int, required=False, default=20
+)
+parser.add_argument(
+    "--min_row", help="First row of window", type=int, required=False, default=480
+)
+parser.add_argument(
+    "--max_row", help="Last row of window", type=int, required=False, default=560
+)
+args = parser.parse_args()
+
+rng = np.random.default_rng(12345)
+
+# Synthetic test fields - on the standard (721x1440) grid
+lats = np.linspace(-90, 90, 721)[:, None]
+lons = np.linspace(-180, 180, 1440, endpoint=False)[None, :]
+smooth = 280 + 30 * np.cos(np.radians(lats)) + 2 * np.sin(np.radians(lons) * 3)
+land = (np.sin(np.radians(lons) * 2) + np.cos(np.radians(lats) * 3)) > 0.5
+fields = {}
+# SST-like: smooth, with NaN over 'land'
+fields["SST-like"] = np.where(land, np.nan, smooth + rng.normal(0, 0.5, smooth.shape))
+# Precip-like: gamma distributed, zero in 'deserts'
+fields["Precip-like"] = np.where(
+    np.abs(lats) < 30,
+    np.where(land, 0.0, rng.gamma(0.5, 1.0e-4, smooth.shape)),
+    rng.gamma(2.0, 1.0e-4, smooth.shape),
+)
+# Worst case - noise compresses badly
+fields["Noise"] = rng.normal(0, 1, smooth.shape)
+
+# A real field, if requested
+if args.variable is not None:
+    fn = "%s/MLP/raw_datasets/ERA5/%s/%04d-%02d.tfd" % (
+        os.getenv("SCRATCH"),
+        args.variable,
+        args.year,
+        args.month,
+    )
+    real = tf.io.parse_tensor(tf.io.read_file(fn), np.float32)
+    fields[args.variable] = np.reshape(real.numpy(), [721, 1440])
+
+
+# Decode functions to time - compiled, as they would be in a tf.data map
+@tf.function
+def decode_tfd(fn):
+    return tf.reshape(tf.io.parse_tensor(tf.io.read_file(fn), np.float32), [721, 1440])
+
+
+@tf.function
+def decode_chunked(dn):
+    return read_chunked(dn)
+
+
+@tf.function
+def window_tfd(fn):
+    return decode_tfd(fn)[args.min_row : args.max_row, :]
+
+
+@tf.function
+def window_chunked(dn):
+    return read_chunked(dn, first_row=args.min_row, last_row=args.max_row)
+
+
+def time_decode(fn, decoder):
+    decoder(tf.constant(fn))  # Trace
+    start = time.time()
+    for i in range(args.repeats):
+        decoder(tf.constant(fn))
+    return (time.time() - start) / args.repeats
+
+
+def store_size(name):
+    if os.path.isdir(name):
+        return sum(os.path.getsize("%s/%s" % (name, f)) for f in os.listdir(name))
+    return os.path.getsize(name)
+
+
+tmpdir = tempfile.mkdtemp()
+print(
+    "{:<20s} {:>10s} {:>10s} {:>6s} {:>10s} {:>10s} {:>10s} {:>10s}".format(
+        "Field",
+        "tfd (MB)",
+        "chunk (MB)",
+        "ratio",
+        "tfd (ms)",
+        "chunk (ms)",
+        "tfd win",
+        "chunk win",
+    )
+)
+for name, field in fields.items():
+    field = field.astype(np.float32)
+    tfd = "%s/%s.tfd" % (tmpdir, name)
+    tf.io.write_file(tfd, tf.io.serialize_tensor(tf.convert_to_tensor(field)))
+    chunked = "%s/%s" % (tmpdir, name)
+    write_chunked(field, chunked)
+    # Check the round trip
+    if not np.array_equal(
+        decode_chunked(tf.constant(chunked)).numpy().squeeze(), field, equal_nan=True
+    ):
+        raise Exception("Chunked store does not reproduce %s" % name)
+    print(
+        "{:<20s} {:>10.2f} {:>10.2f} {:>6.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+            name,
+            store_size(tfd) / 1.0e6,
+            store_size(chunked) / 1.0e6,
+            store_size(tfd) / store_size(chunked),
+            time_decode(tfd, decode_tfd) * 1000,
+            time_decode(chunked, decode_chunked) * 1000,
+            time_decode(tfd, window_tfd) * 1000,
+            time_decode(chunked, window_chunked) * 1000,
+        )
+    )
+shutil.rmtree(tmpdir)
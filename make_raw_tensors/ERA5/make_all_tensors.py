@@ -1,10 +1,17 @@
 #!/usr/bin/env python
 
 # Make raw data tensors for normalization
+# Only tensors that are missing, or whose source file has changed since they
+#  were made, are remade (see utilities/manifest.py). Months not in the source
+#  file (yet) are skipped.
 
 import os
 import argparse
 
+from tensor_utils import raw_file_name, raw_inputs, raw_version
+from get_data.ERA5 import ERA5_monthly
+from utilities import manifest
+
 sDir = os.path.dirname(os.path.realpath(__file__))
 
 parser = argparse.ArgumentParser()
@@ -14,25 +21,45 @@ parser.add_argument(
     type=str,
     required=True,
 )
+parser.add_argument(
+    "--chunked",
+    help="Make compressed, chunked stores (not .tfd files)",
+    default=False,
+    action="store_true",
+)
+parser.add_argument(
+    "--startyear", help="First year", type=int, required=False, default=1940
+)
+parser.add_argument(
+    "--endyear", help="Last year", type=int, required=False, default=2021
+)
+parser.add_argument(
+    "--adopt",
+    help="Record existing tensors as up to date (don't remake them)",
+    default=False,
+    action="store_true",
+)
 args = parser.parse_args()
 
 
-def is_done(year, month, variable):
-    fn = "%s/MLP/raw_datasets/ERA5/%s/%04d-%02d.tfd" % (
-        os.getenv("SCRATCH"),
-        variable,
-        year,
-        month,
-    )
-    if os.path.exists(fn):
-        return True
-    return False
+def is_done(year, month, variable, chunked=False):
+    fn = raw_file_name(year, month, variable, chunked)
+    inputs = raw_inputs(year, month, variable)
+    if not os.path.exists(inputs[0]):
+        return True  # No source data - nothing to do
+    if args.adopt and os.path.exists(fn):
+        manifest.record(fn, inputs, raw_version)
+    return manifest.is_current(fn, inputs, raw_version)
 
 
-count = 0
-for year in range(1940, 2022):
+for year in range(args.startyear, args.endyear + 1):
+    available = None  # Months in the source file - only looked at if needed
     for month in range(1, 13):
-        if is_done(year, month, args.variable):
+        if is_done(year, month, args.variable, args.chunked):
+            continue
+        if available is None:
+            available = ERA5_monthly.months_in_file(args.variable, year)
+        if month not in available:
             continue
         cmd = "%s/make_training_tensor.py --year=%04d --month=%02d --variable=%s" % (
             sDir,
@@ -40,4 +67,6 @@ for year in range(1940, 2022):
             month,
             args.variable,
         )
+        if args.chunked:
+            cmd += " --chunked"
         print(cmd)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+# Make a time-major ('pencil') store from the raw tensors for a variable
+#  - for fast access to all the months at a few points, or a small region.
+# See utilities/pencils.py
+
+import os
+import numpy as np
+import tensorflow as tf
+
+from utilities.pencils import create_store, write_months
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--variable", help="Variable name", type=str, required=True)
+parser.add_argument(
+    "--startyear", help="Start Year", type=int, required=False, default=1940
+)
+parser.add_argument(
+    "--endyear", help="End Year", type=int, required=False, default=2050
+)
+parser.add_argument(
+    "--batch",
+    help="Months to transpose at once (each is 4MB)",
+    type=int,
+    required=False,
+    default=120,
+)
+parser.add_argument(
+    "--opdir", help="Store directory", default=None, type=str, required=False
+)
+args = parser.parse_args()
+if args.opdir is None:
+    args.opdir = "%s/MLP/raw_datasets/ERA5_pencils/%s" % (
+        os.getenv("SCRATCH"),
+        args.variable,
+    )
+
+# Raw tensors to use
+idir = "%s/MLP/raw_datasets/ERA5/%s" % (os.getenv("SCRATCH"), args.variable)
+files = sorted(
+    fn
+    for fn in os.listdir(idir)
+    if fn.endswith(".tfd") and args.startyear <= int(fn[:4]) <= args.endyear
+)
+dates = [fn[:7] for fn in files]
+
+create_store(args.opdir, dates)
+for first in range(0, len(files), args.batch):
+    fields = np.stack(
+        [
+            np.reshape(
+                tf.io.parse_tensor(
+                    tf.io.read_file("%s/%s" % (idir, fn)), np.float32
+                ).numpy(),
+                [721, 1440],
+            )
+            for fn in files[first : first + args.batch]
+        ]
+    )
+    write_months(args.opdir, first, fields)
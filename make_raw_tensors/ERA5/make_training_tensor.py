@@ -6,6 +6,7 @@
 
 import os
 import sys
+import numpy as np
 import tensorflow as tf
 import dask
 
@@ -13,7 +14,9 @@ import dask
 tf.config.threading.set_inter_op_parallelism_threads(1)
 dask.config.set(scheduler="single-threaded")
 
-from tensor_utils import load_raw, raw_to_tensor
+from tensor_utils import load_raw, raw_to_tensor, raw_file_name, raw_inputs, raw_version
+from utilities.chunks import write_chunked, read_chunked_numpy
+from utilities import manifest
 
 import argparse
 
@@ -21,17 +24,18 @@ parser = argparse.ArgumentParser()
 parser.add_argument("--year", help="Year", type=int, required=True)
 parser.add_argument("--month", help="Integer month", type=int, required=True)
 parser.add_argument("--variable", help="Variable name", type=str, required=True)
+parser.add_argument(
+    "--chunked",
+    help="Write a compressed, chunked store (not a .tfd file)",
+    default=False,
+    action="store_true",
+)
 parser.add_argument(
     "--opfile", help="tf data file name", default=None, type=str, required=False
 )
 args = parser.parse_args()
 if args.opfile is None:
-    args.opfile = ("%s/MLP/raw_datasets/ERA5/%s/%04d-%02d.tfd") % (
-        os.getenv("SCRATCH"),
-        args.variable,
-        args.year,
-        args.month,
-    )
+    args.opfile = raw_file_name(args.year, args.month, args.variable, args.chunked)
 
 if not os.path.isdir(os.path.dirname(args.opfile)):
     os.makedirs(os.path.dirname(args.opfile))
@@ -40,6 +44,24 @@ if not os.path.isdir(os.path.dirname(args.opfile)):
 qd = load_raw(args.year, args.month, variable=args.variable)
 ict = raw_to_tensor(qd)
 
-# Write to file
-sict = tf.io.serialize_tensor(ict)
-tf.io.write_file(args.opfile, sict)
+# Write to file (or directory of chunks)
+# If the source file has been replaced, but this month's data are unchanged,
+#  leave the existing output alone - so nothing downstream needs redoing.
+if args.chunked:
+    if not (
+        os.path.isdir(args.opfile)
+        and np.array_equal(read_chunked_numpy(args.opfile), ict.numpy(), equal_nan=True)
+    ):
+        write_chunked(ict.numpy(), args.opfile)
+else:
+    sict = tf.io.serialize_tensor(ict)
+    if not (
+        os.path.isfile(args.opfile)
+        and tf.io.read_file(args.opfile).numpy() == sict.numpy()
+    ):
+        tf.io.write_file(args.opfile, sict)
+
+# Record what it was made from
+manifest.record(
+    args.opfile, raw_inputs(args.year, args.month, args.variable), raw_version
+)
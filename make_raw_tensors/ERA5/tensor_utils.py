@@ -1,11 +1,38 @@
 # Utility functions for creating and manipulating raw tensors
 
+import os
 import numpy as np
 import tensorflow as tf
 
 from get_data.ERA5 import ERA5_monthly
 from utilities import grids
 
+# Version of the raw tensor method - change this to force a rebuild
+#  (see utilities/manifest.py)
+raw_version = "1"
+
+
+# File name for a raw tensor (directory name for a chunked store)
+def raw_file_name(year, month, variable, chunked=False):
+    if chunked:
+        return "%s/MLP/raw_datasets/ERA5_chunked/%s/%04d-%02d" % (
+            os.getenv("SCRATCH"),
+            variable,
+            year,
+            month,
+        )
+    return "%s/MLP/raw_datasets/ERA5/%s/%04d-%02d.tfd" % (
+        os.getenv("SCRATCH"),
+        variable,
+        year,
+        month,
+    )
+
+
+# Files a raw tensor is made from
+def raw_inputs(year, month, variable):
+    return [ERA5_monthly.file_name(variable, year)]
+
 
 # Load the data for 1 month (on the standard cube).
 def load_raw(year, month, member=None, variable="total_precipitation"):
@@ -9,7 +9,9 @@ from utilities import grids
 import numpy as np
 import tensorflow as tf
 
-from makeDataset import getDataset
+from makeDataset import getDataset, getFitInputs
+from normalize import fit_version
+from utilities import manifest
 
 import argparse
 
@@ -22,6 +24,12 @@ parser.add_argument(
 parser.add_argument(
     "--endyear", help="End Year", type=int, required=False, default=2050
 )
+parser.add_argument(
+    "--chunked",
+    help="Read raw data from the chunked store",
+    default=False,
+    action="store_true",
+)
 
 parser.add_argument(
     "--opdir",
@@ -29,6 +37,13 @@ parser.add_argument(
     default="%s/MLP/normalization/SPI_monthly/ERA5_tf_MM" % os.getenv("SCRATCH"),
 )
 args = parser.parse_args()
+inputs = getFitInputs(
+    args.variable,
+    args.month,
+    startyear=args.startyear,
+    endyear=args.endyear,
+    chunked=args.chunked,
+)
 opdir = "%s/%s" % (args.opdir, args.variable)
 if not os.path.isdir(opdir):
     os.makedirs(opdir, exist_ok=True)
@@ -41,6 +56,7 @@ trainingData = getDataset(
     endyear=args.endyear,
     cache=False,
     blur=1.0e-9,
+    chunked=args.chunked,
 ).batch(1)
 mean = tf.zeros([1, 721, 1440, 1], dtype=tf.float32)
 count = tf.zeros([1, 721, 1440, 1], dtype=tf.float32)
@@ -124,3 +140,11 @@ iris.save(
     scale,
     "%s/%s/scale_m%02d.nc" % (args.opdir, args.variable, args.month),
 )
+
+# Record what the fit was made from, so it's only redone if they change
+for parameter in ("shape", "location", "scale"):
+    manifest.record(
+        "%s/%s/%s_m%02d.nc" % (args.opdir, args.variable, parameter, args.month),
+        inputs,
+        "%s:%d-%d" % (fit_version, args.startyear, args.endyear),
+    )
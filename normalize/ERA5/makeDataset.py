@@ -5,6 +5,8 @@ import sys
 import tensorflow as tf
 import numpy as np
 
+from utilities.chunks import read_chunked
+
 
 # Load a pre-prepared tensor from a file
 def load_tensor(file_name):
@@ -14,10 +16,20 @@ def load_tensor(file_name):
     return imt
 
 
+# Directory containing the tensors for a variable
+def getDataDir(variable, chunked=False):
+    if chunked:
+        return "%s/MLP/raw_datasets/ERA5_chunked/%s" % (os.getenv("SCRATCH"), variable)
+    return "%s/MLP/raw_datasets/ERA5/%s" % (os.getenv("SCRATCH"), variable)
+
+
 # Get a list of filenames containing tensors
-def getFileNames(variable, startyear=1850, endyear=2050):
+#  (directory names for chunked stores)
+def getFileNames(variable, startyear=1850, endyear=2050, chunked=False):
     inFiles = sorted(
-        os.listdir("%s/MLP/raw_datasets/ERA5/%s" % (os.getenv("SCRATCH"), variable))
+        fn
+        for fn in os.listdir(getDataDir(variable, chunked=chunked))
+        if not fn.endswith(".tmp")
     )
     inFiles = [
         fn for fn in inFiles if (int(fn[:4]) >= startyear and int(fn[:4]) <= endyear)
@@ -25,21 +37,42 @@ def getFileNames(variable, startyear=1850, endyear=2050):
     return inFiles
 
 
+# Files used to fit a calendar month (that month and the months either side)
+def getFitInputs(variable, month, startyear=1850, endyear=2050, chunked=False):
+    months = ((month - 2) % 12 + 1, month, month % 12 + 1)
+    inFiles = getFileNames(
+        variable, startyear=startyear, endyear=endyear, chunked=chunked
+    )
+    return [
+        "%s/%s" % (getDataDir(variable, chunked=chunked), fn)
+        for fn in inFiles
+        if int(fn[5:7]) in months
+    ]
+
+
 # Get a dataset - all the tensors for a given and variable
-def getDataset(variable, startyear=1850, endyear=2050, blur=None, cache=False):
+def getDataset(
+    variable, startyear=1850, endyear=2050, blur=None, cache=False, chunked=False
+):
     # Get a list of years to include
-    inFiles = getFileNames(variable, startyear=startyear, endyear=endyear)
+    inFiles = getFileNames(
+        variable, startyear=startyear, endyear=endyear, chunked=chunked
+    )
 
     # Create TensorFlow Dataset object from the source file names
     tn_data = tf.data.Dataset.from_tensor_slices(tf.constant(inFiles))
 
     # Convert from list of file names to Dataset of source file contents
-    fnFiles = [
-        "%s/MLP/raw_datasets/ERA5/%s/%s" % (os.getenv("SCRATCH"), variable, x)
-        for x in inFiles
-    ]
+    fnFiles = ["%s/%s" % (getDataDir(variable, chunked=chunked), x) for x in inFiles]
     ts_data = tf.data.Dataset.from_tensor_slices(tf.constant(fnFiles))
-    ts_data = ts_data.map(load_tensor, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+    if chunked:
+        ts_data = ts_data.map(
+            read_chunked, num_parallel_calls=tf.data.experimental.AUTOTUNE
+        )
+    else:
+        ts_data = ts_data.map(
+            load_tensor, num_parallel_calls=tf.data.experimental.AUTOTUNE
+        )
     # Add noise to data - needed for some cases where the data is all zero
     if blur is not None:
         ts_data = ts_data.map(
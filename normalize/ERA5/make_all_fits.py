@@ -1,21 +1,55 @@
 #!/usr/bin/env python
 
 # Make all the normalization fits
+# Only fits that are missing, or whose input data have changed since they were
+#  made, are redone (see utilities/manifest.py).
 
 import os
+import argparse
+
+from makeDataset import getFitInputs
+from normalize import fit_version, fitted_file_names
+from utilities import manifest
 
 sDir = os.path.dirname(os.path.realpath(__file__))
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--startyear", help="Start Year", type=int, required=False, default=1850
+)
+parser.add_argument(
+    "--endyear", help="End Year", type=int, required=False, default=2050
+)
+parser.add_argument(
+    "--chunked",
+    help="Read raw data from the chunked store",
+    default=False,
+    action="store_true",
+)
+parser.add_argument(
+    "--adopt",
+    help="Record existing fits as up to date (don't redo them)",
+    default=False,
+    action="store_true",
+)
+args = parser.parse_args()
+
 
 def is_done(month, variable):
-    fn = "%s/MLP/normalization/SPI_monthly/ERA5_tf_MM/%s/shape_m%02d.nc" % (
-        os.getenv("SCRATCH"),
+    inputs = getFitInputs(
         variable,
         month,
+        startyear=args.startyear,
+        endyear=args.endyear,
+        chunked=args.chunked,
     )
-    if os.path.exists(fn):
-        return True
-    return False
+    version = "%s:%d-%d" % (fit_version, args.startyear, args.endyear)
+    for fn in fitted_file_names(month, variable):
+        if args.adopt and os.path.exists(fn):
+            manifest.record(fn, inputs, version)
+        if not manifest.is_current(fn, inputs, version):
+            return False
+    return True
 
 
 count = 0
@@ -33,4 +67,7 @@ for variable in (
             month,
             variable,
         )
+        cmd += " --startyear=%04d --endyear=%04d" % (args.startyear, args.endyear)
+        if args.chunked:
+            cmd += " --chunked"
         print(cmd)
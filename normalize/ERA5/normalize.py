@@ -7,22 +7,23 @@ import numpy as np
 import os
 import iris
 
+# Version of the fitting method - change this to force a rebuild
+#  (see utilities/manifest.py)
+fit_version = "1"
+
+
+# Files containing the fitted values (shape, location, scale)
+def fitted_file_names(month, variable="total_precipitation"):
+    return [
+        "%s/MLP/normalization/SPI_monthly/ERA5_tf_MM/%s/%s_m%02d.nc"
+        % (os.getenv("SCRATCH"), variable, parameter, month)
+        for parameter in ("shape", "location", "scale")
+    ]
+
 
 # Load the pre-calculated fitted values
 def load_fitted(month, variable="total_precipitation"):
-    shape = iris.load_cube(
-        "%s/MLP/normalization/SPI_monthly/ERA5_tf_MM/%s/shape_m%02d.nc"
-        % (os.getenv("SCRATCH"), variable, month),
-    )
-    location = iris.load_cube(
-        "%s/MLP/normalization/SPI_monthly/ERA5_tf_MM/%s/location_m%02d.nc"
-        % (os.getenv("SCRATCH"), variable, month),
-    )
-    scale = iris.load_cube(
-        "%s/MLP/normalization/SPI_monthly/ERA5_tf_MM/%s/scale_m%02d.nc"
-        % (os.getenv("SCRATCH"), variable, month),
-    )
-    return (shape, location, scale)
+    return tuple(iris.load_cube(fn) for fn in fitted_file_names(month, variable))
 
 
 # Find the normal variate that matches the gamma cdf
@@ -0,0 +1,53 @@
+# Normalize raw data tensors with TensorFlow ops
+# Does the same as normalize_cube (in normalize.py), but as TensorFlow ops,
+#  so it can run in a tf.data map - normalizing raw tensors as they are read,
+#  instead of reading pre-made normalized tensors.
+
+import numpy as np
+import tensorflow as tf
+
+from normalize.ERA5.normalize import load_fitted
+
+# Fitted parameters are slow to load, so keep them once loaded
+_fitted_cache = {}
+
+
+# All the fitted parameters for a variable, as one tensor
+#  [12 months, 721, 1440, 3 (shape, location, scale)]
+def fitted_parameters(variable="total_precipitation"):
+    if variable not in _fitted_cache:
+        months = []
+        for month in range(1, 13):
+            # Use the filled data values - the same as normalize_cube
+            fitted = [np.ma.getdata(c.data) for c in load_fitted(month, variable)]
+            months.append(np.stack(fitted, axis=-1))
+        _fitted_cache[variable] = tf.convert_to_tensor(np.stack(months), tf.float32)
+    return _fitted_cache[variable]
+
+
+# Find the normal variate that matches the gamma cdf
+# raw is [721,1440] with NaN for missing data, parameters are [721,1440,3]
+#  (one month from fitted_parameters).
+# Missing data are set to 0.0 - as in the normalized tensors.
+def normalize_tensor(raw, parameters, norm_mean=0.5, norm_sd=0.2):
+    shape = parameters[:, :, 0]
+    location = parameters[:, :, 1]
+    scale = parameters[:, :, 2]
+    x = tf.maximum((raw - location) / scale, 0.0)
+    cdf = tf.math.igamma(shape, tf.where(tf.math.is_nan(x), 0.0, x))
+    cdf = tf.clip_by_value(cdf, 0.00001, 0.99999)  # cdf=0 or 1 causes failure
+    spi = norm_mean + norm_sd * tf.math.ndtri(cdf)
+    return tf.where(tf.math.is_nan(raw), 0.0, spi)
+
+
+# Calendar month of a raw tensor file (.../YYYY-MM.tfd) - as a string tensor op
+def file_month(file_name):
+    base = tf.strings.split(file_name, "/")[-1]
+    return tf.strings.to_number(tf.strings.substr(base, 5, 2), tf.int32)
+
+
+# Load a raw tensor file and normalize it
+def load_normalized(file_name, parameters):
+    raw = tf.io.parse_tensor(tf.io.read_file(file_name), tf.float32)
+    raw = tf.reshape(raw, [721, 1440])
+    return normalize_tensor(raw, tf.gather(parameters, file_month(file_name) - 1))
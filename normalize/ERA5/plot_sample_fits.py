@@ -12,6 +12,7 @@ import numpy as np
 import tensorflow as tf
 
 from makeDataset import getDataset
+from utilities.pencils import read_points, load_index, index_file_name
 
 from normalize import load_fitted
 from scipy.stats import gamma
@@ -46,6 +47,13 @@ parser.add_argument(
 parser.add_argument(
     "--epoch", help="Epoch to plot", type=int, required=False, default=1
 )
+parser.add_argument(
+    "--pencils",
+    help="Time-major store to read from (if None, use it if it exists)",
+    type=str,
+    required=False,
+    default=None,
+)
 args = parser.parse_args()
 
 # Select 25 grid-cells to show
@@ -56,17 +64,36 @@ for i in range(25):
     raw.append([])
 
 # Get the data
-trainingData = getDataset(
-    args.variable,
-    startyear=args.startyear,
-    endyear=args.endyear,
-    cache=False,
-).batch(1)
-for batch in trainingData:
-    month = int(batch[1].numpy()[0][5:7])
-    if month == args.month:
-        for i in range(25):
-            raw[i].append(batch[0].numpy()[0, random_i[i], random_j[i], 0])
+# From the time-major store if there is one - just a few reads - otherwise
+#  from the raw tensors - reading all the months in full.
+if args.pencils is None:
+    args.pencils = "%s/MLP/raw_datasets/ERA5_pencils/%s" % (
+        os.getenv("SCRATCH"),
+        args.variable,
+    )
+if os.path.exists(index_file_name(args.pencils)):
+    dates = load_index(args.pencils)["dates"]
+    selected = [
+        t
+        for t in range(len(dates))
+        if int(dates[t][5:7]) == args.month
+        and args.startyear <= int(dates[t][:4]) <= args.endyear
+    ]
+    series = read_points(args.pencils, random_i, random_j)
+    for i in range(25):
+        raw[i] = list(series[i, selected])
+else:
+    trainingData = getDataset(
+        args.variable,
+        startyear=args.startyear,
+        endyear=args.endyear,
+        cache=False,
+    ).batch(1)
+    for batch in trainingData:
+        month = int(batch[1].numpy()[0][5:7])
+        if month == args.month:
+            for i in range(25):
+                raw[i].append(batch[0].numpy()[0, random_i[i], random_j[i], 0])
 
 # Load the fitted values
 (shape, location, scale) = load_fitted(args.month, variable=args.variable)
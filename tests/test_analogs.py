@@ -0,0 +1,40 @@
+# Tests for the analog search indices (utilities/analogs.py)
+
+import numpy as np
+
+from utilities.analogs import ExactIndex, ApproximateIndex
+
+
+def clustered(n, seed=0, n_clusters=20, d=16):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(n_clusters, d)) * 10
+    return (centres[rng.integers(0, n_clusters, n)] + rng.normal(size=(n, d))).astype(
+        np.float32
+    )
+
+
+def test_empty_index_search_finds_nothing():
+    queries = np.zeros((3, 16), dtype=np.float32)
+    distances, positions = ExactIndex().search(queries, k=5)
+    assert distances.shape == (3, 0) and positions.shape == (3, 0)
+    distances, positions = ApproximateIndex().search(queries, k=5)
+    assert np.all(np.isinf(distances)) and np.all(positions == -1)
+
+
+def test_approximate_index_retrains_as_it_grows():
+    vectors = clustered(4000)
+    index = ApproximateIndex(n_lists=50, n_probe=4)
+    index.add(vectors[:10])  # Too few for 50 groups
+    assert index.centres.shape[0] == 10
+    for start in range(10, len(vectors), 100):
+        index.add(vectors[start : start + 100])
+    assert index.centres.shape[0] == 50
+    assert index.trained_size * index.retrain_factor > len(index)
+    # Same neighbours as the exact search, for most queries
+    exact = ExactIndex()
+    exact.add(vectors)
+    queries = clustered(50, seed=1)
+    found = index.search(queries, k=10)[1]
+    true = exact.search(queries, k=10)[1]
+    recall = np.mean([len(set(f) & set(t)) / 10 for f, t in zip(found, true)])
+    assert recall > 0.9
@@ -0,0 +1,32 @@
+#!/usr/bin/bash
+
+# Bring all the derived data up to date with the downloaded data
+# Each stage only remakes outputs that are missing, or whose inputs have
+#  changed (see utilities/manifest.py) - so adding a new month of data remakes
+#  that month's raw tensors and normalized tensor, and adds its validity masks.
+# The normalization fits are for a fixed period, so new months don't change
+#  them (and so don't force a rebuild of all the normalized tensors for that
+#  calendar month) - only a change to data in the fit period does.
+# Run the stages in order - each depends on the one before.
+# First time only: add --adopt to each make_all script to record existing
+#  outputs as up to date, instead of remaking them all.
+
+# To add new months of the current year, first get it again:
+#  (cd get_data/ERA5 && ./get_data_for_period_ERA5.py --startyear=$(date +%Y) --endyear=$(date +%Y) --refresh | parallel -j 1)
+
+variables="2m_temperature sea_surface_temperature mean_sea_level_pressure total_precipitation"
+endyear=$(date +%Y) # Months not downloaded yet are skipped
+
+for var in $variables; do
+    (cd make_raw_tensors/ERA5 && ./make_all_tensors.py --variable=$var --endyear=$endyear)
+done | parallel -j 8
+
+(cd normalize/ERA5 && ./make_all_fits.py --startyear=1950 --endyear=2023) | parallel -j 4
+
+for var in $variables; do
+    (cd make_normalized_tensors/ERA5 && ./make_all_tensors.py --variable=$var --endyear=$endyear)
+done | parallel -j 8
+
+for var in $variables; do
+    echo "$PWD/make_normalized_tensors/ERA5/make_validity_masks.py --variable=$var"
+done | parallel -j 4
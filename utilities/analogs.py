@@ -0,0 +1,283 @@
+# Analog search - find the months whose latent space means (from a latent
+#  store, see utilities/latents.py) are closest to a query.
+
+# For analog forecasting, and for finding donor months for region sharing.
+# Distance is Euclidean, between the flattened latent means.
+# Two search backends:
+#  ExactIndex - brute force, vectorized: the distances from each query to
+#   every entry, as one matrix product. Fine up to a few hundred thousand
+#   entries.
+#  ApproximateIndex - an inverted file: the entries are grouped round
+#   n_lists centres (k-means), and a query is compared only with the entries
+#   in the n_probe groups nearest to it. Much faster for large ensembles,
+#   but may miss some of the true nearest neighbours.
+# Both can be added to without rebuilding (new entries in the approximate
+#  index are assigned to the existing centres - until it has grown by
+#  retrain_factor since the centres were found, when they are found again),
+#  and AnalogSearch keeps an index in step with a latent store as months are
+#  appended to it.
+
+import numpy as np
+
+from utilities.latents import read_latents
+
+
+# Latent means [entry, ...] as vectors [entry, n] (float32)
+def flatten(mean):
+    mean = np.asarray(mean, dtype=np.float32)
+    return mean.reshape(mean.shape[0], -1)
+
+
+# Squared distances from each query [q, n] to each vector [v, n] - as a
+#  matrix product (|q|^2 - 2q.v + |v|^2), with the vector norms precomputed.
+def squared_distances(queries, vectors, norms):
+    d2 = (
+        np.sum(queries**2, axis=1, keepdims=True)
+        - 2.0 * queries @ vectors.T
+        + norms[None, :]
+    )
+    return np.maximum(d2, 0.0)
+
+
+# The k smallest of each row of a distance array [q, v]
+# Returns (distances, columns), each [q, k], nearest first.
+def smallest(d2, k):
+    k = min(k, d2.shape[1])
+    if k == 0:
+        return (
+            np.zeros((d2.shape[0], 0), dtype=d2.dtype),
+            np.zeros((d2.shape[0], 0), dtype=np.int64),
+        )
+    columns = np.argpartition(d2, k - 1, axis=1)[:, :k]
+    d2 = np.take_along_axis(d2, columns, axis=1)
+    order = np.argsort(d2, axis=1)
+    return (
+        np.sqrt(np.take_along_axis(d2, order, axis=1)),
+        np.take_along_axis(columns, order, axis=1),
+    )
+
+
+class ExactIndex:
+    def __init__(self):
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    # Add vectors [n, d] to the end of the index
+    def add(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(self) == 0:
+            self.vectors = vectors.copy()
+        else:
+            self.vectors = np.concatenate([self.vectors, vectors])
+        self.norms = np.sum(self.vectors**2, axis=1)
+
+    # Replace the vectors at some positions
+    def update(self, positions, vectors):
+        self.vectors[positions] = vectors
+        self.norms[positions] = np.sum(self.vectors[positions] ** 2, axis=1)
+
+    # The k nearest entries to each query [q, d]
+    # Returns (distances, positions), each [q, k], nearest first.
+    # Queries are done in blocks, to limit the size of the distance array.
+    def search(self, queries, k=10, block=256):
+        queries = np.asarray(queries, dtype=np.float32)
+        if len(self) == 0:
+            return smallest(np.zeros((queries.shape[0], 0), dtype=np.float32), k)
+        distances = []
+        positions = []
+        for start in range(0, queries.shape[0], block):
+            d, p = smallest(
+                squared_distances(
+                    queries[start : start + block], self.vectors, self.norms
+                ),
+                k,
+            )
+            distances.append(d)
+            positions.append(p)
+        return (np.concatenate(distances), np.concatenate(positions))
+
+
+class ApproximateIndex:
+    # n_lists - number of groups (default about sqrt of the number of
+    #  entries); n_probe - number of groups searched for each query;
+    #  retrain_factor - find the groups again when the index has grown by this
+    #  factor since they were last found
+    def __init__(
+        self, n_lists=None, n_probe=8, iterations=10, seed=0, retrain_factor=4
+    ):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.seed = seed
+        self.retrain_factor = retrain_factor
+        self.centres = None
+        self.trained_size = 0  # Entries when the groups were last found
+        self.exact = ExactIndex()  # All the vectors, in order
+        self.assignment = np.zeros(0, dtype=np.int64)  # Group of each vector
+        # Each group's positions, and a contiguous copy of its vectors and
+        #  norms - so searching a group needs no gathering of scattered rows.
+        self.lists = []
+
+    def __len__(self):
+        return len(self.exact)
+
+    @property
+    def vectors(self):
+        return self.exact.vectors
+
+    # Find the group centres - k-means, on the vectors already added
+    def train(self):
+        vectors = self.exact.vectors
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.default_rng(self.seed)
+        centres = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+        for iteration in range(self.iterations):
+            assignment = self.assign(vectors, centres)
+            for c in range(n_lists):
+                members = assignment == c
+                if np.any(members):
+                    centres[c] = vectors[members].mean(axis=0)
+        self.centres = centres
+        self.centre_norms = np.sum(centres**2, axis=1)
+        self.assignment = self.assign(vectors)
+        self.lists = []
+        self.make_lists(range(n_lists))
+        self.trained_size = len(vectors)
+
+    # Nearest centre to each vector
+    def assign(self, vectors, centres=None):
+        if centres is None:
+            centres = self.centres
+        norms = np.sum(centres**2, axis=1)
+        assignment = []
+        for start in range(0, vectors.shape[0], 4096):
+            assignment.append(
+                np.argmin(
+                    squared_distances(vectors[start : start + 4096], centres, norms),
+                    axis=1,
+                )
+            )
+        return np.concatenate(assignment)
+
+    # (Re)make the lists for some groups
+    def make_lists(self, groups):
+        if len(self.lists) == 0:
+            self.lists = [None] * self.centres.shape[0]
+        for c in groups:
+            positions = np.nonzero(self.assignment == c)[0]
+            self.lists[c] = (
+                positions,
+                self.exact.vectors[positions],
+                self.exact.norms[positions],
+            )
+
+    # Add vectors to the end of the index - assigned to the existing groups
+    #  (the first vectors added train the groups, and they are trained again
+    #  when the index has grown by retrain_factor since)
+    def add(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[0] == 0:
+            return
+        self.exact.add(vectors)
+        if len(self) >= self.retrain_factor * self.trained_size:
+            self.train()
+        else:
+            assignment = self.assign(vectors)
+            self.assignment = np.concatenate([self.assignment, assignment])
+            self.make_lists(np.unique(assignment))
+
+    # Replace the vectors at some positions (and re-assign them)
+    def update(self, positions, vectors):
+        self.exact.update(positions, vectors)
+        old = self.assignment[positions]
+        self.assignment[positions] = self.assign(self.exact.vectors[positions])
+        self.make_lists(np.unique(np.concatenate([old, self.assignment[positions]])))
+
+    # The k nearest entries to each query [q, d] - among the entries in the
+    #  n_probe nearest groups (more, if they have fewer than k entries)
+    # Returns (distances, positions), each [q, k], nearest first - padded with
+    #  inf and -1 if there are fewer than k entries in the index.
+    def search(self, queries, k=10):
+        queries = np.asarray(queries, dtype=np.float32)
+        if len(self) == 0:
+            return (
+                np.full((queries.shape[0], k), np.inf, dtype=np.float32),
+                np.full((queries.shape[0], k), -1, dtype=np.int64),
+            )
+        groups = np.argsort(
+            squared_distances(queries, self.centres, self.centre_norms), axis=1
+        )
+        distances = np.full((queries.shape[0], k), np.inf, dtype=np.float32)
+        positions = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        for q in range(queries.shape[0]):
+            d2 = []
+            candidates = []
+            for n_probe, g in enumerate(groups[q]):
+                if n_probe >= self.n_probe and sum(len(c) for c in candidates) >= k:
+                    break
+                candidates.append(self.lists[g][0])
+                d2.append(
+                    squared_distances(
+                        queries[q : q + 1], self.lists[g][1], self.lists[g][2]
+                    )
+                )
+            d, c = smallest(np.concatenate(d2, axis=1), k)
+            distances[q, : d.shape[1]] = d[0]
+            positions[q, : d.shape[1]] = np.concatenate(candidates)[c[0]]
+        return (distances, positions)
+
+
+# Analog search over a latent store
+# The index is built from the store when this is made, and refresh() brings
+#  it up to date with any entries appended (or replaced) since.
+class AnalogSearch:
+    def __init__(self, dir_name, approximate=False, **kwargs):
+        self.dir_name = dir_name
+        if approximate:
+            self.index = ApproximateIndex(**kwargs)
+        else:
+            self.index = ExactIndex()
+        self.refresh()
+
+    def refresh(self):
+        mean, logvar, self.store_index = read_latents(self.dir_name)
+        vectors = flatten(mean)
+        n_old = len(self.index)
+        if n_old > 0:
+            changed = np.nonzero(
+                np.any(self.index.vectors[:n_old] != vectors[:n_old], axis=1)
+            )[0]
+            if len(changed) > 0:
+                self.index.update(changed, vectors[changed])
+        if vectors.shape[0] > n_old:
+            self.index.add(vectors[n_old:])
+
+    # The k nearest months to each query (latent means [q, ...])
+    # Entries with dates in exclude (e.g. the query month itself) are left
+    #  out. Returns a list (one for each query) of (date, member, distance)
+    #  tuples, nearest first.
+    def search(self, query, k=10, exclude=()):
+        exclude = set(exclude)
+        n_extra = 0
+        if exclude:
+            n_extra = sum(d in exclude for d in self.store_index["dates"])
+        distances, positions = self.index.search(flatten(query), k + n_extra)
+        results = []
+        for d_row, p_row in zip(distances, positions):
+            result = []
+            for distance, position in zip(d_row, p_row):
+                if position < 0 or self.store_index["dates"][position] in exclude:
+                    continue
+                result.append(
+                    (
+                        self.store_index["dates"][position],
+                        self.store_index["members"][position],
+                        float(distance),
+                    )
+                )
+            results.append(result[:k])
+        return results
@@ -0,0 +1,95 @@
+# Chunked, compressed tensor store
+
+# A month of data is stored as a directory of files, one for each band of
+#  latitudes, so a regional window can be read without reading the whole field.
+# Each chunk is byte-shuffled (all the first bytes of the float32 values, then
+#  all the second bytes, ...) and then compressed. Large constant or missing
+#  (NaN) regions - SST over land, zero precipitation in deserts - become long
+#  runs of identical bytes after shuffling, and compress very well.
+# The codec is zlib at a low (fast) compression level: TensorFlow can
+#  decompress zlib in the graph (tf.io.decode_compressed), so reading a chunk
+#  can run in a tf.data map, like reading a serialised tensor.
+
+import os
+import shutil
+import zlib
+import numpy as np
+import tensorflow as tf
+
+band_rows = 16  # Latitude rows in each chunk
+compression_level = 1  # zlib level - 1 is fastest
+
+
+# How many bands are needed to cover a field
+def band_count(n_rows=721, rows=band_rows):
+    return (n_rows + rows - 1) // rows
+
+
+# File name for one chunk (works for strings and string tensors)
+def chunk_file_name(dir_name, band):
+    return dir_name + "/band_%03d.zlib" % band
+
+
+# Byte-shuffle a float32 array
+def shuffle_bytes(field):
+    field = np.ascontiguousarray(field, dtype=np.float32)
+    return field.view(np.uint8).reshape(-1, 4).T.tobytes()
+
+
+# Inverse of shuffle_bytes (numpy version)
+def unshuffle_bytes(packed, shape):
+    shuffled = np.frombuffer(packed, dtype=np.uint8).reshape(4, -1)
+    return np.ascontiguousarray(shuffled.T).view(np.float32).reshape(shape)
+
+
+# Write a field (lat, lon[, 1]) as a directory of compressed latitude bands
+# Written to a temporary directory and then renamed, so an interrupted write
+#  never leaves a partial store behind.
+def write_chunked(field, dir_name, rows=band_rows, level=compression_level):
+    field = np.asarray(field, dtype=np.float32)
+    tmp_name = "%s.tmp" % dir_name
+    if not os.path.isdir(tmp_name):
+        os.makedirs(tmp_name)
+    for band in range(band_count(field.shape[0], rows)):
+        chunk = field[band * rows : (band + 1) * rows]
+        with open(chunk_file_name(tmp_name, band), "wb") as f:
+            f.write(zlib.compress(shuffle_bytes(chunk), level))
+    if os.path.isdir(dir_name):
+        shutil.rmtree(dir_name)
+    os.rename(tmp_name, dir_name)
+
+
+# Read a chunked field back into numpy (not in the graph - for scripts)
+def read_chunked_numpy(dir_name, shape=(721, 1440), rows=band_rows):
+    bands = []
+    for band in range(band_count(shape[0], rows)):
+        with open(chunk_file_name(dir_name, band), "rb") as f:
+            chunk = zlib.decompress(f.read())
+        bands.append(unshuffle_bytes(chunk, (-1,) + tuple(shape[1:])))
+    return np.concatenate(bands, axis=0)
+
+
+# Decode one chunk (TensorFlow ops only)
+def decode_chunk(dir_name, band, n_lon=1440):
+    compressed = tf.io.read_file(chunk_file_name(dir_name, band))
+    packed = tf.io.decode_raw(
+        tf.io.decode_compressed(compressed, compression_type="ZLIB"), tf.uint8
+    )
+    packed = tf.transpose(tf.reshape(packed, [4, -1]))
+    return tf.reshape(tf.bitcast(packed, tf.float32), [-1, n_lon])
+
+
+# Read latitude rows first_row:last_row (python ints) of a chunked field,
+#  reading only the chunks that overlap them.
+# dir_name can be a string tensor, so this can be used in a tf.data map.
+# Returns a (rows, lon, 1) float32 tensor
+def read_chunked(dir_name, first_row=0, last_row=721, n_lon=1440, rows=band_rows):
+    first_band = first_row // rows
+    last_band = (last_row - 1) // rows
+    bands = [
+        decode_chunk(dir_name, band, n_lon) for band in range(first_band, last_band + 1)
+    ]
+    field = tf.concat(bands, axis=0)
+    offset = first_band * rows
+    field = field[first_row - offset : last_row - offset, :]
+    return tf.reshape(field, [last_row - first_row, n_lon, 1])
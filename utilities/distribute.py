@@ -0,0 +1,89 @@
+# Multi-worker (data parallel) training, configured from the environment
+
+# On CPU-only nodes MirroredStrategy gives a single replica, so training can
+#  only use one node. With TF_CONFIG set (a JSON cluster description - see
+#  cluster_config), get_strategy returns a MultiWorkerMirroredStrategy
+#  instead: each worker process gets a share of every batch, and the
+#  gradients are summed across the workers before each weight update.
+# Every worker must run the same number of training steps (the gradient
+#  sums wait for all of them), so the input is split into equal shares (see
+#  getDataset in the model makeDataset).
+# Only the chief (worker 0) should write logs and checkpoints - but all the
+#  workers must take part in saving, so the others save to a scratch
+#  directory, which is then deleted (see worker_dir).
+
+import os
+import json
+import socket
+import tempfile
+import tensorflow as tf
+
+
+# The cluster from TF_CONFIG ({} if there isn't one)
+def cluster_config():
+    return json.loads(os.getenv("TF_CONFIG", "{}"))
+
+
+# Number of worker processes in the cluster (1 if there is no cluster)
+def worker_count():
+    cluster = cluster_config().get("cluster", {})
+    return max(1, len(cluster.get("worker", ())) + len(cluster.get("chief", ())))
+
+
+# Distribution strategy for training
+# Must be called before any other TensorFlow operations.
+def get_strategy():
+    if worker_count() > 1:
+        return tf.distribute.MultiWorkerMirroredStrategy(
+            communication_options=tf.distribute.experimental.CommunicationOptions(
+                implementation=tf.distribute.experimental.CommunicationImplementation.RING
+            )
+        )
+    return tf.distribute.MirroredStrategy()
+
+
+# Is this process the chief? (True if there is no cluster)
+def is_chief():
+    config = cluster_config()
+    task = config.get("task")
+    if task is None:
+        return True
+    if task["type"] == "chief":
+        return True
+    return (
+        task["type"] == "worker"
+        and task["index"] == 0
+        and "chief" not in config.get("cluster", {})
+    )
+
+
+# Where this process should write a directory of output - the directory
+#  itself for the chief, a scratch directory for the other workers (delete
+#  it after writing).
+def worker_dir(dir_name):
+    if is_chief():
+        return dir_name
+    return os.path.join(
+        tempfile.gettempdir(),
+        "worker_%d" % cluster_config()["task"]["index"],
+        os.path.basename(dir_name),
+    )
+
+
+# TF_CONFIG for each of a set of worker processes on this machine (for
+#  testing) - a JSON string for each worker, with free ports.
+def local_cluster(n_workers):
+    ports = []
+    sockets = []
+    for worker in range(n_workers):
+        s = socket.socket()
+        s.bind(("localhost", 0))
+        ports.append(s.getsockname()[1])
+        sockets.append(s)
+    for s in sockets:
+        s.close()
+    cluster = {"worker": ["localhost:%d" % port for port in ports]}
+    return [
+        json.dumps({"cluster": cluster, "task": {"type": "worker", "index": worker}})
+        for worker in range(n_workers)
+    ]
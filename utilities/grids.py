@@ -36,3 +36,39 @@ E5sCube = iris.cube.Cube(
     dummy_data, dim_coords_and_dims=[(latitude, 0), (longitude, 1)]
 )
 E5scs = cs
+
+
+# Standard cube at a lower resolution (see pyramid.py)
+# Optionally, only a region (min_lat, max_lat, min_lon, max_lon) - longitudes
+#  of regions crossing the date-line go above 180, so they stay monotonic.
+def grid_cube(res=resolution, region=None):
+    if res == resolution and region is None:
+        return E5sCube
+    lats = np.arange(ymin, ymax + res, res)
+    lons = np.arange(xmin, xmax, res)
+    if region is not None:
+        first_row = int(np.ceil((region[0] - ymin) / res))
+        last_row = int(np.floor((region[1] - ymin) / res)) + 1
+        first_col = int(np.ceil((region[2] - xmin) / res))
+        last_col = int(np.floor((region[3] - xmin) / res)) + 1
+        if last_col <= first_col:  # Crosses the date-line
+            last_col += len(lons)
+        last_col = min(last_col, first_col + len(lons))
+        lats = lats[first_row:last_row]
+        lons = np.concatenate((lons, lons + 360))[first_col:last_col]
+    lat_c = iris.coords.DimCoord(
+        lats,
+        standard_name="grid_latitude",
+        units="degrees_north",
+        coord_system=cs,
+    )
+    lon_c = iris.coords.DimCoord(
+        lons,
+        standard_name="grid_longitude",
+        units="degrees_east",
+        coord_system=cs,
+    )
+    return iris.cube.Cube(
+        np.ma.MaskedArray(np.zeros((len(lats), len(lons))), False),
+        dim_coords_and_dims=[(lat_c, 0), (lon_c, 1)],
+    )
@@ -0,0 +1,240 @@
+# Trained models for inference only - exported, and served
+
+# getModel rebuilds the Keras model and restores a checkpoint, which needs the
+#  training specify.py (and a distribution strategy), and takes a while.
+#  export_model saves a trained model's encode, generate, and call as a
+#  TensorFlow SavedModel, with fixed signatures, which loads on its own
+#  (ExportedModel) - no model code or specification needed.
+# To avoid even that start-up cost in every script, serve runs a persistent
+#  process which keeps an exported model loaded, and answers requests (a
+#  batch of fields, or latent vectors, at a time) from other processes on
+#  this machine (InferenceClient).
+# Requests are pickled, so the server would run code from anyone who can
+#  connect - connections need a key. The key is random, and kept in a file
+#  only the user can read ($HOME/.mles_inference_key, made by the first
+#  server or client to need it), so only that user's processes can connect.
+# ExportedModel and InferenceClient have the same encode, generate, and call
+#  methods as DCVAE (training is accepted, and ignored), so either can be used
+#  in place of a model from getModel by the validation and plotting scripts.
+
+import os
+import json
+import threading
+import numpy as np
+import tensorflow as tf
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+default_address = ("localhost", 6789)
+default_key_file = os.path.join(os.path.expanduser("~"), ".mles_inference_key")
+
+
+# The connection key - read from key_file, which is made (random, mode 0600)
+#  if it doesn't exist. Refuses a file that other users could read or change.
+def inference_authkey(key_file=default_key_file):
+    try:
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, "wb") as f:
+            f.write(os.urandom(32))
+    status = os.stat(key_file)
+    if status.st_uid != os.getuid() or status.st_mode & 0o077:
+        raise PermissionError(
+            "Key file %s must belong to you, with mode 0600" % key_file
+        )
+    with open(key_file, "rb") as f:
+        authkey = f.read()
+    if len(authkey) == 0:
+        raise ValueError("Key file %s is empty" % key_file)
+    return authkey
+
+
+# Specification entries that can be stored in JSON (not the optimizer, or
+#  the strategy) - kept with the exported model
+def portable_specification(specification):
+    portable = {}
+    for key, value in specification.items():
+        try:
+            json.dumps(value)
+        except TypeError:
+            continue
+        portable[key] = value
+    return portable
+
+
+# Save a trained model (DCVAE) as a SavedModel in directory
+# The signatures take a batch of any size: 'encode' - fields [batch, lat,
+#  lon, input channels] to latent mean and logvar; 'generate' - latent
+#  vectors to fields [batch, lat, lon, output channels]; and 'call' - encode,
+#  sample, and generate.
+def export_model(model, directory, attributes=None):
+    if model.specification["patchSize"] is not None:
+        raise ValueError("Can't export a patch-trained model (it takes patches)")
+    field = tf.TensorSpec(
+        (None,) + tuple(model.fieldShape) + (model.specification["nInputChannels"],),
+        tf.float32,
+    )
+    latent_shape = model.encode(tf.zeros((1,) + tuple(field.shape[1:])))[0].shape[1:]
+    latent = tf.TensorSpec((None,) + tuple(latent_shape), tf.float32)
+
+    exported = tf.Module()
+    exported.model = model
+
+    @tf.function(input_signature=[field])
+    def encode(x):
+        mean, logvar = model.encode(x, training=False)
+        return {"mean": mean, "logvar": logvar}
+
+    @tf.function(input_signature=[latent])
+    def generate(z):
+        return {"generated": model.generate(z, training=False)}
+
+    @tf.function(input_signature=[field])
+    def call(x):
+        mean, logvar = model.encode(x, training=False)
+        z = tf.random.normal(tf.shape(mean)) * tf.exp(logvar * 0.5) + mean
+        return {"generated": model.generate(z, training=False)}
+
+    exported.encode = encode
+    exported.generate = generate
+    exported.call = call
+    tf.saved_model.save(
+        exported,
+        directory,
+        signatures={"encode": encode, "generate": generate, "call": call},
+    )
+    metadata = {
+        "fieldShape": list(model.fieldShape),
+        "latentShape": list(latent_shape),
+        "specification": portable_specification(model.specification),
+    }
+    metadata.update(attributes or {})
+    with open("%s/metadata.json" % directory, "w") as f:
+        json.dump(metadata, f, indent=1)
+
+
+# An exported model, loaded
+class ExportedModel:
+    def __init__(self, directory):
+        self.directory = directory
+        self.saved = tf.saved_model.load(directory)
+        with open("%s/metadata.json" % directory, "r") as f:
+            self.metadata = json.load(f)
+        self.specification = self.metadata["specification"]
+        self.fieldShape = tuple(self.metadata["fieldShape"])
+
+    def encode(self, x, training=False):
+        result = self.saved.encode(tf.convert_to_tensor(x, tf.float32))
+        return result["mean"], result["logvar"]
+
+    def generate(self, z, training=False):
+        return self.saved.generate(tf.convert_to_tensor(z, tf.float32))["generated"]
+
+    # x is a dataset batch (metadata, input, ...), as for DCVAE.call
+    def call(self, x, training=False):
+        return self.saved.call(tf.convert_to_tensor(x[1], tf.float32))["generated"]
+
+
+# Run an inference server - answers requests until stopped
+# Each request is (method, array): method is 'encode', 'generate', or 'call',
+#  and the array a batch of fields or latent vectors (numpy). Big batches are
+#  run in chunks of batch_size. The reply is ('ok', result) - an array, or
+#  (mean, logvar) for encode - or ('error', message).
+# Each client connection gets a thread, but the model runs one request at a
+#  time.
+# authkey - the connection key (default, from inference_authkey)
+def serve(directory, address=default_address, authkey=None, batch_size=32):
+    if authkey is None:
+        authkey = inference_authkey()
+    model = ExportedModel(directory)
+    lock = threading.Lock()
+
+    def run(method, x):
+        results = []
+        for first in range(0, x.shape[0], batch_size):
+            chunk = x[first : first + batch_size]
+            if method == "encode":
+                results.append([r.numpy() for r in model.encode(chunk)])
+            elif method == "generate":
+                results.append([model.generate(chunk).numpy()])
+            elif method == "call":
+                results.append([model.call((None, chunk)).numpy()])
+            else:
+                raise ValueError("Unknown method %s" % method)
+        results = [np.concatenate(r) for r in zip(*results)]
+        return tuple(results) if method == "encode" else results[0]
+
+    def answer(connection):
+        with connection:
+            while True:
+                try:
+                    method, x = connection.recv()
+                except EOFError:
+                    return
+                if method == "metadata":
+                    connection.send(("ok", model.metadata))
+                    continue
+                try:
+                    with lock:
+                        result = run(method, np.asarray(x, dtype=np.float32))
+                    connection.send(("ok", result))
+                except Exception as e:
+                    connection.send(("error", "%s: %s" % (type(e).__name__, e)))
+
+    with Listener(address, authkey=authkey) as listener:
+        print("Serving %s on %s:%d" % (directory, address[0], address[1]))
+        while True:
+            try:
+                connection = listener.accept()
+            except (AuthenticationError, OSError) as e:
+                print("Refused a connection: %s" % e)
+                continue
+            threading.Thread(target=answer, args=(connection,), daemon=True).start()
+
+
+# Connection to an inference server
+class InferenceClient:
+    def __init__(self, address=default_address, authkey=None):
+        if authkey is None:
+            authkey = inference_authkey()
+        self.connection = Client(address, authkey=authkey)
+        self.metadata = self.request("metadata")
+        self.specification = self.metadata["specification"]
+        self.fieldShape = tuple(self.metadata["fieldShape"])
+
+    def request(self, method, x=None):
+        if x is not None:
+            x = np.asarray(x, dtype=np.float32)
+        self.connection.send((method, x))
+        status, result = self.connection.recv()
+        if status != "ok":
+            raise RuntimeError("Inference server: %s" % result)
+        return result
+
+    def encode(self, x, training=False):
+        mean, logvar = self.request("encode", x)
+        return tf.constant(mean), tf.constant(logvar)
+
+    def generate(self, z, training=False):
+        return tf.constant(self.request("generate", z))
+
+    def call(self, x, training=False):
+        return tf.constant(self.request("call", x[1]))
+
+    def close(self):
+        self.connection.close()
+
+
+# A model for inference - from a server (address 'host:port'), or an
+#  exported model directory, whichever is given
+def inference_model(server=None, directory=None):
+    if server is not None:
+        host, port = server.rsplit(":", 1)
+        return InferenceClient((host, int(port)))
+    if directory is None:
+        raise ValueError("Need a server address or an exported model directory")
+    if not os.path.isdir(directory):
+        raise FileNotFoundError("No exported model in %s" % directory)
+    return ExportedModel(directory)
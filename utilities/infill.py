@@ -0,0 +1,171 @@
+# Fill in the missing parts of fields with a trained model (DCVAE)
+
+# Given fields with only part observed (a validity mask, 1=observed), find
+#  the point in latent space whose generated field best fits the observed
+#  part (gradient descent on the latent vector, through DCVAE.generate), and
+#  use the generated field to fill in the rest.
+# The misfit has many local minima, so each field is fitted from several
+#  starting points - the encoding of the observed part, and random draws
+#  from the prior - and the best fit is kept.
+# All the fields and starting points are fitted together, as one batch (in
+#  chunks of at most batch_size fields x starts, to limit memory), and the
+#  whole optimization for a chunk is one compiled TensorFlow function.
+
+import numpy as np
+import tensorflow as tf
+
+
+# Misfit of generated fields to the observed parts of targets - mean squared
+#  difference over the observed points, for each field
+def observed_misfit(generated, target, valid):
+    return tf.reduce_sum(
+        tf.math.squared_difference(generated, target) * valid, axis=[1, 2, 3]
+    ) / tf.maximum(tf.reduce_sum(valid, axis=[1, 2, 3]), 1.0)
+
+
+# Fit latent vectors to a batch of fields - Adam, from starting points z
+# Returns the fitted z, the final misfit and loss, and the loss at each step
+#  ([steps, batch]).
+def fit_latents(model, z, target, valid, steps, learning_rate, prior):
+    beta1, beta2, epsilon = 0.9, 0.999, 1.0e-7
+    latent_axes = list(range(1, len(z.shape)))
+
+    def loss_fn(z):
+        misfit = observed_misfit(model.generate(z, training=False), target, valid)
+        return misfit + prior * 0.5 * tf.reduce_mean(z**2, axis=latent_axes)
+
+    m = tf.zeros_like(z)
+    v = tf.zeros_like(z)
+    history = tf.TensorArray(tf.float32, size=steps)
+    for step in tf.range(steps):
+        # Losses of different fields are independent, so the gradient of the
+        #  sum is the gradient of each
+        with tf.GradientTape() as tape:
+            tape.watch(z)
+            loss = loss_fn(z)
+            total = tf.reduce_sum(loss)
+        gradient = tape.gradient(total, z)
+        m = beta1 * m + (1.0 - beta1) * gradient
+        v = beta2 * v + (1.0 - beta2) * gradient**2
+        t = tf.cast(step + 1, tf.float32)
+        m_hat = m / (1.0 - beta1**t)
+        v_hat = v / (1.0 - beta2**t)
+        z = z - learning_rate * m_hat / (tf.sqrt(v_hat) + epsilon)
+        history = history.write(step, loss)
+    generated = model.generate(z, training=False)
+    return (
+        z,
+        observed_misfit(generated, target, valid),
+        loss_fn(z),
+        history.stack(),
+    )
+
+
+# Fill in fields [n, lat, lon, channels] where valid [n, lat, lon, channels]
+#  is 0 (valid is 1 where observed).
+# n_starts - starting points for each field (the first is the encoding of the
+#  observed part, the rest random draws from the prior)
+# steps, learning_rate - of the optimization (Adam) - at least 2 steps, so
+#  convergence can be judged
+# prior - weight of the N(0,1) prior on the latent vector (default, the
+#  model's beta)
+# batch_size - most fields x starts to fit at once
+# tolerance - a fit has converged if its loss fell by less than this
+#  fraction over the last tenth of the steps
+# Returns the filled fields (observed points unchanged), and a report - a
+#  dict of numpy arrays: for each field, the latent vector, generated field,
+#  and misfit of the best start ('latent', 'generated', 'misfit'), which
+#  start that was ('start'), the spread of misfits over the starts
+#  ('spread'), whether it converged ('converged'), and its loss at each step
+#  ('history', [n, steps]).
+def infill(
+    model,
+    fields,
+    valid,
+    n_starts=8,
+    steps=200,
+    learning_rate=0.05,
+    prior=None,
+    batch_size=64,
+    tolerance=1.0e-3,
+    seed=None,
+):
+    if steps < 2:
+        raise ValueError("Need at least 2 steps (steps=%d)" % steps)
+    fields = tf.convert_to_tensor(fields, tf.float32)
+    valid = tf.cast(valid, tf.float32)
+    if prior is None:
+        prior = model.specification["beta"]
+    n_fields = fields.shape[0]
+
+    # Starting points - the encoding of the observed part, then random
+    observed = tf.where(valid > 0, fields, 0.0)
+    starts = []
+    for first in range(0, n_fields, batch_size):
+        starts.append(model.encode(observed[first : first + batch_size])[0])
+    starts = tf.concat(starts, axis=0)
+    if model.generate(starts[:1]).shape[1:] != fields.shape[1:]:
+        raise ValueError(
+            "Generated fields %s do not match the fields %s (patch-trained model?)"
+            % (model.generate(starts[:1]).shape[1:], fields.shape[1:])
+        )
+    latent_shape = starts.shape[1:]
+    rng = tf.random.Generator.from_seed(seed) if seed is not None else tf.random
+    z0 = tf.concat(
+        [
+            starts[:, None],
+            rng.normal([n_fields, n_starts - 1] + list(latent_shape)),
+        ],
+        axis=1,
+    )  # [field, start, ...latent]
+
+    # Every field x start, in chunks
+    z0 = tf.reshape(z0, [n_fields * n_starts] + list(latent_shape))
+    index = np.repeat(np.arange(n_fields), n_starts)
+    fit = tf.function(fit_latents)
+    results = {"z": [], "misfit": [], "loss": [], "history": []}
+    for first in range(0, n_fields * n_starts, batch_size):
+        chunk = index[first : first + batch_size]
+        z, misfit, loss, history = fit(
+            model,
+            z0[first : first + batch_size],
+            tf.gather(fields, chunk),
+            tf.gather(valid, chunk),
+            steps,
+            learning_rate,
+            prior,
+        )
+        results["z"].append(z.numpy())
+        results["misfit"].append(misfit.numpy())
+        results["loss"].append(loss.numpy())
+        results["history"].append(history.numpy().T)
+    z = np.concatenate(results["z"]).reshape([n_fields, n_starts] + list(latent_shape))
+    misfit = np.concatenate(results["misfit"]).reshape(n_fields, n_starts)
+    loss = np.concatenate(results["loss"]).reshape(n_fields, n_starts)
+    history = np.concatenate(results["history"]).reshape(n_fields, n_starts, steps)
+
+    # Keep the best start for each field
+    best = np.argmin(loss, axis=1)
+    latent = z[np.arange(n_fields), best]
+    history = history[np.arange(n_fields), best]
+    generated = []
+    for first in range(0, n_fields, batch_size):
+        generated.append(model.generate(latent[first : first + batch_size]).numpy())
+    generated = np.concatenate(generated)
+    tail = min(max(1, steps // 10), steps - 1)
+    converged = (history[:, -tail - 1] - history[:, -1]) <= tolerance * np.abs(
+        history[:, -1]
+    )
+    filled = np.where(valid.numpy() > 0, fields.numpy(), generated)
+    return (
+        filled,
+        {
+            "latent": latent,
+            "generated": generated,
+            "misfit": misfit[np.arange(n_fields), best],
+            "start": best,
+            "spread": np.std(misfit, axis=1),
+            "converged": converged,
+            "history": history,
+        },
+    )
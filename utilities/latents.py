@@ -0,0 +1,119 @@
+# Store of encoded months - the latent space means and log variances
+#  (from DCVAE.encode) for every month and ensemble member of an archive.
+
+# Most analyses only need the latent space, which is tiny compared with the
+#  fields (for the all_convolutional model, 12x23x20 for a 721x1440 field),
+#  so encoding the archive once, and reading the store, is much faster than
+#  re-running the encoder on the fields every time.
+# A store is a directory with two .npy arrays - mean and logvar, each
+#  [entry, ...latent shape] - read with memory-mapping, and a JSON index
+#  giving the date ('YYYY-MM'), ensemble member, and input file of each entry.
+# New entries go on the end, so positions of existing entries don't change
+#  (except where a month is replaced).
+
+import os
+import json
+import numpy as np
+
+
+# File names for the arrays and the index
+def array_file_name(dir_name, name):
+    return "%s/%s.npy" % (dir_name, name)
+
+
+def index_file_name(dir_name):
+    return "%s/index.json" % dir_name
+
+
+# Load the index of a store
+def load_index(dir_name):
+    with open(index_file_name(dir_name), "r") as f:
+        return json.load(f)
+
+
+# Read a store - returns mean, logvar (memory-mapped arrays), and the index
+def read_latents(dir_name):
+    return (
+        np.load(array_file_name(dir_name, "mean"), mmap_mode="r"),
+        np.load(array_file_name(dir_name, "logvar"), mmap_mode="r"),
+        load_index(dir_name),
+    )
+
+
+# Positions of the entries for a date ('YYYY-MM') - and a member, if given
+def find_entries(index, date, member=None):
+    return [
+        i
+        for i, (d, m) in enumerate(zip(index["dates"], index["members"]))
+        if d == date and (member is None or m == member)
+    ]
+
+
+# Write a complete store (replacing any existing one)
+# Written to temporary files, then renamed, so readers never see a partly
+#  written store.
+def write_store(dir_name, mean, logvar, dates, members, files, attributes=None):
+    if not os.path.isdir(dir_name):
+        os.makedirs(dir_name)
+    index = dict(attributes or {})
+    index.update(
+        {
+            "dates": list(dates),
+            "members": [int(m) for m in members],
+            "files": list(files),
+            "shape": list(mean.shape[1:]),
+        }
+    )
+    for name, array in (("mean", mean), ("logvar", logvar)):
+        with open(array_file_name(dir_name, name) + ".tmp", "wb") as f:
+            np.save(f, np.asarray(array, dtype=np.float32))
+    with open(index_file_name(dir_name) + ".tmp", "w") as f:
+        json.dump(index, f)
+    for name in ("mean", "logvar"):
+        os.replace(
+            array_file_name(dir_name, name) + ".tmp", array_file_name(dir_name, name)
+        )
+    os.replace(index_file_name(dir_name) + ".tmp", index_file_name(dir_name))
+
+
+# Add entries to a store (making it, if there isn't one)
+# Entries for a date and member already in the store are replaced, in place.
+#  Others go on the end.
+def append_entries(dir_name, mean, logvar, dates, members, files, attributes=None):
+    if not os.path.isfile(index_file_name(dir_name)):
+        write_store(dir_name, mean, logvar, dates, members, files, attributes)
+        return
+    old_mean, old_logvar, index = read_latents(dir_name)
+    if list(mean.shape[1:]) != index["shape"]:
+        raise ValueError(
+            "Latent shape %s does not match the store %s"
+            % (list(mean.shape[1:]), index["shape"])
+        )
+    old_mean = np.array(old_mean)
+    old_logvar = np.array(old_logvar)
+    position = {
+        (d, m): i for i, (d, m) in enumerate(zip(index["dates"], index["members"]))
+    }
+    new = []
+    for i, (date, member) in enumerate(zip(dates, members)):
+        if (date, int(member)) in position:
+            old_mean[position[(date, int(member))]] = mean[i]
+            old_logvar[position[(date, int(member))]] = logvar[i]
+            index["files"][position[(date, int(member))]] = files[i]
+        else:
+            new.append(i)
+    stored = {
+        key: value
+        for key, value in index.items()
+        if key not in ("dates", "members", "files", "shape")
+    }
+    stored.update(attributes or {})
+    write_store(
+        dir_name,
+        np.concatenate([old_mean, np.asarray(mean)[new]]),
+        np.concatenate([old_logvar, np.asarray(logvar)[new]]),
+        index["dates"] + [dates[i] for i in new],
+        index["members"] + [int(members[i]) for i in new],
+        index["files"] + [files[i] for i in new],
+        stored,
+    )
@@ -0,0 +1,115 @@
+# Dependency manifest for generated data files
+
+# Each generated file (raw tensor, normalization fit, normalized tensor) gets a
+#  small record of what it was made from: its input files (size, modification
+#  time, and content hash) and a version string for the method and parameters
+#  that made it.
+# An output is up to date if it exists, has a record, the version matches, and
+#  none of its inputs have changed. Inputs are checked by size and modification
+#  time first, and only if those differ is the content hash recalculated - so a
+#  re-downloaded but unchanged file does not force a rebuild.
+# Records are kept in their own directory tree ($SCRATCH/MLP/manifest), one
+#  small JSON file for each output, so parallel jobs never write the same file.
+
+import os
+import json
+import hashlib
+
+
+# Where the record for an output file is kept
+def record_file_name(output):
+    output = os.path.abspath(output)
+    scratch = os.path.abspath(os.getenv("SCRATCH"))
+    if output.startswith(scratch + "/"):
+        output = os.path.relpath(output, scratch)
+    return "%s/MLP/manifest/%s.json" % (scratch, output.lstrip("/"))
+
+
+# All the files making up an input or output
+#  (usually just the one, but a chunked store is a directory of files)
+def _component_files(fn):
+    if os.path.isdir(fn):
+        return ["%s/%s" % (fn, x) for x in sorted(os.listdir(fn))]
+    return [fn]
+
+
+# Size and modification time of a file (or directory of files)
+def file_stat(fn):
+    size = 0
+    mtime = 0.0
+    for cf in _component_files(fn):
+        st = os.stat(cf)
+        size += st.st_size
+        mtime = max(mtime, st.st_mtime)
+    return (size, mtime)
+
+
+# Content hash of a file (or directory of files)
+def file_hash(fn):
+    sha = hashlib.sha256()
+    for cf in _component_files(fn):
+        with open(cf, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+# Load the record for an output (None if there isn't one)
+def load_record(output):
+    try:
+        with open(record_file_name(output), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+# Record the inputs and version used to make an output
+# Call this after the output has been successfully written
+def record(output, inputs, version):
+    entry = {"version": str(version), "inputs": {}}
+    for fn in inputs:
+        size, mtime = file_stat(fn)
+        entry["inputs"][os.path.abspath(fn)] = {
+            "size": size,
+            "mtime": mtime,
+            "sha256": file_hash(fn),
+        }
+    _save_record(output, entry)
+
+
+def _save_record(output, entry):
+    rfn = record_file_name(output)
+    if not os.path.isdir(os.path.dirname(rfn)):
+        os.makedirs(os.path.dirname(rfn), exist_ok=True)
+    with open("%s.tmp" % rfn, "w") as f:
+        json.dump(entry, f, indent=1)
+    os.replace("%s.tmp" % rfn, rfn)
+
+
+# Is an output up to date with its inputs?
+# If an input has been touched but not changed, its new modification time
+#  is saved, so it won't need to be hashed again next time.
+def is_current(output, inputs, version):
+    if not os.path.exists(output):
+        return False
+    entry = load_record(output)
+    if entry is None or entry["version"] != str(version):
+        return False
+    inputs = [os.path.abspath(fn) for fn in inputs]
+    if set(inputs) != set(entry["inputs"].keys()):
+        return False  # Inputs added or removed
+    touched = False
+    for fn in inputs:
+        if not os.path.exists(fn):
+            return False
+        size, mtime = file_stat(fn)
+        old = entry["inputs"][fn]
+        if size == old["size"] and mtime == old["mtime"]:
+            continue
+        if size != old["size"] or file_hash(fn) != old["sha256"]:
+            return False
+        old["mtime"] = mtime
+        touched = True
+    if touched:
+        _save_record(output, entry)
+    return True
@@ -0,0 +1,131 @@
+# Time-major ('pencil') store for per-gridpoint access
+
+# The monthly tensors are good for reading a whole field at one time, but
+#  very slow for reading all the times at a few points - every month's file
+#  has to be read in full.
+# This store is the same data transposed: the grid is divided into blocks
+#  (block_size x block_size grid-points) and each block is one file holding
+#  all the months, with time varying fastest - (lat, lon, time). So the whole
+#  time-series for a point is contiguous, and all the months for a set of
+#  points, or a small region, come back in a few reads.
+# Block files are .npy arrays, read with memory-mapping, so only the parts
+#  needed are read from disc.
+
+import os
+import json
+import numpy as np
+
+block_size = 32  # Grid-points along each side of a block
+
+
+# File names for the block files and the index
+def block_file_name(dir_name, lat_block, lon_block):
+    return "%s/block_%02d_%02d.npy" % (dir_name, lat_block, lon_block)
+
+
+def index_file_name(dir_name):
+    return "%s/index.json" % dir_name
+
+
+# Number of blocks along each axis
+def block_counts(shape=(721, 1440), size=block_size):
+    return ((shape[0] + size - 1) // size, (shape[1] + size - 1) // size)
+
+
+# Make an empty store, for a list of dates ('YYYY-MM' strings)
+def create_store(dir_name, dates, shape=(721, 1440), size=block_size):
+    if not os.path.isdir(dir_name):
+        os.makedirs(dir_name)
+    n_lat, n_lon = block_counts(shape, size)
+    for lat_block in range(n_lat):
+        rows = min(size, shape[0] - lat_block * size)
+        for lon_block in range(n_lon):
+            cols = min(size, shape[1] - lon_block * size)
+            block = np.lib.format.open_memmap(
+                block_file_name(dir_name, lat_block, lon_block),
+                mode="w+",
+                dtype=np.float32,
+                shape=(rows, cols, len(dates)),
+            )
+            block[:] = np.nan
+            del block
+    with open(index_file_name(dir_name), "w") as f:
+        json.dump({"dates": list(dates), "shape": list(shape), "block_size": size}, f)
+
+
+# Load the index of a store
+def load_index(dir_name):
+    with open(index_file_name(dir_name), "r") as f:
+        return json.load(f)
+
+
+# Write a set of consecutive months (fields is [time, lat, lon]) into a store,
+#  starting at time index 'first'.
+# Write as many months at once as memory allows - each block file is opened
+#  once for each call.
+def write_months(dir_name, first, fields):
+    index = load_index(dir_name)
+    size = index["block_size"]
+    n_lat, n_lon = block_counts(index["shape"], size)
+    fields = np.asarray(fields, dtype=np.float32)
+    for lat_block in range(n_lat):
+        for lon_block in range(n_lon):
+            block = np.load(
+                block_file_name(dir_name, lat_block, lon_block), mmap_mode="r+"
+            )
+            block[:, :, first : first + fields.shape[0]] = np.transpose(
+                fields[
+                    :,
+                    lat_block * size : (lat_block + 1) * size,
+                    lon_block * size : (lon_block + 1) * size,
+                ],
+                (1, 2, 0),
+            )
+            block.flush()
+            del block
+
+
+# Get all the months for a set of grid-points (lists of lat and lon indices)
+# Returns an array [point, time]
+def read_points(dir_name, lat_i, lon_i):
+    index = load_index(dir_name)
+    size = index["block_size"]
+    result = np.empty((len(lat_i), len(index["dates"])), dtype=np.float32)
+    blocks = {}  # Points in each block - so each block is opened once
+    for p, (i, j) in enumerate(zip(lat_i, lon_i)):
+        blocks.setdefault((i // size, j // size), []).append(p)
+    for (lat_block, lon_block), points in blocks.items():
+        block = np.load(block_file_name(dir_name, lat_block, lon_block), mmap_mode="r")
+        for p in points:
+            result[p] = block[lat_i[p] % size, lon_i[p] % size, :]
+        del block
+    return result
+
+
+# Get all the months for a region (rows first_row:last_row,
+#  columns first_col:last_col)
+# Returns an array [lat, lon, time]
+def read_region(dir_name, first_row, last_row, first_col, last_col):
+    index = load_index(dir_name)
+    size = index["block_size"]
+    result = np.empty(
+        (last_row - first_row, last_col - first_col, len(index["dates"])),
+        dtype=np.float32,
+    )
+    for lat_block in range(first_row // size, (last_row - 1) // size + 1):
+        r0 = max(first_row, lat_block * size)
+        r1 = min(last_row, (lat_block + 1) * size)
+        for lon_block in range(first_col // size, (last_col - 1) // size + 1):
+            c0 = max(first_col, lon_block * size)
+            c1 = min(last_col, (lon_block + 1) * size)
+            block = np.load(
+                block_file_name(dir_name, lat_block, lon_block), mmap_mode="r"
+            )
+            result[r0 - first_row : r1 - first_row, c0 - first_col : c1 - first_col] = (
+                block[
+                    r0 - lat_block * size : r1 - lat_block * size,
+                    c0 - lon_block * size : c1 - lon_block * size,
+                ]
+            )
+            del block
+    return result
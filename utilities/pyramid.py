@@ -0,0 +1,95 @@
+# Lower resolution versions of the standard grid - for fast prototyping
+
+# The standard grid is 0.25 degrees (721x1440). Lower resolution levels are
+#  0.5, 1, and 2 degrees: each keeps every n'th standard grid point, as the
+#  centre of an n x n cell of standard grid points, and the value is the
+#  average over that cell (edge rows and columns are shared with the next cell,
+#  so get half weight).
+# Averaging is mask-aware: missing standard points are left out of the
+#  average, and a low-resolution point is missing if less than half of its
+#  cell is valid.
+# Longitude wraps round, so cells at the date-line use points from both ends.
+
+import numpy as np
+import tensorflow as tf
+
+base_resolution = 0.25
+resolutions = (0.25, 0.5, 1.0, 2.0)
+
+
+# Grid shape (lat, lon) at a resolution
+def grid_shape(resolution=base_resolution):
+    return (int(round(180 / resolution)) + 1, int(round(360 / resolution)))
+
+
+# Number of standard grid points along each side of a cell
+def grid_factor(resolution=base_resolution):
+    if resolution not in resolutions:
+        raise ValueError("Unsupported resolution %s" % resolution)
+    return int(round(resolution / base_resolution))
+
+
+# Name of the dataset for a resolution level
+#  e.g. 'ERA5_tf_MM' -> 'ERA5_tf_MM_1deg'
+def level_name(dataset, resolution=base_resolution):
+    if grid_factor(resolution) == 1:
+        return dataset
+    return "%s_%gdeg" % (dataset, resolution)
+
+
+# Reduce a field to a lower resolution
+# field and valid (1=valid, 0=missing) are [lat, lon, channels] float32.
+# Returns the low-resolution field and validity - missing points are 0.0,
+#  as in the normalized tensors.
+# All TensorFlow ops, so can be used in a tf.data map
+def downsample(field, valid, resolution):
+    factor = grid_factor(resolution)
+    if factor == 1:
+        return (field, valid)
+    half = factor // 2
+    weights = np.ones(factor + 1)
+    weights[0] = weights[-1] = 0.5
+    kernel = tf.constant(np.outer(weights, weights)[:, :, None, None], tf.float32)
+
+    # Channels as batch - the same kernel is used for each
+    def cell_sums(x):
+        x = tf.expand_dims(tf.transpose(x, [2, 0, 1]), -1)
+        x = tf.concat([x[:, :, -half:], x, x[:, :, :half]], axis=2)  # Wrap lon
+        x = tf.pad(x, [[0, 0], [half, half], [0, 0], [0, 0]])  # Poles
+        x = tf.nn.conv2d(x, kernel, strides=factor, padding="VALID")
+        return tf.transpose(tf.squeeze(x, -1), [1, 2, 0])
+
+    total = cell_sums(tf.ones_like(valid))  # Less than a full cell at the poles
+    count = cell_sums(valid)
+    sums = cell_sums(tf.where(valid > 0, field, 0.0) * valid)
+    cvalid = tf.where(count >= total * 0.5, 1.0, 0.0)
+    return (tf.where(cvalid > 0, sums / tf.maximum(count, 1.0e-6), 0.0), cvalid)
+
+
+# Rows and columns of the grid in a region (min_lat, max_lat, min_lon, max_lon)
+# Returns first_row, last_row (python ints, last_row exclusive) and an array of
+#  column indices - regions crossing the date-line (min_lon > max_lon) wrap
+#  round.
+def region_indices(region, resolution=base_resolution):
+    n_lon = grid_shape(resolution)[1]
+    first_row = int(np.ceil((region[0] + 90) / resolution))
+    last_row = int(np.floor((region[1] + 90) / resolution)) + 1
+    first_col = int(np.ceil((region[2] + 180) / resolution))
+    last_col = int(np.floor((region[3] + 180) / resolution)) + 1
+    if last_col <= first_col:  # Crosses the date-line
+        last_col += n_lon
+    last_col = min(last_col, first_col + n_lon)  # No more than once round
+    return (first_row, last_row, np.arange(first_col, last_col) % n_lon)
+
+
+# Shape (lat, lon) of a region
+def region_shape(region, resolution=base_resolution):
+    first_row, last_row, columns = region_indices(region, resolution)
+    return (last_row - first_row, len(columns))
+
+
+# Cut a region out of a field [lat, lon, ...]
+# All TensorFlow ops, so can be used in a tf.data map
+def crop_region(field, region, resolution=base_resolution):
+    first_row, last_row, columns = region_indices(region, resolution)
+    return tf.gather(field[first_row:last_row], columns, axis=1)
@@ -0,0 +1,104 @@
+# Quantized (int8) generator - for bulk decoding of latent vectors on CPU
+
+# Decoding many latent samples (ensembles, or decades of months) is
+#  dominated by the generator's full resolution (transpose) convolutions.
+#  quantize_generator converts DCVAE.generate to a TensorFlow Lite model with
+#  int8 weights and activations (post-training quantization). The scale of
+#  each activation is calibrated by running the generator on a sample of
+#  representative latent vectors - encodings of training fields.
+# The converted generator takes a fixed batch size (fixed shapes run faster
+#  in TensorFlow Lite). TensorFlow Lite can't quantize the ELU activations,
+#  so those are computed in float32 (with a conversion either side).
+# QuantizedModel runs the converted generator with the same generate method
+#  as DCVAE (float32 in and out - the quantization is internal), and passes
+#  encode to the original model, if it has one. The quantized output is an
+#  approximation - check its skill (see quantize_generator.py in ML_models)
+#  before using it.
+
+import numpy as np
+import tensorflow as tf
+
+
+# Convert model.generate to an int8 TensorFlow Lite model
+# calibration - latent vectors [n, ...latent shape] (numpy), used to set the
+#  activation ranges
+# batch_size - the batch size of the converted model
+# Returns the converted model (bytes), and writes it to file_name, if given.
+def quantize_generator(model, calibration, batch_size=32, file_name=None):
+    calibration = np.asarray(calibration, dtype=np.float32)
+
+    @tf.function(
+        input_signature=[
+            tf.TensorSpec((batch_size,) + calibration.shape[1:], tf.float32)
+        ]
+    )
+    def generate(z):
+        return model.generate(z, training=False)
+
+    # Calibration batches - all the vectors, repeated to fill the last batch
+    def representative():
+        for first in range(0, calibration.shape[0], batch_size):
+            batch = np.resize(
+                calibration[first:], (batch_size,) + calibration.shape[1:]
+            )
+            yield [batch]
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions(
+        [generate.get_concrete_function()], model
+    )
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converted = converter.convert()
+    if file_name is not None:
+        with open(file_name, "wb") as f:
+            f.write(converted)
+    return converted
+
+
+# A quantized generator, with the DCVAE generate method
+# converted - the output of quantize_generator, or a file containing it
+# model - the original model (optional) - for encode, and so call
+class QuantizedModel:
+    def __init__(self, converted, model=None, num_threads=None):
+        if isinstance(converted, str):
+            with open(converted, "rb") as f:
+                converted = f.read()
+        self.interpreter = tf.lite.Interpreter(
+            model_content=converted, num_threads=num_threads
+        )
+        self.interpreter.allocate_tensors()
+        input = self.interpreter.get_input_details()[0]
+        self.input = input["index"]
+        self.batch_size = input["shape"][0]
+        self.output = self.interpreter.get_output_details()[0]["index"]
+        self.model = model
+        if model is not None:
+            self.specification = model.specification
+
+    # Any number of latent vectors - run in batches of the converted size
+    #  (the last one padded out)
+    def generate(self, z, training=False):
+        z = np.asarray(z, dtype=np.float32)
+        generated = []
+        for first in range(0, z.shape[0], self.batch_size):
+            batch = z[first : first + self.batch_size]
+            size = batch.shape[0]
+            if size < self.batch_size:
+                batch = np.concatenate(
+                    (batch, np.zeros((self.batch_size - size,) + z.shape[1:], z.dtype))
+                )
+            self.interpreter.set_tensor(self.input, batch)
+            self.interpreter.invoke()
+            generated.append(self.interpreter.get_tensor(self.output)[:size])
+        return tf.constant(np.concatenate(generated))
+
+    def encode(self, x, training=False):
+        if self.model is None:
+            raise ValueError("No original model - can only generate")
+        return self.model.encode(x, training=False)
+
+    def call(self, x, training=False):
+        mean, logvar = self.encode(x[1])
+        z = tf.random.normal(tf.shape(mean)) * tf.exp(logvar * 0.5) + mean
+        return self.generate(z)
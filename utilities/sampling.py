@@ -0,0 +1,191 @@
+# Large ensembles of generated fields - for uncertainty estimates
+
+# DCVAE.reparameterize draws one sample from the latent distribution of each
+#  encoded field. These functions draw many (n_samples) for a field, and
+#  decode them in batches, so only one batch of generated fields is in memory
+#  at a time. The ensemble is summarised - mean, spread, and quantiles at
+#  each grid-point, accumulated batch by batch - and the fields can also be
+#  written to disk as they are made (a .npy array, [sample, lat, lon,
+#  channels]).
+# The mean and spread are exact. Quantiles come from a histogram at each
+#  point, interpolated within the bin, so they are good to about the bin
+#  width. The bins at each point span the mean +- width standard deviations
+#  of the first min_members members (values outside count in the end bins),
+#  or a fixed value_range if one is given.
+
+import os
+import numpy as np
+import tensorflow as tf
+
+
+# Batches of generated fields, from n_samples draws from the latent
+#  distribution N(mean, exp(logvar)) of one field (mean and logvar are the
+#  encoder output for that field, without the batch dimension).
+# A generator - yields numpy arrays [batch, lat, lon, channels].
+def generate_samples(model, mean, logvar, n_samples, batch_size=32, seed=None):
+    mean = tf.convert_to_tensor(mean, tf.float32)[None]
+    logvar = tf.convert_to_tensor(logvar, tf.float32)[None]
+    rng = tf.random.Generator.from_seed(seed) if seed is not None else tf.random
+    for first in range(0, n_samples, batch_size):
+        size = min(batch_size, n_samples - first)
+        epsilon = rng.normal([size] + list(mean.shape[1:]))
+        yield model.generate(
+            epsilon * tf.exp(logvar * 0.5) + mean, training=False
+        ).numpy()
+
+
+# Running statistics of an ensemble at each point of a field, added to one
+#  batch of members at a time
+# The histogram needs n_bins x 4 bytes for each point of the field (400Mb for
+#  a full resolution field, with 100 bins).
+# Without a value_range, the bins are set from the first min_members members
+#  - they are held until there are that many (or a quantile is wanted), and
+#  then added to the histogram.
+class EnsembleStatistics:
+    def __init__(self, shape, value_range=None, n_bins=100, width=6.0, min_members=32):
+        self.shape = tuple(shape)
+        self.value_range = value_range
+        self.n_bins = n_bins
+        self.width = width
+        self.min_members = min_members
+        self.pending = []  # Members held until the bins are set
+        self.count = 0
+        self.mean = np.zeros(self.shape)
+        self.m2 = np.zeros(self.shape)  # Sum of squared differences from mean
+        self.histogram = np.zeros((n_bins, int(np.prod(self.shape))), np.uint32)
+        self.low = None  # Bottom of the bins at each point
+        self.bin_width = None
+
+    # Add a batch of members [batch, ...shape]
+    def add(self, batch):
+        batch = np.asarray(batch, dtype=np.float64)
+        # Mean and variance - combine the batch with the running values
+        #  (Chan et al. parallel algorithm)
+        n = batch.shape[0]
+        batch_mean = batch.mean(axis=0)
+        delta = batch_mean - self.mean
+        total = self.count + n
+        self.mean += delta * n / total
+        self.m2 += ((batch - batch_mean) ** 2).sum(axis=0) + delta**2 * (
+            self.count * n / total
+        )
+        self.count = total
+        if self.low is None:
+            self.pending.append(batch.reshape(n, -1))
+            if self.value_range is not None or self.count >= self.min_members:
+                self.fix_bins()
+        else:
+            self.add_to_histogram(batch.reshape(n, -1))
+
+    # Histogram - each member adds one count at every point
+    def add_to_histogram(self, values):
+        bins = self.bin_index(values)
+        points = np.arange(bins.shape[1])
+        for member in bins:
+            self.histogram[member, points] += 1
+
+    # Set the bins from the members held, and add them to the histogram
+    def fix_bins(self):
+        values = np.concatenate(self.pending)
+        self.pending = []
+        self.set_bins(values)
+        self.add_to_histogram(values)
+
+    def set_bins(self, values):
+        if self.value_range is not None:
+            low, high = self.value_range
+            self.low = np.full(values.shape[1], float(low))
+            self.bin_width = np.full(values.shape[1], (high - low) / self.n_bins)
+        else:
+            half = self.width * np.maximum(values.std(axis=0), 1.0e-6)
+            self.low = values.mean(axis=0) - half
+            self.bin_width = 2 * half / self.n_bins
+
+    def bin_index(self, values):
+        index = np.floor((values - self.low) / self.bin_width)
+        return np.clip(index, 0, self.n_bins - 1).astype(np.int64)
+
+    # Standard deviation of the members
+    def spread(self):
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+    # Quantile (0-1) at each point - from the histogram, interpolated
+    #  linearly within the bin it falls in
+    def quantile(self, q, block=65536):
+        if self.low is None:
+            self.fix_bins()
+        target = q * self.count
+        result = np.empty(self.histogram.shape[1])
+        for start in range(0, self.histogram.shape[1], block):
+            counts = self.histogram[:, start : start + block].astype(np.int64)
+            cumulative = np.cumsum(counts, axis=0)
+            # First bin where the cumulative count reaches the target
+            found = np.argmax(cumulative >= target, axis=0)
+            columns = np.arange(counts.shape[1])
+            below = cumulative[found, columns] - counts[found, columns]
+            fraction = (target - below) / np.maximum(counts[found, columns], 1)
+            result[start : start + block] = (
+                self.low[start : start + block]
+                + (found + fraction) * self.bin_width[start : start + block]
+            )
+        return result.reshape(self.shape)
+
+
+# Name of the statistic for a quantile (0-1) - 'q05' for 0.05, 'q99p5' for
+#  0.995 (exact, so different quantiles never share a name)
+def quantile_name(q):
+    if not 0.0 <= q <= 1.0:
+        raise ValueError("Quantile %g is not in 0-1" % q)
+    percent = "%.10g" % (q * 100)
+    whole, _, fraction = percent.partition(".")
+    return "q%02d" % int(whole) + ("p%s" % fraction if fraction else "")
+
+
+# Make an ensemble of n_samples generated fields from one encoded field, and
+#  return its statistics - without holding the fields in memory.
+# If file_name is given, the fields are also written to it (.npy, as they
+#  are made).
+# Returns a dict of numpy arrays [lat, lon, channels]: 'mean', 'spread', and
+#  'q05', 'q50' etc. for each of the quantiles (see quantile_name).
+# value_range, n_bins - the quantile histogram bins (see EnsembleStatistics)
+def sample_ensemble(
+    model,
+    mean,
+    logvar,
+    n_samples,
+    file_name=None,
+    quantiles=(0.05, 0.5, 0.95),
+    batch_size=32,
+    seed=None,
+    value_range=None,
+    n_bins=100,
+):
+    if n_samples < 1:
+        raise ValueError("Need at least one sample (n_samples=%d)" % n_samples)
+    names = [quantile_name(q) for q in quantiles]
+    if len(set(names)) != len(names):
+        raise ValueError("Repeated quantiles: %s" % (quantiles,))
+    statistics = None
+    first = 0
+    for batch in generate_samples(model, mean, logvar, n_samples, batch_size, seed):
+        if statistics is None:
+            statistics = EnsembleStatistics(batch.shape[1:], value_range, n_bins)
+            if file_name is not None:
+                fields = np.lib.format.open_memmap(
+                    file_name + ".tmp",
+                    mode="w+",
+                    dtype=np.float32,
+                    shape=(n_samples,) + batch.shape[1:],
+                )
+        statistics.add(batch)
+        if file_name is not None:
+            fields[first : first + batch.shape[0]] = batch
+            first += batch.shape[0]
+    if file_name is not None:
+        fields.flush()
+        del fields
+        os.replace(file_name + ".tmp", file_name)
+    result = {"mean": statistics.mean, "spread": statistics.spread()}
+    for name, q in zip(names, quantiles):
+        result[name] = statistics.quantile(q)
+    return result